@@ -8,19 +8,41 @@ import os
 import traceback
 import random
 import re
-import docx  
-import fitz  
 import time
 import json
+import click
+import hashlib
+import uuid
+import sqlite3
 from datetime import datetime, date, timedelta, timezone
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, abort, jsonify
+from collections import Counter
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, send_file, abort, jsonify, g, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
+from flask_migrate import Migrate, upgrade as migrate_upgrade
 from werkzeug.utils import secure_filename
 from sqlalchemy import or_, and_, desc
+from sqlalchemy import inspect as sql_inspect
+from sqlalchemy import event, case, tuple_
+from sqlalchemy.orm import attribute_keyed_dict, with_parent, object_session
+from sqlalchemy.engine import Engine
 from sqlalchemy import func as sql_func
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.security import generate_password_hash
+from utils import search_index, db_config, sharding, extraction_queue, extractors, simhash, vault_archive, compressed_text, keyword_engine, tokenizer
+from utils.extraction_queue import ExtractionQueue
+from utils.sharding import ShardRouter
+from utils.typeahead import PrefixIndex
+from utils.keyword_matcher import KeywordAutomaton
+from utils.vietnamese_text import normalize_vietnamese, normalize_many
+from utils.tokenizer import STOP_WORDS
+from utils.pagination import keyset_paginate, keyset_page_query, decode_cursor
+from utils.query_plans import explain_query_plan, full_table_scans
+from utils.sampling import random_sample, probe_query
+from utils.blob_store import BlobStore
+from utils.bulk_import import ImportCheckpoint, ImportProgress, find_files, prepare_file
 
 # =============================================================================
 # SECTION 1: FLASK APP INITIALIZATION & CONFIGURATION
@@ -30,23 +52,79 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 
 # --- Basic Configs ---
 app.config['UPLOAD_FOLDER'] = os.path.join(basedir, 'uploads/')
+# File upload được lưu theo SHA-256 nội dung trong thư mục này (uploads/blobs/ab/cd/<sha256>)
+app.config['BLOB_STORE_DIR'] = os.environ.get('BLOB_STORE_DIR', os.path.join(app.config['UPLOAD_FOLDER'], 'blobs'))
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'a_default_secret_key_for_development')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'studyvault.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# --- Database Configs ---
+# DATABASE_URL: mặc định là file SQLite trong thư mục dự án; PostgreSQL dùng postgresql://... (cần cài psycopg2-binary)
+# DB_PROFILE: 'development' (mặc định) hoặc 'production' (SQLite WAL + mmap + busy_timeout, pool lớn hơn, pre-ping cho PostgreSQL)
+app.config['SQLALCHEMY_DATABASE_URI'] = db_config.normalize_database_url(os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'studyvault.db')))
+app.config['DB_PROFILE'] = os.environ.get('DB_PROFILE', 'development')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = db_config.engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config['DB_PROFILE'], os.environ)
+app.config['SQLITE_PRAGMAS'] = db_config.sqlite_pragmas(app.config['DB_PROFILE'], os.environ)
+
+# --- Vault Sharding Configs ---
+# VAULT_SHARDING: 'off' (mặc định, mọi dữ liệu ở database chính), 'per_user' (mỗi người dùng một file SQLite)
+# hoặc 'hashed' (gom người dùng vào VAULT_SHARD_BUCKETS file theo băm id)
+app.config['VAULT_SHARDING'] = os.environ.get('VAULT_SHARDING', 'off')
+app.config['VAULT_SHARD_BUCKETS'] = int(os.environ.get('VAULT_SHARD_BUCKETS', 16))
+app.config['VAULT_SHARD_DIR'] = os.environ.get('VAULT_SHARD_DIR', os.path.join(basedir, 'vault_shards'))
+app.config['MIGRATIONS_DIR'] = os.path.join(basedir, 'migrations')
+
+# --- Batch Upload Configs ---
+app.config['BATCH_UPLOAD_MAX_FILES'] = int(os.environ.get('BATCH_UPLOAD_MAX_FILES', 500))
+app.config['UPLOAD_SAVE_WORKERS'] = int(os.environ.get('UPLOAD_SAVE_WORKERS', 4))
+app.config['UPLOAD_COMMIT_BATCH_SIZE'] = int(os.environ.get('UPLOAD_COMMIT_BATCH_SIZE', 50))
+
 # --- File Type Configs ---
 app.config['ALLOWED_EXTENSIONS'] = {'txt', 'pdf', 'docx'}
 app.config['ALLOWED_IMAGE_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 app.config['ALLOWED_VIDEO_EXTENSIONS'] = {'mp4', 'mov', 'avi', 'mkv'}
 
+# --- Background Extraction Configs ---
+# EXTRACTION_WORKERS: số luồng trích xuất văn bản chạy nền (0 = trích xuất ngay trong luồng gọi)
+app.config['EXTRACTION_WORKERS'] = int(os.environ.get('EXTRACTION_WORKERS', 2))
+# Mỗi file được trích xuất trong một tiến trình con bị giới hạn thời gian (giây) và bộ nhớ (MB)
+app.config['EXTRACTION_TIMEOUT_SECONDS'] = int(os.environ.get('EXTRACTION_TIMEOUT_SECONDS', 60))
+app.config['EXTRACTION_MEMORY_LIMIT_MB'] = int(os.environ.get('EXTRACTION_MEMORY_LIMIT_MB', 1024))
+
 # --- App Initialization ---
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+vault_shards = ShardRouter(
+    app.config['VAULT_SHARD_DIR'], app.config['VAULT_SHARDING'], app.config['VAULT_SHARD_BUCKETS'],
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite') else {}
+)
+
+class VaultSession(FlaskSQLAlchemySession):
+    """Định tuyến các bảng thuộc vault (và SQL thuần không gắn model) tới shard của người dùng hiện tại."""
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        shard_key = sharding.current_shard_key()
+        if bind is None and shard_key and vault_shards.enabled:
+            table = getattr(sql_inspect(mapper), 'local_table', None) if mapper is not None else None
+            if mapper is None or (table is not None and vault_shards.routes_table(table.name)):
+                return get_shard_engine(shard_key)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': VaultSession})
+app.extensions['vault_shards'] = vault_shards
+
+@event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas_on_connect(dbapi_connection, connection_record):
+    db_config.apply_sqlite_pragmas(dbapi_connection, app.config['SQLITE_PRAGMAS'])
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        search_index.register_functions(dbapi_connection)
+def include_in_migrations(obj, name, type_, reflected, compare_to):
+    # Bảng FTS5 do utils.search_index quản lý, không để autogenerate đòi xóa chúng
+    return not (type_ == 'table' and search_index.is_managed_table(name))
+
+migrate = Migrate(app, db, include_object=include_in_migrations)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # --- Global Constants ---
 ITEMS_PER_PAGE = 10
-STOP_WORDS = set(["là", "và", "của", "có", "trong", "để", "một", "không", "được", "cho", "với", "tại","thì", "mà", "khi", "từ", "ra", "lên", "xuống", "vào", "qua", "đến", "đi", "lại","như", "ở", "đã", "sẽ", "đang", "rằng", "hay", "hơn", "rất", "này", "đó", "kia", "ấy","tôi", "bạn", "anh", "chị", "em", "ông", "bà", "nó", "chúng", "mình","the", "a", "an", "is", "are", "was", "were", "of", "in", "on", "at", "to", "for","with", "by", "from", "as", "and", "or", "but", "if", "then", "this", "that", "it","its", "i", "you", "he", "she", "we", "they", "my", "your", "his", "her", "our", "their"])
+FUZZY_SEARCH_LIMIT = 50
+TYPEAHEAD_LIMIT = 8
 
 # =============================================================================
 # SECTION 2: DATABASE MODELS
@@ -75,19 +153,44 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+DOCUMENT_TEXT_FIELDS = ('extracted_content', 'user_summary', 'custom_note')
+
+def document_text_property(field):
+    # Văn bản lớn nằm ở bảng document_text (nén), chỉ được đọc khi truy cập thuộc tính này
+    def getter(self):
+        text_row = self.texts.get(field)
+        return text_row.text if text_row is not None else None
+    def setter(self, value):
+        if (value or None) == getter(self):
+            return
+        if value:
+            self.texts[field] = DocumentText(field=field, data=compressed_text.compress(value), size=len(value))
+        else:
+            self.texts.pop(field, None)
+    return property(getter, setter)
+
+def store_document_text_chunks(doc, field, chunks):
+    """Ghi văn bản đọc theo khối (nối bằng xuống dòng) vào document_text mà không ghép thành một chuỗi. Returns: int: số từ."""
+    data, size, words = compressed_text.compress_chunks(chunks)
+    if data is None:
+        doc.texts.pop(field, None)
+    else:
+        doc.texts[field] = DocumentText(field=field, data=data, size=size)
+    return words
+
 class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(200), nullable=False)
     filepath = db.Column(db.String(300), nullable=False, unique=True)
     category = db.Column(db.String(100), nullable=True, default="Chưa phân loại")
     uploaded_date = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
-    last_viewed_date = db.Column(db.DateTime, nullable=True)
+    last_viewed_date = db.Column(db.DateTime, nullable=True, index=True)
     doc_type = db.Column(db.String(20), nullable=False, default='file')
     engagement_level = db.Column(db.String(50), nullable=True)
-    custom_note = db.Column(db.Text, nullable=True)
     deadline = db.Column(db.Date, nullable=True)
-    extracted_content = db.Column(db.Text, nullable=True)
-    user_summary = db.Column(db.Text, nullable=True)
+    extraction_status = db.Column(db.String(20), nullable=True, index=True)  # queued / running / done / failed; None nếu không cần trích xuất
+    extraction_error_code = db.Column(db.String(30), nullable=True)  # mã lỗi của utils.extractors khi failed
+    extraction_error = db.Column(db.String(500), nullable=True)
     ai_topic_label = db.Column(db.String(100), nullable=True)
     win_criteria_description = db.Column(db.Text, nullable=True)
     target_score = db.Column(db.Integer, nullable=True)
@@ -95,11 +198,107 @@ class Document(db.Model):
     keywords = db.Column(db.Text, nullable=True)
     context_event = db.Column(db.String(200), nullable=True)
     is_goal_related = db.Column(db.Boolean, default=False, nullable=False)
+    goal_score = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    match_terms = db.Column(db.Text, nullable=True)  # các âm tiết đã bỏ dấu (không trùng, cách nhau bởi dấu cách) của tên file, danh mục, từ khóa
+    goal_related_override = db.Column(db.Boolean, nullable=True)  # người dùng tự chọn Focus/Sandbox; None: theo mục tiêu
     filename_normalized = db.Column(db.String(200), nullable=True)
+    content_sha256 = db.Column(db.String(64), nullable=True, index=True)  # khóa của file trong kho theo nội dung
+    simhash = db.Column(db.BigInteger, nullable=True)  # dấu vân tay nội dung để phát hiện bản gần trùng
+    # Không khai báo khóa ngoại: thêm FK vào bảng document trên SQLite buộc tạo lại bảng (mất trigger FTS); được dọn khi xóa tài liệu
+    near_duplicate_of_id = db.Column(db.Integer, nullable=True, index=True)
+    near_duplicate_status = db.Column(db.String(20), nullable=True)  # suggested / linked / dismissed
+    # Thống kê tính sẵn từ nội dung trích xuất, để danh sách không phải đọc văn bản
+    word_count = db.Column(db.Integer, nullable=True)
+    page_count = db.Column(db.Integer, nullable=True)  # chỉ có với PDF
+    texts = db.relationship('DocumentText', collection_class=attribute_keyed_dict('field'), backref='document', lazy='select', cascade="all, delete-orphan")
+    extracted_content = document_text_property('extracted_content')
+    user_summary = document_text_property('user_summary')
+    custom_note = document_text_property('custom_note')
     workspace_items = db.relationship('WorkspaceItem', backref='document', lazy=True, cascade="all, delete-orphan")
     relations = db.relationship('WorkspaceItemRelation', backref='document', lazy=True, cascade="all, delete-orphan")
     learning_objectives = db.relationship('LearningObjective', backref='doc', lazy=True, cascade="all, delete-orphan")
 
+    # Chỉ mục phủ cho danh sách sắp xếp theo ngày (có hoặc không lọc danh mục)
+    __table_args__ = (
+        db.Index('ix_document_uploaded_date_id', 'uploaded_date', 'id'),
+        db.Index('ix_document_category_uploaded_date_id', 'category', 'uploaded_date', 'id'),
+        # Dò id ngẫu nhiên trong một danh mục (get_random_docs)
+        db.Index('ix_document_category_id', 'category', 'id'),
+        # Gợi ý top-k theo điểm liên quan mục tiêu
+        db.Index('ix_document_goal_score_id', 'goal_score', 'id'),
+    )
+
+class DocumentText(db.Model):
+    # Văn bản lớn của Document (DOCUMENT_TEXT_FIELDS), nén bằng utils.compressed_text
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), primary_key=True)
+    field = db.Column(db.String(30), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False, default=0)  # số ký tự trước khi nén
+
+    # Đếm/lọc tài liệu theo loại văn bản (ví dụ: đã có tóm tắt)
+    __table_args__ = (
+        db.Index('ix_document_text_field_document_id', 'field', 'document_id'),
+    )
+
+    @property
+    def text(self):
+        # Giải nén một lần cho mỗi đối tượng; nội dung mới luôn được ghi bằng đối tượng mới
+        if '_text' not in self.__dict__:
+            self.__dict__['_text'] = compressed_text.decompress(self.data)
+        return self.__dict__['_text']
+
+class DocumentFacetCount(db.Model):
+    facet = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class DocumentSimhashBand(db.Model):
+    # Chỉ mục LSH: mỗi tài liệu có simhash.BANDS dòng, tra theo (band, value)
+    band = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), primary_key=True, index=True)
+
+class DocumentTermSet(db.Model):
+    # Kết quả tách từ nội dung tài liệu (utils.tokenizer), tính một lần khi trích xuất xong
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), primary_key=True)
+    # Các bucket băm (utils.keyword_engine), để trừ lại tần suất tài liệu khi nội dung đổi hoặc tài liệu bị xóa
+    buckets = db.Column(db.LargeBinary, nullable=False)
+    tokens = db.Column(db.LargeBinary, nullable=True)       # chuỗi âm tiết theo đoạn, nén (tokenizer.encode_phrases)
+    term_counts = db.Column(db.LargeBinary, nullable=True)  # số lần xuất hiện của từ/cụm, nén (tokenizer.encode_term_counts)
+
+class TermDocumentFrequency(db.Model):
+    # Số tài liệu chứa mỗi bucket; kích thước tối đa keyword_engine.HASH_BUCKETS dòng
+    bucket = db.Column(db.Integer, primary_key=True)
+    doc_count = db.Column(db.Integer, nullable=False, default=0)
+
+class UploadBatchItem(db.Model):
+    # Trạng thái từng file trong một lần upload nhiều file (/api/upload_batch)
+    batch_id = db.Column(db.String(32), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(200), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # saved / duplicate / rejected / error
+    message = db.Column(db.String(300), nullable=True)
+    document_id = db.Column(db.Integer, nullable=True)
+    created_date = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+class StoredBlob(db.Model):
+    # Một file trong kho theo nội dung; ref_count = số Document đang dùng file này
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False, default=0)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+
+class DocumentContentChunk(db.Model):
+    # Nội dung trích xuất theo trang (PDF) hoặc theo khối, đã định dạng sẵn để hiển thị
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    page_number = db.Column(db.Integer, nullable=True)
+    content = db.Column(db.Text, nullable=False, default='')
+
+    __table_args__ = (
+        db.UniqueConstraint('document_id', 'position', name='uq_document_content_chunk_document_id_position'),
+    )
+
 class WorkspaceItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(300), nullable=False)
@@ -110,11 +309,17 @@ class WorkspaceItem(db.Model):
     parent_id = db.Column(db.Integer, db.ForeignKey('workspace_item.id'), nullable=True)
     children = db.relationship('WorkspaceItem', backref=db.backref('parent', remote_side=[id]), lazy='dynamic', cascade="all, delete-orphan")
 
+    # Cây workspace luôn được đọc theo tài liệu (hoặc theo nút cha) và sắp xếp theo order
+    __table_args__ = (
+        db.Index('ix_workspace_item_document_id_order', 'document_id', 'order'),
+        db.Index('ix_workspace_item_parent_id_order', 'parent_id', 'order'),
+    )
+
 class WorkspaceItemRelation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False)
-    source_id = db.Column(db.Integer, db.ForeignKey('workspace_item.id'), nullable=False)
-    target_id = db.Column(db.Integer, db.ForeignKey('workspace_item.id'), nullable=False)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False, index=True)
+    source_id = db.Column(db.Integer, db.ForeignKey('workspace_item.id'), nullable=False, index=True)
+    target_id = db.Column(db.Integer, db.ForeignKey('workspace_item.id'), nullable=False, index=True)
     label = db.Column(db.String(100), nullable=True)
     source_node = db.relationship('WorkspaceItem', foreign_keys=[source_id], backref='source_relations')
     target_node = db.relationship('WorkspaceItem', foreign_keys=[target_id], backref='target_relations')
@@ -123,8 +328,8 @@ class LearningObjective(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(500), nullable=False)
     is_completed = db.Column(db.Boolean, default=False, nullable=False)
-    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=True)
-    parent_id = db.Column(db.Integer, db.ForeignKey('learning_objective.id'), nullable=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=True, index=True)
+    parent_id = db.Column(db.Integer, db.ForeignKey('learning_objective.id'), nullable=True, index=True)
     sub_objectives = db.relationship('LearningObjective', backref=db.backref('parent', remote_side=[id]), lazy=True, cascade="all, delete-orphan")
     importance = db.Column(db.String(50), nullable=True)
     learning_role = db.Column(db.String(50), nullable=True)
@@ -156,59 +361,80 @@ class FileProcessor:
         "Google Drive": ["google drive", "gsheet"]
     }
 
-    def extract_text(self, filepath):
-        try:
-            ext = os.path.splitext(filepath)[1].lower()
-            if ext == '.pdf':
-                with fitz.open(filepath) as doc:
-                    text = "".join(page.get_text() for page in doc)
-                return text
-            elif ext == '.docx':
-                doc = docx.Document(filepath)
-                return "\n".join([para.text for para in doc.paragraphs])
-            elif ext == '.txt':
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    return f.read()
-            else:
-                return f"[Lỗi: Định dạng file '{ext}' không được hỗ trợ để trích xuất văn bản.]"
-        except Exception as e:
-            print(f"ERROR extracting text from {filepath}: {e}")
-            return f"[Lỗi: Không thể đọc nội dung từ file. File có thể bị hỏng hoặc cần quyền truy cập. Chi tiết: {e}]"
+    # Quy tắc theo hồ sơ người dùng: (từ trong mục tiêu/hình mẫu đã bỏ dấu, từ trong tài liệu, danh mục được thêm)
+    GOAL_RULES = (
+        (("ai", "hoc may", "lap trinh"), ("neural network", "machine learning"), "AI/ML"),
+        (("ai", "hoc may", "lap trinh"), ("python", "code"), "Lập trình"),
+        (("kinh doanh", "doanh nhan"), ("thi truong", "kinh te"), "Kinh tế học"),
+    )
+    ROLE_MODEL_RULES = (
+        (("chuyen gia ai", "game developer"), ("thuật toán", "code"), "Lập trình"),
+        (("doanh nhan thanh dat",), ("gdp", "thị trường"), "Kinh tế học"),
+    )
+    PRIORITY_CATEGORIES = ("AI/ML", "Lập trình", "Kinh tế học", "Toán học")
+
+    def __init__(self):
+        self.reload_category_keywords()
+
+    def reload_category_keywords(self, category_keywords=None):
+        """Dựng lại automaton từ khóa; gọi khi CATEGORY_KEYWORDS hoặc các quy tắc thay đổi."""
+        if category_keywords is not None:
+            self.CATEGORY_KEYWORDS = category_keywords
+        text_keywords = {cat: [k.lower() for k in keys] for cat, keys in self.CATEGORY_KEYWORDS.items()}
+        condition_keywords = {}
+        for kind, rules in (('goal', self.GOAL_RULES), ('role', self.ROLE_MODEL_RULES)):
+            for index, (conditions, triggers, _) in enumerate(rules):
+                # Nhãn của quy tắc là tuple, không trùng với tên danh mục (chuỗi)
+                text_keywords[(kind, index)] = triggers
+                condition_keywords[(kind, index)] = conditions
+        self._text_matcher = KeywordAutomaton(text_keywords)
+        self._condition_matcher = KeywordAutomaton(condition_keywords)
+        self._active_rules_cache = {}
+
+    def active_rules(self, user_ultimate_goal=None, user_role_model=None):
+        """Các quy tắc áp dụng cho mục tiêu/hình mẫu này. Returns: dict nhãn quy tắc -> danh mục."""
+        key = (user_ultimate_goal or '', user_role_model or '')
+        rules = self._active_rules_cache.get(key)
+        if rules is None:
+            rules = {}
+            for kind, text, kind_rules in (('goal', user_ultimate_goal, self.GOAL_RULES), ('role', user_role_model, self.ROLE_MODEL_RULES)):
+                if text:
+                    for label in self._condition_matcher.matched_labels(normalize_vietnamese(text).lower()):
+                        if label[0] == kind:
+                            rules[label] = kind_rules[label[1]][2]
+            if len(self._active_rules_cache) >= 256:
+                self._active_rules_cache.clear()
+            self._active_rules_cache[key] = rules
+        return rules
+
+    def category_hits(self, filename_or_content, user_ultimate_goal=None, user_role_model=None, rules=None):
+        """Số lần khớp từ khóa theo danh mục, sau một lần duyệt văn bản. Returns: Counter."""
+        if isinstance(filename_or_content, (list, tuple)):
+            filename_or_content = "\n".join(part for part in filename_or_content if part)
+        if rules is None:
+            rules = self.active_rules(user_ultimate_goal, user_role_model)
+        counts = Counter()
+        for label, hits in self._text_matcher.hits((filename_or_content or '').lower()).items():
+            category = rules.get(label) if isinstance(label, tuple) else label
+            if category:
+                counts[category] += hits
+        return counts
+
+    def pick_category(self, category_counts):
+        if not category_counts:
+            return self.DEFAULT_CATEGORY
+        for category in self.PRIORITY_CATEGORIES:
+            if category in category_counts:
+                return category
+        return min(category_counts)
 
     def categorize_document(self, filename_or_content, user_ultimate_goal=None, user_role_model=None):
-        keyword_string = (filename_or_content or '').lower()  
-        detected_categories = set()
-        for cat, keys in self.CATEGORY_KEYWORDS.items():
-            if any(k in keyword_string for k in keys):
-                detected_categories.add(cat)
-        if user_ultimate_goal:
-            normalized_goal = normalize_vietnamese(user_ultimate_goal).lower()
-            if "ai" in normalized_goal or "hoc may" in normalized_goal or "lap trinh" in normalized_goal:
-                if "neural network" in keyword_string or "machine learning" in keyword_string:
-                    detected_categories.add("AI/ML")
-                if "python" in keyword_string or "code" in keyword_string:
-                    detected_categories.add("Lập trình")
-            if "kinh doanh" in normalized_goal or "doanh nhan" in normalized_goal:
-                if "thi truong" in keyword_string or "kinh te" in keyword_string:
-                    detected_categories.add("Kinh tế học")
-        
-        if user_role_model:
-            normalized_role = normalize_vietnamese(user_role_model).lower()
-            if "chuyen gia ai" in normalized_role or "game developer" in normalized_role:
-                if "thuật toán" in keyword_string or "code" in keyword_string:
-                    detected_categories.add("Lập trình")
-            if "doanh nhan thanh dat" in normalized_role:
-                if "gdp" in keyword_string or "thị trường" in keyword_string:
-                    detected_categories.add("Kinh tế học")
-        
-        if detected_categories:
-            if "AI/ML" in detected_categories: return "AI/ML"
-            if "Lập trình" in detected_categories: return "Lập trình"
-            if "Kinh tế học" in detected_categories: return "Kinh tế học"
-            if "Toán học" in detected_categories: return "Toán học"
-            return sorted(list(detected_categories))[0] 
-        
-        return self.DEFAULT_CATEGORY
+        return self.pick_category(self.category_hits(filename_or_content, user_ultimate_goal, user_role_model))
+
+    def categorize_documents(self, texts, user_ultimate_goal=None, user_role_model=None):
+        """Phân loại nhiều tài liệu cùng một hồ sơ người dùng. Returns: list danh mục theo thứ tự texts."""
+        rules = self.active_rules(user_ultimate_goal, user_role_model)
+        return [self.pick_category(self.category_hits(text, rules=rules)) for text in texts]
 
     @staticmethod
     def build_objectives_tree(items): 
@@ -231,40 +457,142 @@ class FileProcessor:
 fp = FileProcessor()
 
 # --- Các hàm tiện ích (Utility Functions) ---
-def normalize_vietnamese(text):
-    if not text: return ""
-    replacements = {'á': 'a', 'à': 'a', 'ả': 'a', 'ã': 'a', 'ạ': 'a','ă': 'a', 'ằ': 'a', 'ắ': 'a', 'ẳ': 'a', 'ẵ': 'a', 'ặ': 'a','â': 'a', 'ầ': 'a', 'ấ': 'a', 'ẩ': 'a', 'ẫ': 'a', 'ậ': 'a','đ': 'd','é': 'e', 'è': 'e', 'ẻ': 'e', 'ẽ': 'e', 'ẹ': 'e','ê': 'e', 'ề': 'e', 'ế': 'e', 'ể': 'e', 'ễ': 'e', 'ệ': 'e','í': 'i', 'ì': 'i', 'ỉ': 'i', 'ĩ': 'i', 'ị': 'i','ó': 'o', 'ò': 'o', 'ỏ': 'o', 'õ': 'o', 'ọ': 'o','ô': 'o', 'ồ': 'o', 'ố': 'o', 'ổ': 'o', 'ỗ': 'o', 'ộ': 'o','ơ': 'o', 'ờ': 'o', 'ớ': 'o', 'ở': 'o', 'ỡ': 'o', 'ợ': 'o','ú': 'u', 'ù': 'u', 'ủ': 'u', 'ũ': 'u', 'ụ': 'u','ư': 'u', 'ừ': 'u', 'ứ': 'u', 'ử': 'u', 'ữ': 'u', 'ự': 'u','ý': 'y', 'ỳ': 'y', 'ỷ': 'y', 'ĩ': 'y', 'ỵ': 'y',}
-    text_lower = text.lower()
-    return "".join([replacements.get(char, char) for char in text_lower])
-
 def allowed_file(filename): return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 def allowed_image(filename): return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_IMAGE_EXTENSIONS']
 def allowed_video(filename): return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_VIDEO_EXTENSIONS']
 def is_google_drive_link(url): return url and "drive.google.com" in url.lower()
 
-def get_random_docs(model, num_docs):
-    all_ids = db.session.query(model.id).all()
-    if not all_ids: return []
-    random_id_tuples = random.sample(all_ids, min(len(all_ids), num_docs))
-    random_ids = [r[0] for r in random_id_tuples]
-    return model.query.filter(model.id.in_(random_ids)).all()
+def current_blob_store():
+    # Mỗi shard vault có kho riêng, để số tham chiếu nằm cùng database với Document
+    shard_key = sharding.current_shard_key() if vault_shards.enabled else None
+    return BlobStore(os.path.join(app.config['BLOB_STORE_DIR'], shard_key) if shard_key else app.config['BLOB_STORE_DIR'])
+
+def document_physical_path(doc):
+    """Đường dẫn file thực của tài liệu (kho theo nội dung, hoặc thư mục upload cũ), None nếu là link hoặc không tìm thấy."""
+    if doc.doc_type in ['link', 'googledrive_link']:
+        return None
+    if doc.content_sha256:
+        path = current_blob_store().path_for(doc.content_sha256)
+        return path if os.path.exists(path) else None
+    try:
+        upload_dir = os.path.abspath(app.config['UPLOAD_FOLDER'])
+        potential_paths = [os.path.join(upload_dir, secure_filename(doc.filename)), os.path.join(upload_dir, doc.filename)]
+        for path in potential_paths:
+            if os.path.exists(path): return path
+    except Exception as e: print(f"ERROR constructing file path: {e}")
+    return None
+
+def get_random_docs(model, num_docs, *criteria):
+    # Lấy mẫu bằng cách dò id ngẫu nhiên trên chỉ mục, không tải toàn bộ danh sách id
+    return random_sample(model.query.filter(*criteria), model.id, num_docs)
+
+def unreviewed_document_filter():
+    return or_(Document.last_viewed_date.is_(None), Document.engagement_level.is_(None), Document.context_event.is_(None))
+
+# --- Truy vấn của các route ---
+# Route và lệnh check-query-plans (hot_route_queries) dùng chung các hàm dựng
+# truy vấn này, nên kế hoạch được kiểm tra đúng là truy vấn route đang chạy.
+def document_listing_query(category=None):
+    query = Document.query
+    return query.filter(Document.category == category) if category else query
+
+def document_by_filepath_query(filepath):
+    return Document.query.filter_by(filepath=filepath)
+
+def goal_suggestions_query(limit=3):
+    return Document.query.filter(unreviewed_document_filter(), Document.goal_score > 0).order_by(Document.goal_score.desc(), Document.id.desc()).limit(limit)
+
+def unreviewed_documents_query(exclude_ids=()):
+    return Document.query.filter(unreviewed_document_filter(), Document.id.notin_(list(exclude_ids)))
+
+def related_documents_query(doc):
+    return Document.query.filter(Document.category == doc.category, Document.id != doc.id)
+
+def documents_viewed_between_query(start, end):
+    return db.session.query(Document.id).filter(Document.last_viewed_date.between(start, end))
+
+def summarized_documents_query():
+    return db.session.query(DocumentText.document_id).filter(DocumentText.field == 'user_summary')
+
+def content_chunks_query(document_id, after, limit):
+    return DocumentContentChunk.query.filter(DocumentContentChunk.document_id == document_id, DocumentContentChunk.position > after).order_by(DocumentContentChunk.position).limit(limit)
+
+def near_duplicate_candidates_query(doc):
+    band_filters = [and_(DocumentSimhashBand.band == band, DocumentSimhashBand.value == value) for band, value in simhash.bands(doc.simhash)]
+    return db.session.query(DocumentSimhashBand.document_id).filter(or_(*band_filters), DocumentSimhashBand.document_id != doc.id).distinct()
+
+def workspace_items_query(document_id):
+    return WorkspaceItem.query.filter_by(document_id=document_id).order_by(WorkspaceItem.order)
+
+def latest_workspace_items_query(document_id):
+    return WorkspaceItem.query.filter_by(document_id=document_id).order_by(WorkspaceItem.id.desc())
+
+def document_workspace_item_query(item_id, document_id):
+    return WorkspaceItem.query.filter_by(id=item_id, document_id=document_id)
+
+def max_item_order_query(document_id, parent_id):
+    if parent_id:
+        return db.session.query(sql_func.max(WorkspaceItem.order)).filter_by(parent_id=parent_id)
+    return db.session.query(sql_func.max(WorkspaceItem.order)).filter_by(document_id=document_id, parent_id=None)
+
+def child_items_query(parent_id):
+    return WorkspaceItem.query.filter_by(parent_id=parent_id)
+
+def workspace_relations_query(document_id):
+    return WorkspaceItemRelation.query.filter_by(document_id=document_id)
+
+def relations_from_query(source_id, document_id):
+    return WorkspaceItemRelation.query.filter_by(source_id=source_id, document_id=document_id)
+
+def relations_to_query(target_id, document_id):
+    return WorkspaceItemRelation.query.filter_by(target_id=target_id, document_id=document_id)
+
+def objectives_query(document_id):
+    return LearningObjective.query.filter_by(document_id=document_id)
+
+def summarized_documents_sample_query():
+    return Document.query.filter(Document.texts.any(DocumentText.field == 'user_summary'))
+
+def extracted_documents_query(exclude_ids=()):
+    return Document.query.filter(Document.id.notin_(list(exclude_ids)), Document.word_count > 0)
 
 def get_unique_random_elements(input_list, num_elements):
     if not input_list: return []
     return random.sample(input_list, min(len(input_list), num_elements))
-STOP_WORDS = set(["là", "và", "của", "có", "trong", "để", "một", "không", "được", "cho", "với", "tại","thì", "mà", "khi", "từ", "ra", "lên", "xuống", "vào", "qua", "đến", "đi", "lại","như", "ở", "đã", "sẽ", "đang", "rằng", "hay", "hơn", "rất", "này", "đó", "kia", "ấy","tôi", "bạn", "anh", "chị", "em", "ông", "bà", "nó", "chúng", "mình","the", "a", "an", "is", "are", "was", "were", "of", "in", "on", "at", "to", "for","with", "by", "from", "as", "and", "or", "but", "if", "then", "this", "that", "it","its", "i", "you", "he", "she", "we", "they", "my", "your", "his", "her", "our", "their"])
 
-def create_fill_in_the_blank_question(content_text, num_blanks=1, min_word_len=4):
+FILL_BLANK_MAX_ATTEMPTS = 30
+SENTENCE_END_MARKS = ('. ', '? ', '! ', '\n')
+
+def sentence_around(text, start, end):
+    """Câu chứa đoạn text[start:end], giới hạn bởi dấu kết thúc câu gần nhất ở hai bên."""
+    begin, stop = 0, len(text)
+    for mark in SENTENCE_END_MARKS:
+        before = text.rfind(mark, 0, start)
+        if before >= 0:
+            begin = max(begin, before + len(mark))
+        after = text.find(mark, end)
+        if after >= 0:
+            stop = min(stop, after + 1)
+    return text[begin:stop].strip()
+
+def create_fill_in_the_blank_question(content_text, num_blanks=1, min_word_len=4, vocabulary=None):
+    """
+    vocabulary: số lần xuất hiện của từ/cụm đã lưu khi tách từ (document_term_counts); không truyền thì tách từ content_text.
+    Đáp án được chọn từ từ vựng trước rồi mới tìm câu chứa nó, nên không phải tách từ từng câu của tài liệu.
+    """
     if not content_text or not isinstance(content_text, str): return None
-    sentences = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?|\!)\s', content_text)
-    potential_sentences = [s.strip() for s in sentences if len(s.strip().split()) > 5]
-    if not potential_sentences: return None
-    random.shuffle(potential_sentences)
-    for sentence in potential_sentences:
-        words = re.findall(r'\b\w+\b', sentence.lower())
-        candidate_keywords = [word for word in words if len(word) >= min_word_len and word not in STOP_WORDS]
-        if len(candidate_keywords) < num_blanks: continue
-        words_to_blank = random.sample(candidate_keywords, num_blanks)
+    if not vocabulary:
+        vocabulary = tokenizer.term_counts(tokenizer.phrases(content_text))
+    candidates = [term for term in vocabulary if ' ' not in term and len(term) >= min_word_len]
+    random.shuffle(candidates)
+    for answer in candidates[:FILL_BLANK_MAX_ATTEMPTS]:
+        match = re.search(r'\b' + re.escape(answer) + r'\b', content_text, re.IGNORECASE)
+        if not match: continue
+        sentence = sentence_around(content_text, match.start(), match.end())
+        if len(sentence.split()) <= 5: continue
+        other_words = [word for word in dict.fromkeys(tokenizer.words(sentence)) if word != answer and word in vocabulary and len(word) >= min_word_len]
+        if len(other_words) < num_blanks - 1: continue
+        words_to_blank = [answer] + random.sample(other_words, num_blanks - 1)
         original_sentence = sentence; question_sentence = sentence
         original_words_for_answer = []
         words_to_blank.sort(key=len, reverse=True)
@@ -331,39 +659,811 @@ def generate_mermaid_graph(items, relations):
     mermaid_string += "\n" + "\n".join(link_styles)
     return mermaid_string
 
-def check_document_relevance(document, user):
+_search_index_ready = set()  # URL các database (chính và shard) đã có bảng FTS5
+
+def is_search_index_ready(bind=None):
     """
-    Kiểm tra xem một tài liệu có liên quan đến mục tiêu của người dùng không.
-    Trả về True nếu liên quan, False nếu không.
+    Kiểm tra các bảng FTS5 đã được tạo trên bind (mặc định: database của vault hiện tại) chưa;
+    nếu chưa thì tìm kiếm quay về LIKE. Chỉ kết quả True được nhớ lại, nên chỉ mục được tạo
+    sau đó (migration, shard mới) được nhận ra ngay thay vì bị bỏ qua mãi.
     """
-    if not user or not document:
+    bind = bind if bind is not None else db.session.get_bind()
+    url = str(bind.engine.url)
+    if url in _search_index_ready:
+        return True
+    try:
+        ready = search_index.is_installed(bind)
+    except SQLAlchemyError as e:
+        print(f"WARNING: Cannot check full-text index: {e}")
         return False
+    if ready:
+        _search_index_ready.add(url)
+    return ready
+
+def document_trigram_terms(doc):
+    return search_index.trigram_terms(
+        doc.filename_normalized or normalize_vietnamese(doc.filename),
+        normalize_vietnamese(doc.keywords),
+        normalize_vietnamese(doc.category)
+    )
+
+# --- Đồng bộ chỉ mục trigram theo thay đổi của Document ---
+TRIGRAM_SOURCE_FIELDS = ('filename', 'filename_normalized', 'keywords', 'category')
+
+@event.listens_for(Document, 'after_insert')
+def index_trigrams_after_insert(mapper, connection, target):
+    if is_search_index_ready(connection):
+        search_index.set_trigram_terms(connection, target.id, document_trigram_terms(target))
+
+@event.listens_for(Document, 'after_update')
+def index_trigrams_after_update(mapper, connection, target):
+    state = sql_inspect(target)
+    if is_search_index_ready(connection) and any(state.attrs[field].history.has_changes() for field in TRIGRAM_SOURCE_FIELDS):
+        search_index.set_trigram_terms(connection, target.id, document_trigram_terms(target))
+
+@event.listens_for(Document, 'after_delete')
+def index_trigrams_after_delete(mapper, connection, target):
+    if is_search_index_ready(connection):
+        search_index.delete_trigram_terms(connection, target.id)
+
+# --- Đồng bộ chỉ mục toàn văn theo thay đổi của Document ---
+# Văn bản nằm ở bảng document_text (nén) nên không đồng bộ được bằng trigger.
+# Bảng FTS đọc văn bản qua view nguồn (external content): tài liệu có tên/từ
+# khóa/văn bản thay đổi hoặc bị xóa được gỡ khỏi chỉ mục trước flush (view còn
+# trả về giá trị cũ), rồi tài liệu mới và tài liệu thay đổi được thêm lại sau flush.
+FULLTEXT_SOURCE_FIELDS = ('filename_normalized', 'keywords', 'texts')
+FULLTEXT_REINDEX_KEY = 'fulltext_reindex_ids'
+
+def fulltext_changed(doc):
+    return any(sql_inspect(doc).attrs[field].history.has_changes() for field in FULLTEXT_SOURCE_FIELDS)
+
+@event.listens_for(VaultSession, 'before_flush')
+def unindex_fulltext_before_flush(session, flush_context, instances):
+    changed_ids = [obj.id for obj in session.dirty if isinstance(obj, Document) and fulltext_changed(obj)]
+    deleted_ids = [obj.id for obj in session.deleted if isinstance(obj, Document)]
+    session.info[FULLTEXT_REINDEX_KEY] = changed_ids
+    if not (changed_ids or deleted_ids):
+        return
+    connection = session.connection()
+    if is_search_index_ready(connection):
+        search_index.unindex_documents(connection, changed_ids + deleted_ids)
+
+@event.listens_for(VaultSession, 'after_flush')
+def index_fulltext_after_flush(session, flush_context):
+    # Trong after_flush, session.new vẫn là các đối tượng vừa được INSERT (đã có id)
+    doc_ids = [obj.id for obj in session.new if isinstance(obj, Document)] + session.info.pop(FULLTEXT_REINDEX_KEY, [])
+    if not doc_ids:
+        return
+    connection = session.connection()
+    if is_search_index_ready(connection):
+        search_index.index_documents(connection, doc_ids)
+
+def find_fuzzy_documents(normalized_query, limit=20):
+    """Trả về danh sách (doc_id, similarity) gần đúng với truy vấn; rỗng nếu chưa có chỉ mục."""
+    if not is_search_index_ready():
+        return []
+    return search_index.fuzzy_candidates(db.session, normalized_query, limit=limit)
+
+# --- Gợi ý tìm kiếm (typeahead) ---
+typeahead_indexes = {}  # mỗi shard vault một chỉ mục (None khi không chia shard)
+
+def current_typeahead_index():
+    shard_key = sharding.current_shard_key() if vault_shards.enabled else None
+    index = typeahead_indexes.get(shard_key)
+    if index is None:
+        index = typeahead_indexes.setdefault(shard_key, PrefixIndex(normalize_vietnamese))
+    return index
+TYPEAHEAD_SOURCE_FIELDS = ('filename', 'keywords', 'category')
+
+def typeahead_entries(filename, keywords, category):
+    entries = []
+    if filename:
+        entries.append(('filename', filename))
+    for keyword in (keywords or '').split(','):
+        if keyword.strip():
+            entries.append(('keyword', keyword.strip()))
+    if category:
+        entries.append(('category', category))
+    return entries
+
+def ensure_typeahead_index():
+    """Dựng chỉ mục khi dùng lần đầu, và dựng lại định kỳ để các worker khác nhau không lệch nhau quá lâu."""
+    typeahead_index = current_typeahead_index()
+    if typeahead_index.is_stale():
+        rows = db.session.execute(db.select(Document.filename, Document.keywords, Document.category))
+        typeahead_index.build(entry for row in rows for entry in typeahead_entries(row.filename, row.keywords, row.category))
+    return typeahead_index
+
+@event.listens_for(Document, 'after_insert')
+def update_typeahead_after_insert(mapper, connection, target):
+    typeahead_index = current_typeahead_index()
+    if typeahead_index.is_built:
+        typeahead_index.add(typeahead_entries(target.filename, target.keywords, target.category))
+
+@event.listens_for(Document, 'after_update')
+def update_typeahead_after_update(mapper, connection, target):
+    typeahead_index = current_typeahead_index()
+    if not typeahead_index.is_built:
+        return
+    state = sql_inspect(target)
+    histories = {field: state.attrs[field].history for field in TYPEAHEAD_SOURCE_FIELDS}
+    if not any(history.has_changes() for history in histories.values()):
+        return
+    old_values = {field: (history.deleted[0] if history.deleted else getattr(target, field)) for field, history in histories.items()}
+    typeahead_index.remove(typeahead_entries(old_values['filename'], old_values['keywords'], old_values['category']))
+    typeahead_index.add(typeahead_entries(target.filename, target.keywords, target.category))
+
+@event.listens_for(Document, 'after_delete')
+def update_typeahead_after_delete(mapper, connection, target):
+    typeahead_index = current_typeahead_index()
+    if typeahead_index.is_built:
+        typeahead_index.remove(typeahead_entries(target.filename, target.keywords, target.category))
+
+# --- Đếm tài liệu theo danh mục / loại file (facet) ---
+# Bảng document_facet_count được cộng/trừ ngay trong transaction ghi Document,
+# nên trang danh sách chỉ đọc vài dòng nhỏ thay vì GROUP BY toàn bảng.
+FACET_FIELDS = ('category', 'doc_type')
+FACET_UPSERT_SQL = db.text(
+    "INSERT INTO document_facet_count (facet, value, count) VALUES (:facet, :value, :delta) "
+    "ON CONFLICT (facet, value) DO UPDATE SET count = document_facet_count.count + :delta"
+)
+
+def adjust_facet_counts(connection, changes):
+    params = [{"facet": facet, "value": value or '', "delta": delta} for facet, value, delta in changes]
+    if params:
+        connection.execute(FACET_UPSERT_SQL, params)
+
+@event.listens_for(Document, 'after_insert')
+def count_facets_after_insert(mapper, connection, target):
+    adjust_facet_counts(connection, [(field, getattr(target, field), 1) for field in FACET_FIELDS])
+
+@event.listens_for(Document, 'after_delete')
+def count_facets_after_delete(mapper, connection, target):
+    adjust_facet_counts(connection, [(field, getattr(target, field), -1) for field in FACET_FIELDS])
+
+@event.listens_for(Document, 'after_update')
+def count_facets_after_update(mapper, connection, target):
+    state = sql_inspect(target)
+    changes = []
+    for field in FACET_FIELDS:
+        history = state.attrs[field].history
+        if history.has_changes():
+            changes.append((field, history.deleted[0] if history.deleted else None, -1))
+            changes.append((field, getattr(target, field), 1))
+    adjust_facet_counts(connection, changes)
+
+def get_facet_counts():
+    """Returns: dict {facet: {value: count}}, chỉ gồm các giá trị còn tài liệu."""
+    facets = {field: {} for field in FACET_FIELDS}
+    for row in DocumentFacetCount.query.filter(DocumentFacetCount.count > 0).all():
+        if row.value and row.facet in facets:
+            facets[row.facet][row.value] = row.count
+    return facets
+
+def rebuild_facet_counts(connection):
+    connection.execute(db.delete(DocumentFacetCount))
+    for field in FACET_FIELDS:
+        connection.execute(db.text(
+            f"INSERT INTO document_facet_count (facet, value, count) "
+            f"SELECT :facet, COALESCE({field}, ''), COUNT(*) FROM document GROUP BY COALESCE({field}, '')"
+        ), {"facet": field})
+
+# --- Đếm tham chiếu file trong kho theo nội dung ---
+# Cộng/trừ trong cùng transaction ghi Document (giống bảng facet); file chỉ bị
+# xóa khỏi đĩa sau commit, khi không còn tài liệu nào tham chiếu.
+BLOB_REF_UPSERT_SQL = db.text(
+    "INSERT INTO stored_blob (sha256, size, ref_count) VALUES (:sha256, :size, :delta) "
+    "ON CONFLICT (sha256) DO UPDATE SET ref_count = stored_blob.ref_count + :delta"
+)
+
+def adjust_blob_refs(connection, changes):
+    params = []
+    for sha256, delta in changes:
+        if sha256:
+            path = current_blob_store().path_for(sha256)
+            params.append({"sha256": sha256, "size": os.path.getsize(path) if os.path.exists(path) else 0, "delta": delta})
+    if params:
+        connection.execute(BLOB_REF_UPSERT_SQL, params)
+
+@event.listens_for(Document, 'after_insert')
+def count_blob_refs_after_insert(mapper, connection, target):
+    adjust_blob_refs(connection, [(target.content_sha256, 1)])
+
+@event.listens_for(Document, 'after_delete')
+def count_blob_refs_after_delete(mapper, connection, target):
+    adjust_blob_refs(connection, [(target.content_sha256, -1)])
+
+@event.listens_for(Document, 'after_update')
+def count_blob_refs_after_update(mapper, connection, target):
+    history = sql_inspect(target).attrs['content_sha256'].history
+    if history.has_changes():
+        adjust_blob_refs(connection, [(history.deleted[0] if history.deleted else None, -1), (target.content_sha256, 1)])
+
+def release_blob(sha256):
+    """Gọi sau commit: xóa file khỏi kho nếu không còn tài liệu nào tham chiếu. Returns: bool."""
+    if not sha256:
+        return False
+    deleted = db.session.execute(db.delete(StoredBlob).where(StoredBlob.sha256 == sha256, StoredBlob.ref_count <= 0)).rowcount
+    db.session.commit()
+    if deleted:
+        current_blob_store().delete(sha256)
+    return bool(deleted)
 
-    user_keywords = set()
-    if user.ultimate_goal or user.role_model_character or user.specific_study_goal:
-        goal_text = (user.ultimate_goal or '') + ' ' + (user.role_model_character or '') + ' ' + (user.specific_study_goal or '')
-        normalized_goal_text = normalize_vietnamese(goal_text).lower()
-        words = normalized_goal_text.split()
-        user_keywords = {word for word in words if word not in STOP_WORDS and len(word) >= 2}
+def discard_unreferenced_blobs(sha256s):
+    """
+    Gọi khi file đã được ghi vào kho nhưng không có Document nào được commit (lỗi hoặc bị bỏ qua):
+    xóa các file chưa có dòng stored_blob. File đã có tài liệu khác tham chiếu được giữ nguyên.
+    Returns: int: số file đã xóa.
+    """
+    sha256s = {sha256 for sha256 in sha256s if sha256}
+    if not sha256s:
+        return 0
+    referenced = {row.sha256 for row in db.session.query(StoredBlob.sha256).filter(StoredBlob.sha256.in_(list(sha256s)))}
+    blob_store = current_blob_store()
+    for sha256 in sha256s - referenced:
+        blob_store.delete(sha256)
+    return len(sha256s - referenced)
+
+def store_uploaded_file(file):
+    """Ghi file upload vào kho theo nội dung. Returns: tuple (sha256, tài liệu đã có cùng nội dung hoặc None)."""
+    sha256, _, _ = current_blob_store().save_stream(file.stream)
+    return sha256, Document.query.filter_by(content_sha256=sha256).first()
+
+# --- Mức liên quan mục tiêu tính sẵn (goal_score, is_goal_related) ---
+# Mỗi tài liệu lưu tập âm tiết đã bỏ dấu của tên file, danh mục và từ khóa
+# (match_terms, cập nhật khi flush nếu các trường nguồn đổi); tập từ mục tiêu
+# của người dùng được nhớ lại theo nội dung mục tiêu. Nhờ vậy:
+# - goal_score (số từ mục tiêu xuất hiện) cho phần gợi ý đọc top-k theo chỉ mục;
+# - is_goal_related (có chung từ với mục tiêu hoặc mục tiêu học tập cụ thể) là
+#   phép giao tập hợp, được ghi vào Document thay vì tính lại ở mỗi lần tải trang.
+# Cả hai được tính lại hàng loạt khi hồ sơ thay đổi, và cho từng tài liệu trong
+# listener mỗi khi match_terms được tính lại (upload, đổi danh mục, có từ khóa,
+# dùng lại từ khóa của bản trùng...). Lựa chọn thủ công (goal_related_override)
+# luôn thắng giá trị suy ra từ mục tiêu.
+GOAL_SCORE_BATCH_SIZE = 500
+MATCH_TERM_SOURCE_FIELDS = ('filename', 'filename_normalized', 'category', 'keywords')
+
+@lru_cache(maxsize=64)
+def goal_terms(goal_text):
+    return frozenset(word for word in tokenizer.normalized_words(goal_text) if word not in STOP_WORDS and len(word) >= 2)
+
+def goal_keywords(user):
+    """Từ của mục tiêu cuối cùng và nhân vật hình mẫu, dùng cho goal_score."""
+    if not user or not (user.ultimate_goal or user.role_model_character):
+        return frozenset()
+    return goal_terms((user.ultimate_goal or '') + ' ' + (user.role_model_character or ''))
+
+def relevance_keywords(user):
+    """Từ mục tiêu dùng cho is_goal_related: thêm cả mục tiêu học tập cụ thể."""
+    if not user or not (user.ultimate_goal or user.role_model_character or user.specific_study_goal):
+        return frozenset()
+    return goal_terms((user.ultimate_goal or '') + ' ' + (user.role_model_character or '') + ' ' + (user.specific_study_goal or ''))
+
+def match_terms_for(filename_normalized, category, keywords):
+    doc_text = ' '.join(value for value in (filename_normalized, category, keywords) if value)
+    return ' '.join(sorted(set(tokenizer.normalized_words(doc_text))))
+
+def refresh_match_terms(doc):
+    doc.match_terms = match_terms_for(doc.filename_normalized or doc.filename, doc.category, doc.keywords)
+
+def goal_score_for(match_terms, user_goal_keywords):
+    """Số từ khóa mục tiêu khác nhau trùng nguyên âm tiết trong match_terms (cùng cách so khớp với is_goal_relevant)."""
+    if not user_goal_keywords or not match_terms:
+        return 0
+    return len(user_goal_keywords.intersection(match_terms.split(' ')))
+
+def is_goal_relevant(match_terms, user_relevance_keywords, override=None):
+    if override is not None:
+        return override
+    return bool(match_terms) and not user_relevance_keywords.isdisjoint(match_terms.split(' '))
+
+def session_goal_keywords(session):
+    """(goal_keywords, relevance_keywords) của người dùng, đọc một lần cho mỗi lần flush."""
+    keyword_sets = session.info.get('goal_keyword_sets')
+    if keyword_sets is None:
+        with session.no_autoflush:
+            user = session.execute(db.select(User.ultimate_goal, User.role_model_character, User.specific_study_goal).order_by(User.id).limit(1)).first()
+        keyword_sets = session.info['goal_keyword_sets'] = (goal_keywords(user), relevance_keywords(user))
+    return keyword_sets
+
+def apply_goal_relevance(doc, keyword_sets):
+    user_goal_keywords, user_relevance_keywords = keyword_sets
+    doc.goal_score = goal_score_for(doc.match_terms, user_goal_keywords)
+    doc.is_goal_related = is_goal_relevant(doc.match_terms, user_relevance_keywords, doc.goal_related_override)
+
+@event.listens_for(Document, 'before_insert')
+def set_match_terms_before_insert(mapper, connection, target):
+    refresh_match_terms(target)
+    apply_goal_relevance(target, session_goal_keywords(object_session(target)))
+
+@event.listens_for(Document, 'before_update')
+def set_match_terms_before_update(mapper, connection, target):
+    state = sql_inspect(target)
+    terms_changed = any(state.attrs[field].history.has_changes() for field in MATCH_TERM_SOURCE_FIELDS)
+    if terms_changed:
+        refresh_match_terms(target)
+    if terms_changed or state.attrs.goal_related_override.history.has_changes():
+        apply_goal_relevance(target, session_goal_keywords(object_session(target)))
+
+@event.listens_for(VaultSession, 'after_flush')
+def forget_goal_keywords_after_flush(session, flush_context):
+    # Hồ sơ có thể đổi giữa hai lần flush
+    session.info.pop('goal_keyword_sets', None)
+
+def recompute_goal_relevance(user):
+    """
+    Tính lại goal_score và is_goal_related cho toàn bộ tài liệu theo mục tiêu hiện tại của người dùng,
+    từ match_terms đã lưu (tài liệu có goal_related_override giữ lựa chọn thủ công). Chỉ ghi các dòng thay đổi, theo từng lô. Caller tự commit.
+    Returns: int: số tài liệu được cập nhật.
+    """
+    user_goal_keywords, user_relevance_keywords = goal_keywords(user), relevance_keywords(user)
+    rows = db.session.execute(db.select(Document.id, Document.match_terms, Document.goal_score, Document.is_goal_related, Document.goal_related_override)).all()
+    changes = []
+    for row in rows:
+        score = goal_score_for(row.match_terms, user_goal_keywords)
+        related = is_goal_relevant(row.match_terms, user_relevance_keywords, row.goal_related_override)
+        if score != row.goal_score or related != row.is_goal_related:
+            changes.append({'id': row.id, 'goal_score': score, 'is_goal_related': related})
+    for start in range(0, len(changes), GOAL_SCORE_BATCH_SIZE):
+        db.session.execute(db.update(Document), changes[start:start + GOAL_SCORE_BATCH_SIZE])
+    return len(changes)
+
+def backfill_match_terms(batch_size=1000):
+    """Tính match_terms cho tài liệu tạo trước khi có cột này. Caller tự commit. Returns: int: số tài liệu được cập nhật."""
+    updated = 0
+    while True:
+        rows = db.session.execute(db.select(Document.id, Document.filename, Document.filename_normalized, Document.category, Document.keywords).where(Document.match_terms.is_(None)).order_by(Document.id).limit(batch_size)).all()
+        if not rows:
+            return updated
+        db.session.execute(db.update(Document), [{'id': row.id, 'match_terms': match_terms_for(row.filename_normalized or row.filename, row.category, row.keywords)} for row in rows])
+        updated += len(rows)
+
+_goal_relevance_ready = set()  # URL các database (chính và shard) không còn tài liệu thiếu match_terms
+
+def ensure_goal_relevance(bind=None):
+    """
+    Tính match_terms cho tài liệu tạo trước khi có cột này rồi tính lại mức liên quan mục tiêu,
+    một lần cho mỗi database trong tiến trình. Gọi ở đầu request nên chạy cả khi app được khởi
+    động bằng flask run / WSGI; lỗi (ví dụ database chưa migrate) được thử lại ở request sau.
+    """
+    bind = bind if bind is not None else db.session.get_bind(mapper=Document.__mapper__)
+    url = str(bind.engine.url)
+    if url in _goal_relevance_ready:
+        return
+    try:
+        filled = backfill_match_terms()
+        if filled:
+            updated = recompute_goal_relevance(User.query.first())
+            print(f"Goal relevance computed for {filled} documents ({updated} changed).")
+        db.session.commit()
+        _goal_relevance_ready.add(url)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"WARNING: Cannot compute goal relevance: {e}")
+
+# --- Sao lưu / khôi phục vault ---
+# Bảng chỉ mục và bộ đếm (facet, simhash band, stored_blob, trigram, FTS) không
+# được xuất: chúng được dựng lại khi khôi phục, qua các listener của Document.
+# Văn bản ở document_text được xuất chung trong dòng Document (đã giải nén).
+EXPORT_MODELS = (Document, WorkspaceItem, WorkspaceItemRelation, LearningObjective, DocumentContentChunk)
+IMPORT_BATCH_SIZE = 500
+
+def vault_export_stream():
+    """Generator bytes của archive .tar.gz (xem utils/vault_archive.py) cho shard hiện tại."""
+    return vault_archive.gzip_stream(_vault_tar_stream())
+
+def _vault_tar_stream():
+    yield from vault_archive.manifest_member(model.__tablename__ for model in EXPORT_MODELS)
+    blob_store = current_blob_store()
+    for (content_sha256,) in db.session.query(Document.content_sha256).filter(Document.content_sha256.isnot(None)).distinct():
+        path = blob_store.path_for(content_sha256)
+        if not os.path.exists(path):
+            print(f"WARNING: Export bỏ qua file thiếu trong kho: {content_sha256}")
+            continue
+        yield from vault_archive.tar_file_member(f"files/{content_sha256}", path, os.path.getsize(path))
+    legacy_docs = Document.query.options(db.load_only(Document.id, Document.filename, Document.doc_type, Document.content_sha256)).filter(Document.content_sha256.is_(None), Document.doc_type.notin_(['link', 'googledrive_link']))
+    for doc in legacy_docs:
+        path = document_physical_path(doc)
+        if path:
+            yield from vault_archive.tar_file_member(f"files/legacy/{doc.id}", path, os.path.getsize(path))
+    for model in EXPORT_MODELS:
+        table = model.__table__
+        rows = db.session.execute(db.select(table).order_by(*table.primary_key.columns).execution_options(yield_per=IMPORT_BATCH_SIZE))
+        yield from vault_archive.ndjson_members(table.name, _document_export_rows(rows) if model is Document else (dict(row._mapping) for row in rows))
+    yield from vault_archive.tar_end()
+
+def _document_export_rows(rows):
+    # Văn bản nén ở document_text được giải nén và ghép lại vào dòng Document, nên archive không phụ thuộc cách lưu
+    for batch in rows.partitions():
+        texts = {}
+        text_rows = db.session.execute(db.select(DocumentText.document_id, DocumentText.field, DocumentText.data).where(DocumentText.document_id.in_([row.id for row in batch])))
+        for text_row in text_rows:
+            texts[(text_row.document_id, text_row.field)] = compressed_text.decompress(text_row.data)
+        for row in batch:
+            yield {**row._mapping, **{field: texts.get((row.id, field)) for field in DOCUMENT_TEXT_FIELDS}}
+
+def import_vault_archive(fileobj):
+    """
+    Khôi phục archive do vault_export_stream() tạo vào shard hiện tại (phải chưa có tài liệu nào).
+    Giữ nguyên id; toàn bộ dữ liệu được ghi trong một transaction.
+    Returns: dict {tên bảng hoặc 'files': số dòng/file đã nhập}.
+    Raises: vault_archive.ArchiveError nếu archive không hợp lệ hoặc vault không trống.
+    """
+    archive, _ = vault_archive.open_archive(fileobj)
+    if db.session.query(Document.id).first():
+        raise vault_archive.ArchiveError("Vault đích đã có tài liệu; chỉ khôi phục được vào vault trống.")
+    models = {model.__tablename__: model for model in EXPORT_MODELS}
+    blob_store = current_blob_store()
+    new_blobs, legacy_blobs = [], {}
+    counts = {'files': 0}
+    try:
+        for member in archive:
+            if not member.isfile():
+                continue
+            if member.name.startswith('files/'):
+                content_sha256, _, is_new = blob_store.save_stream(archive.extractfile(member))
+                if is_new:
+                    new_blobs.append(content_sha256)
+                if member.name.startswith('files/legacy/'):
+                    legacy_blobs[int(member.name.rsplit('/', 1)[1])] = content_sha256
+                elif member.name != f"files/{content_sha256}":
+                    raise vault_archive.ArchiveError(f"Nội dung '{member.name}' không khớp SHA-256 (archive bị hỏng?).")
+                counts['files'] += 1
+            elif member.name.startswith('data/'):
+                model = models.get(member.name.split('/')[1])
+                if model is None:
+                    print(f"WARNING: Bỏ qua bảng không xác định trong archive: {member.name}")
+                    continue
+                counts[model.__tablename__] = counts.get(model.__tablename__, 0) + import_archive_rows(model, vault_archive.iter_ndjson(archive.extractfile(member)), legacy_blobs)
+        if db.engine.dialect.name == 'postgresql':
+            for model in EXPORT_MODELS:
+                db.session.execute(db.text(f"SELECT setval(pg_get_serial_sequence('{model.__tablename__}', 'id'), COALESCE(MAX(id), 1)) FROM {model.__tablename__}"))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for content_sha256 in new_blobs:
+            blob_store.delete(content_sha256)
+        raise
+    return counts
+
+def import_archive_rows(model, rows, legacy_blobs):
+    """Ghi các dòng của một phần NDJSON theo lô. Document đi qua ORM để các listener dựng lại chỉ mục/bộ đếm."""
+    imported = 0
+    batch = []
+    def flush_batch():
+        if model is Document:
+            docs = []
+            for values in batch:
+                doc = Document(**values)
+                if doc.word_count is None and doc.extracted_content:
+                    doc.word_count = compressed_text.word_count(doc.extracted_content)
+                if not doc.content_sha256:
+                    doc.content_sha256 = legacy_blobs.get(doc.id)
+                docs.append(doc)
+            db.session.add_all(docs)
+            db.session.flush()
+            band_rows = [{'band': band, 'value': value, 'document_id': doc.id} for doc in docs if doc.simhash is not None for band, value in simhash.bands(doc.simhash)]
+            if band_rows:
+                db.session.execute(db.insert(DocumentSimhashBand), band_rows)
+            # Thống kê từ khóa là dữ liệu dẫn xuất, dựng lại từ văn bản; từ khóa đã lưu trong archive được giữ nguyên
+            for doc in docs:
+                if doc.extracted_content:
+                    index_document_terms(doc, doc.extracted_content)
+            db.session.flush()
+            db.session.expunge_all()
+        else:
+            db.session.execute(model.__table__.insert(), batch)
+    for data in rows:
+        values = vault_archive.dict_to_row(data, model.__table__)
+        if model is Document:
+            values.update({field: data.get(field) for field in DOCUMENT_TEXT_FIELDS})
+        batch.append(values)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            flush_batch()
+            imported += len(batch)
+            batch = []
+    if batch:
+        flush_batch()
+        imported += len(batch)
+    return imported
+
+# --- Từ khóa tài liệu theo TF-IDF toàn kho ---
+# Tần suất tài liệu được cộng/trừ trong cùng transaction ghi kết quả trích xuất
+# (giống bảng facet), nên từ khóa của tài liệu mới được chấm ngay với IDF của kho.
+KEYWORDS_PER_DOCUMENT = 15
+TERM_FREQUENCY_UPSERT_SQL = db.text(
+    "INSERT INTO term_document_frequency (bucket, doc_count) VALUES (:bucket, :delta) "
+    "ON CONFLICT (bucket) DO UPDATE SET doc_count = term_document_frequency.doc_count + :delta"
+)
+
+def adjust_term_frequencies(connection, buckets, delta):
+    if buckets:
+        connection.execute(TERM_FREQUENCY_UPSERT_SQL, [{"bucket": bucket, "delta": delta} for bucket in buckets])
+
+def index_document_terms(doc, text, text_phrases=None):
+    """
+    Tách từ nội dung tài liệu, lưu chuỗi token và số lần xuất hiện, cập nhật tần suất tài liệu.
+    Gọi sau flush (cần doc.id). text_phrases: chuỗi token đã tách sẵn (khi đó bỏ qua text).
+    Returns: Counter các từ/cụm.
+    """
+    if text_phrases is None:
+        text_phrases = tokenizer.phrases(text)
+    term_counts = tokenizer.term_counts(text_phrases)
+    buckets = keyword_engine.term_buckets(term_counts)
+    term_set = db.session.get(DocumentTermSet, doc.id)
+    if term_set is not None:
+        adjust_term_frequencies(db.session, keyword_engine.unpack_buckets(term_set.buckets), -1)
+        if not buckets:
+            db.session.delete(term_set)
+    elif buckets:
+        term_set = DocumentTermSet(document_id=doc.id)
+        db.session.add(term_set)
+    if buckets:
+        term_set.buckets = keyword_engine.pack_buckets(buckets)
+        term_set.tokens = tokenizer.encode_phrases(text_phrases)
+        term_set.term_counts = tokenizer.encode_term_counts(term_counts)
+    adjust_term_frequencies(db.session, buckets, 1)
+    return term_counts
+
+def copy_document_terms(source, doc):
+    # Tài liệu trùng nội dung: dùng lại kết quả tách từ và từ khóa, không tách lại
+    source_set = db.session.get(DocumentTermSet, source.id)
+    if source_set is not None and db.session.get(DocumentTermSet, doc.id) is None:
+        db.session.add(DocumentTermSet(document_id=doc.id, buckets=source_set.buckets, tokens=source_set.tokens, term_counts=source_set.term_counts))
+        adjust_term_frequencies(db.session, keyword_engine.unpack_buckets(source_set.buckets), 1)
+    doc.keywords = source.keywords
+
+def document_term_counts(doc_id):
+    """Số lần xuất hiện của từ/cụm đã lưu khi trích xuất. Returns: Counter, rỗng nếu tài liệu chưa được tách từ."""
+    data = db.session.query(DocumentTermSet.term_counts).filter(DocumentTermSet.document_id == doc_id).scalar()
+    return tokenizer.decode_term_counts(data)
+
+def assign_keywords(entries, limit=KEYWORDS_PER_DOCUMENT):
+    """Gán Document.keywords cho cả lô theo thống kê hiện tại của kho. Args: entries: list (Document, Counter cụm)."""
+    if not entries:
+        return
+    db.session.flush()
+    corpus_size = db.session.query(sql_func.count(DocumentTermSet.document_id)).scalar()
+    buckets = sorted({keyword_engine.term_bucket(term) for _, term_counts in entries for term in term_counts})
+    doc_freq = {}
+    for start in range(0, len(buckets), 500):
+        rows = db.session.query(TermDocumentFrequency.bucket, TermDocumentFrequency.doc_count).filter(TermDocumentFrequency.bucket.in_(buckets[start:start + 500]))
+        doc_freq.update(rows)
+    for doc, term_counts in entries:
+        doc.keywords = ', '.join(keyword_engine.top_keywords(term_counts, doc_freq, corpus_size, limit)) or None
+
+@event.listens_for(Document, 'before_delete')
+def delete_document_terms(mapper, connection, target):
+    row = connection.execute(db.select(DocumentTermSet.buckets).where(DocumentTermSet.document_id == target.id)).first()
+    if row is not None:
+        adjust_term_frequencies(connection, keyword_engine.unpack_buckets(row.buckets), -1)
+        connection.execute(db.delete(DocumentTermSet).where(DocumentTermSet.document_id == target.id))
+
+# --- Trích xuất văn bản chạy nền ---
+EXTRACTABLE_DOC_TYPES = ('pdf', 'docx', 'txt', 'file')
+CONTENT_CHUNKS_PER_PAGE = 5
+CONTENT_CHUNK_INSERT_BATCH = 200
+
+def format_content_for_display(text):
+    # Văn bản không có xuống dòng (thường từ PDF quét) được ngắt dòng theo câu cho dễ đọc
+    if '\n' in text:
+        return text
+    text = re.sub(r':\s*', ':\n\n', text)
+    return re.sub(r'([.?!])\s+', r'\1\n', text)
+
+def store_content_chunks(doc, chunks, paged=False):
+    """Thay các khối nội dung của tài liệu bằng chunks (iterable str), ghi theo lô. Caller tự commit."""
+    db.session.execute(db.delete(DocumentContentChunk).where(DocumentContentChunk.document_id == doc.id))
+    batch = []
+    for position, chunk in enumerate(chunks):
+        batch.append({'document_id': doc.id, 'position': position, 'page_number': position + 1 if paged else None, 'content': format_content_for_display(chunk)})
+        if len(batch) >= CONTENT_CHUNK_INSERT_BATCH:
+            db.session.execute(db.insert(DocumentContentChunk), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(DocumentContentChunk), batch)
+
+def ensure_content_chunks(doc):
+    """Tài liệu trích xuất trước khi có bảng khối: chia extracted_content thành khối (không đọc lại file)."""
+    if not doc.word_count or db.session.query(DocumentContentChunk.id).filter_by(document_id=doc.id).first():
+        return
+    store_content_chunks(doc, extractors.split_text(doc.extracted_content))
+    db.session.commit()
+
+def get_content_chunks(document_id, after=-1, limit=CONTENT_CHUNKS_PER_PAGE):
+    """Returns: tuple (list khối, vị trí để tải tiếp hoặc None nếu đã hết)."""
+    chunks = content_chunks_query(document_id, after, limit + 1).all()
+    next_after = chunks[limit - 1].position if len(chunks) > limit else None
+    return chunks[:limit], next_after
 
-    if not user_keywords:
+@event.listens_for(Document, 'before_delete')
+def delete_content_chunks(mapper, connection, target):
+    connection.execute(db.delete(DocumentContentChunk).where(DocumentContentChunk.document_id == target.id))
+
+# --- Phát hiện bản gần trùng ---
+def index_near_duplicates(doc, fingerprint, flag=True):
+    """
+    Ghi dấu vân tay của tài liệu vào chỉ mục LSH và (nếu flag) đánh dấu bản gần trùng gần nhất.
+    Caller tự commit. Returns: Document gần trùng hoặc None.
+    """
+    db.session.execute(db.delete(DocumentSimhashBand).where(DocumentSimhashBand.document_id == doc.id))
+    doc.simhash = fingerprint
+    if fingerprint is None:
+        return None
+    doc_bands = simhash.bands(fingerprint)
+    db.session.execute(db.insert(DocumentSimhashBand), [{'band': band, 'value': value, 'document_id': doc.id} for band, value in doc_bands])
+    nearest = find_near_duplicates(doc)
+    if flag and nearest and doc.near_duplicate_status is None:
+        doc.near_duplicate_of_id = nearest[0][0].id
+        doc.near_duplicate_status = 'suggested'
+    return nearest[0][0] if nearest else None
+
+def find_near_duplicates(doc, limit=5):
+    """Returns: list[(Document, khoảng cách Hamming)] tăng dần, chỉ xét tài liệu trùng ít nhất một dải."""
+    if doc.simhash is None:
+        return []
+    candidate_ids = near_duplicate_candidates_query(doc)
+    candidates = db.session.query(Document.id, Document.simhash).filter(Document.id.in_(candidate_ids)).all()
+    matches = sorted((simhash.hamming_distance(doc.simhash, row.simhash), row.id) for row in candidates if row.simhash is not None)
+    matches = [(distance, doc_id) for distance, doc_id in matches if distance <= simhash.MAX_HAMMING_DISTANCE][:limit]
+    return [(db.session.get(Document, doc_id), distance) for distance, doc_id in matches]
+
+@event.listens_for(Document, 'before_delete')
+def delete_near_duplicate_index(mapper, connection, target):
+    connection.execute(db.delete(DocumentSimhashBand).where(DocumentSimhashBand.document_id == target.id))
+    connection.execute(db.update(Document).where(Document.near_duplicate_of_id == target.id).values(near_duplicate_of_id=None, near_duplicate_status=None))
+
+def needs_extraction(doc):
+    return doc.doc_type in EXTRACTABLE_DOC_TYPES and not doc.word_count and 'extracted_content' not in doc.texts
+
+def run_extraction_job(shard_key, document_id):
+    with app.app_context(), sharding.shard_context(shard_key):
+        doc = db.session.get(Document, document_id)
+        if not doc:
+            return
+        try:
+            doc.extraction_status = extraction_queue.STATUS_RUNNING
+            db.session.commit()
+            filepath = document_physical_path(doc)
+            if filepath:
+                result = extractors.extract(filepath, timeout=app.config['EXTRACTION_TIMEOUT_SECONDS'], memory_limit_mb=app.config['EXTRACTION_MEMORY_LIMIT_MB'], extension=os.path.splitext(doc.filename)[1])
+            else:
+                result = extractors.ExtractionResult(error_code=extractors.ERROR_NOT_FOUND)
+            try:
+                record_extraction_result(doc, result)
+            finally:
+                result.discard()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            record_extraction_result(doc, extractors.ExtractionResult(error_code=extractors.ERROR_CRASHED))
+            db.session.commit()
+            raise
+
+def record_extraction_result(doc, result, fingerprint=None, keyword_batch=None):
+    # fingerprint: dấu vân tay đã tính sẵn (nhập hàng loạt tính trong worker), None thì tính tại đây
+    # keyword_batch: list để caller gán từ khóa cho cả lô một lần (assign_keywords), None thì gán ngay
+    if result.ok:
+        store_content_chunks(doc, result.iter_chunks() if result.char_count else [], paged=result.extension == '.pdf')
+        # Văn bản nén, số từ và thống kê từ đều được dựng từ từng khối của spill file,
+        # không ghép cả văn bản thành một chuỗi trong tiến trình web
+        doc.word_count = store_document_text_chunks(doc, 'extracted_content', result.iter_chunks())
+        doc.page_count = result.chunk_count if result.extension == '.pdf' else None
+        index_near_duplicates(doc, fingerprint if fingerprint is not None else simhash.fingerprint(result.iter_chunks()))
+        entry = (doc, index_document_terms(doc, None, tokenizer.ChunkPhrases(result.iter_chunks)))
+        if keyword_batch is None:
+            assign_keywords([entry])
+        else:
+            keyword_batch.append(entry)
+        doc.extraction_status = extraction_queue.STATUS_DONE
+        doc.extraction_error_code = doc.extraction_error = None
+    else:
+        print(f"WARNING: Extraction failed for document {doc.id}: {result.error_code} {result.error_detail or ''}")
+        doc.extraction_status = extraction_queue.STATUS_FAILED
+        doc.extraction_error_code = result.error_code
+        doc.extraction_error = result.error_message
+
+extraction_jobs = ExtractionQueue(run_extraction_job, max_workers=app.config['EXTRACTION_WORKERS'])
+
+def reuse_extraction(doc):
+    """
+    Tài liệu có cùng nội dung với một tài liệu đã trích xuất xong: sao chép kết quả
+    (kể cả các khối nội dung, bằng INSERT ... SELECT) thay vì trích xuất lại.
+    Gọi sau flush (cần doc.id). Returns: bool.
+    """
+    if not doc.content_sha256 or not needs_extraction(doc):
+        return False
+    source = Document.query.filter(Document.content_sha256 == doc.content_sha256, Document.id != doc.id, Document.extraction_status == extraction_queue.STATUS_DONE).first()
+    if source is None:
+        return False
+    source_text = source.texts.get('extracted_content')
+    if source_text is not None:
+        doc.texts['extracted_content'] = DocumentText(field='extracted_content', data=source_text.data, size=source_text.size)
+    doc.word_count, doc.page_count = source.word_count, source.page_count
+    doc.extraction_status = extraction_queue.STATUS_DONE
+    doc.extraction_error_code = doc.extraction_error = None
+    db.session.execute(db.delete(DocumentContentChunk).where(DocumentContentChunk.document_id == doc.id))
+    db.session.execute(db.insert(DocumentContentChunk).from_select(
+        ['document_id', 'position', 'page_number', 'content'],
+        db.select(db.literal(doc.id), DocumentContentChunk.position, DocumentContentChunk.page_number, DocumentContentChunk.content).where(DocumentContentChunk.document_id == source.id)
+    ))
+    index_near_duplicates(doc, source.simhash)
+    copy_document_terms(source, doc)
+    return True
+
+def queue_extraction(doc):
+    """Đưa tài liệu (đã commit) vào hàng đợi trích xuất. Returns: bool."""
+    if not needs_extraction(doc):
         return False
+    if doc.extraction_status != extraction_queue.STATUS_QUEUED:
+        doc.extraction_status = extraction_queue.STATUS_QUEUED
+        db.session.commit()
+    shard_key = sharding.current_shard_key() if vault_shards.enabled else None
+    return extraction_jobs.submit((shard_key, doc.id))
+
+# --- Ghi tài liệu mới upload (dùng chung cho upload một file và upload nhiều file) ---
+def upload_doc_type(filename):
+    """Loại tài liệu theo phần mở rộng, None nếu không được phép upload."""
+    if allowed_file(filename): return filename.rsplit('.', 1)[1].lower()
+    if allowed_image(filename): return 'image'
+    if allowed_video(filename): return 'video'
+    return None
 
-    doc_text_for_check = (
-        (document.filename_normalized or normalize_vietnamese(document.filename)) + ' ' +
-        (normalize_vietnamese(document.category) if document.category else '') + ' ' +
-        (normalize_vietnamese(document.keywords) if document.keywords else '')
-    ).lower()
+def prepare_uploaded_document(doc, user):
+    if not doc.category: # Chỉ gán category nếu nó chưa được set (cho trường hợp link)
+        doc.category = fp.categorize_document(doc.filename, user.ultimate_goal if user else None, user.role_model_character if user else None)
+    doc.filename_normalized = normalize_vietnamese(doc.filename)
 
-    if any(re.search(r'\b' + re.escape(keyword) + r'\b', doc_text_for_check) for keyword in user_keywords):
-        return True
-    
-    return False
+def save_uploaded_documents(docs):
+    """
+    Thêm các tài liệu mới trong một transaction: dùng lại kết quả trích xuất của
+    bản trùng nội dung nếu có, commit, rồi đưa phần còn lại vào hàng đợi trích xuất.
+    Returns: set id các tài liệu đã dùng lại kết quả trích xuất.
+    """
+    db.session.add_all(docs)
+    db.session.flush()
+    reused_ids = {doc.id for doc in docs if reuse_extraction(doc)}
+    for doc in docs:
+        if doc.id not in reused_ids and needs_extraction(doc):
+            doc.extraction_status = extraction_queue.STATUS_QUEUED
+    db.session.commit()
+    for doc in docs:
+        if doc.id not in reused_ids:
+            queue_extraction(doc)
+    return reused_ids
 
 # =============================================================================
 # SECTION 4: FLASK ROUTES
 # =============================================================================
 
+#---vault shard---
+def get_shard_engine(shard_key):
+    return vault_shards.engine(shard_key, on_create=initialize_shard)
+
+def initialize_shard(shard_key):
+    # Shard mới được tạo schema bằng chính chuỗi migration, nên mọi shard luôn cùng phiên bản với database chính
+    print(f"Initializing vault shard '{shard_key}'...")
+    migrate_upgrade(directory=app.config['MIGRATIONS_DIR'], x_arg=[f'shard={shard_key}'])
+
+@app.before_request
+def select_user_vault():
+    if not vault_shards.enabled:
+        return
+    user = User.query.first()
+    shard_key = vault_shards.shard_key_for(user.id if user else 0)
+    get_shard_engine(shard_key)
+    g.vault_shard_token = sharding.set_current_shard(shard_key)
+
+@app.before_request
+def backfill_vault_goal_relevance():
+    ensure_goal_relevance()
+
+@app.teardown_request
+def release_user_vault(exc):
+    token = g.pop('vault_shard_token', None)
+    if token is not None:
+        sharding.reset_current_shard(token)
+
 #---layout---
 @app.context_processor
 def inject_user():
@@ -382,8 +1482,11 @@ def index():
     documents_on_page = []
     suggested_docs = []
     documents_data_for_js = [] 
+    search_snippets = {}
+    facet_counts = {field: {} for field in FACET_FIELDS}
 
     search_query = request.args.get('search_query', '').strip()
+    search_mode = request.args.get('search_mode', '').strip()
     category_filter = request.args.get('category', '').strip()
     available_categories = sorted(list(fp.CATEGORY_KEYWORDS.keys()))
     if fp.DEFAULT_CATEGORY not in available_categories:
@@ -401,74 +1504,63 @@ def index():
             print(f"Lỗi khi tạo người dùng demo trong index: {e}")
             
     try:
+        facet_counts = get_facet_counts()
         page = request.args.get('page', 1, type=int)
-        query = Document.query
+        query = document_listing_query(category_filter)
+        match_expression = None
+        fuzzy_ids = None
         if search_query:
             normalized_search_query = normalize_vietnamese(search_query)
-            query = query.filter(or_(Document.filename.ilike(f"%{search_query}%"), Document.filename_normalized.ilike(f"%{normalized_search_query}%"), Document.keywords.ilike(f"%{search_query}%")))
-        if category_filter:
-            query = query.filter(Document.category == category_filter)
-        query = query.order_by(Document.uploaded_date.desc())
-        pagination_data = query.paginate(page=page, per_page=ITEMS_PER_PAGE, error_out=False)
+            if is_search_index_ready():
+                if search_mode == 'fuzzy':
+                    fuzzy_ids = [doc_id for doc_id, _ in find_fuzzy_documents(normalized_search_query, limit=FUZZY_SEARCH_LIMIT)]
+                else:
+                    match_expression = search_index.build_match_expression(normalized_search_query)
+            if fuzzy_ids is not None:
+                query = query.filter(Document.id.in_(fuzzy_ids))
+            elif match_expression:
+                fts_hits = search_index.ranked_matches(match_expression)
+                query = query.join(fts_hits, fts_hits.c.doc_id == Document.id)
+            else:
+                query = query.filter(or_(Document.filename.ilike(f"%{search_query}%"), Document.filename_normalized.ilike(f"%{normalized_search_query}%"), Document.keywords.ilike(f"%{search_query}%")))
+        if search_query:
+            if fuzzy_ids:
+                query = query.order_by(case({doc_id: position for position, doc_id in enumerate(fuzzy_ids)}, value=Document.id))
+            elif match_expression:
+                query = query.order_by(fts_hits.c.rank, Document.uploaded_date.desc())
+            else:
+                query = query.order_by(Document.uploaded_date.desc(), Document.id.desc())
+            pagination_data = query.paginate(page=page, per_page=ITEMS_PER_PAGE, error_out=False)
+        else:
+            # Danh sách thường: phân trang theo con trỏ (uploaded_date, id), không OFFSET và không COUNT(*) mỗi lần tải
+            pagination_data = keyset_paginate(
+                query, Document.uploaded_date, Document.id, ITEMS_PER_PAGE,
+                after=decode_cursor(request.args.get('after')),
+                before=decode_cursor(request.args.get('before')),
+                total=facet_counts['category'].get(category_filter, 0) if category_filter else sum(facet_counts['category'].values())
+            )
         documents_on_page = pagination_data.items if pagination_data else []
-        
-        # Giả lập việc xác định tài liệu liên quan đến mục tiêu
-        for doc in documents_on_page:
-            doc.is_goal_related = check_document_relevance(doc, current_user)
 
+        # Không có kết quả chính xác (thường do gõ sai) -> tự chuyển sang tìm gần đúng
+        if match_expression and pagination_data.total == 0 and page == 1:
+            return redirect(url_for('index', search_query=search_query, category=category_filter, search_mode='fuzzy'))
+        if match_expression:
+            search_snippets = search_index.snippets_for(db.session, match_expression, [doc.id for doc in documents_on_page])
+        
         # Phần gợi ý tài liệu
         try:
-            base_query_for_suggestions = Document.query.filter(
-                or_(Document.last_viewed_date.is_(None), Document.engagement_level.is_(None), Document.context_event.is_(None))
-            )
-            if current_user and (current_user.ultimate_goal or current_user.role_model_character):
-                goal_keywords_for_suggestions = []
-                if current_user.ultimate_goal:
-                    goal_keywords_for_suggestions.extend(normalize_vietnamese(current_user.ultimate_goal).lower().split())
-                if current_user.role_model_character:
-                    goal_keywords_for_suggestions.extend(normalize_vietnamese(current_user.role_model_character).lower().split())
-                
-                goal_conditions_for_suggestions = []
-                for keyword in set(goal_keywords_for_suggestions):
-                    goal_conditions_for_suggestions.append(or_(
-                        Document.filename_normalized.ilike(f"%{keyword}%"),
-                        Document.keywords.ilike(f"%{keyword}%"),
-                        Document.category.ilike(f"%{keyword}%")
-                    ))
-                
-                if goal_conditions_for_suggestions:
-                    goal_related_docs = base_query_for_suggestions.filter(or_(*goal_conditions_for_suggestions)).limit(3).all()
-                    suggested_docs.extend(goal_related_docs)
-                    
-                    needed_more = 3 - len(suggested_docs)
-                    if needed_more > 0:
-                        existing_ids = [doc.id for doc in suggested_docs]
-                        random_docs = base_query_for_suggestions.filter(Document.id.notin_(existing_ids)).limit(needed_more).all()
-                        suggested_docs.extend(random_docs)
-                    
-                    random.shuffle(suggested_docs)
-                    suggested_docs = suggested_docs[:3]
-                else:
-                    suggested_docs_ids = db.session.query(Document.id).filter(or_(Document.last_viewed_date.is_(None), Document.engagement_level.is_(None), Document.context_event.is_(None))).limit(20).all()
-                    if suggested_docs_ids:
-                        random_id_tuples = random.sample(suggested_docs_ids, min(len(suggested_docs_ids), 3))
-                        random_ids = [r[0] for r in random_id_tuples]
-                        suggested_docs = Document.query.filter(Document.id.in_(random_ids)).all()
-            else:
-                suggested_docs_ids = db.session.query(Document.id).filter(or_(Document.last_viewed_date.is_(None), Document.engagement_level.is_(None), Document.context_event.is_(None))).limit(20).all()
-                if suggested_docs_ids:
-                    random_id_tuples = random.sample(suggested_docs_ids, min(len(suggested_docs_ids), 3))
-                    random_ids = [r[0] for r in random_id_tuples]
-                    suggested_docs = Document.query.filter(Document.id.in_(random_ids)).all()
+            # Đọc top-k theo chỉ mục goal_score, bổ sung ngẫu nhiên nếu chưa đủ 3
+            suggested_docs = goal_suggestions_query(3).all()
+            needed_more = 3 - len(suggested_docs)
+            if needed_more > 0:
+                existing_ids = [doc.id for doc in suggested_docs]
+                suggested_docs.extend(random_sample(unreviewed_documents_query(existing_ids), Document.id, needed_more))
+            random.shuffle(suggested_docs)
 
         except Exception as suggest_err:
             print(f"WARNING: Cannot get suggested docs based on goal: {suggest_err}")
             traceback.print_exc()
-            suggested_docs_ids = db.session.query(Document.id).filter(or_(Document.last_viewed_date.is_(None), Document.engagement_level.is_(None), Document.context_event.is_(None))).limit(20).all()
-            if suggested_docs_ids:
-                random_id_tuples = random.sample(suggested_docs_ids, min(len(suggested_docs_ids), 3))
-                random_ids = [r[0] for r in random_id_tuples]
-                suggested_docs = Document.query.filter(Document.id.in_(random_ids)).all()
+            suggested_docs = random_sample(unreviewed_documents_query(), Document.id, 3)
         
         for doc in documents_on_page:
             doc_dict = {
@@ -481,7 +1573,7 @@ def index():
                 'last_viewed_date': doc.last_viewed_date.isoformat() if doc.last_viewed_date else None,
                 'engagement_level': doc.engagement_level,
                 'context_event': doc.context_event,
-                'is_goal_related': getattr(doc, 'is_goal_related', False)
+                'is_goal_related': doc.is_goal_related
             }
             documents_data_for_js.append(doc_dict)
 
@@ -492,19 +1584,34 @@ def index():
         
     try:
         version = int(time.time())
-        return render_template('index.html', pagination=pagination_data, documents=documents_on_page, documents_data_for_js=documents_data_for_js, categories=available_categories, search_query=search_query, category_filter=category_filter, default_category=fp.DEFAULT_CATEGORY, suggested_docs=suggested_docs,today=date.today(), version=version, timedelta=timedelta)
+        return render_template('index.html', pagination=pagination_data, documents=documents_on_page, documents_data_for_js=documents_data_for_js, categories=available_categories, search_query=search_query, search_mode=search_mode, category_filter=category_filter, default_category=fp.DEFAULT_CATEGORY, suggested_docs=suggested_docs, search_snippets=search_snippets, facet_counts=facet_counts, today=date.today(), version=version, timedelta=timedelta)
     except Exception as render_err:
         flash(f"Lỗi nghiêm trọng khi hiển thị trang: {render_err}", "danger")
         print(f"ERROR rendering template: {render_err}")
         traceback.print_exc()
         return "Đã xảy ra lỗi nghiêm trọng khi tải trang.", 500
     
+@app.route('/api/search_suggestions')
+def search_suggestions():
+    prefix = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', TYPEAHEAD_LIMIT, type=int), 20)
+    if not prefix:
+        return jsonify({"suggestions": []})
+    try:
+        return jsonify({"suggestions": ensure_typeahead_index().complete(prefix, limit=limit)})
+    except Exception as e:
+        print(f"ERROR in /api/search_suggestions: {e}")
+        traceback.print_exc()
+        return jsonify({"error": "Lỗi server khi lấy gợi ý tìm kiếm."}), 500
+
 @app.route('/upload', methods=['GET', 'POST'], endpoint='upload_file')
 def upload_file_route():
     if request.method == 'POST':
         current_user = User.query.first()
         upload_type = request.form.get('upload_type')
         doc_to_save = None
+        same_content_doc = None
+        content_sha256 = None
         learning_goal_form = request.form.get('learning_goal', '').strip()
         deadline_str = request.form.get('deadline', '').strip()
         deadline_date = None
@@ -525,10 +1632,10 @@ def upload_file_route():
                 
                 filename = secure_filename(file.filename)
                 filepath = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                if Document.query.filter_by(filepath=filepath).first():
+                if document_by_filepath_query(filepath).first():
                     raise ValueError(f'File "{filename}" đã tồn tại.')
-                file.save(filepath)
-                doc_to_save = Document(filename=filename, filepath=filepath, doc_type=filename.rsplit('.', 1)[1].lower())
+                content_sha256, same_content_doc = store_uploaded_file(file)
+                doc_to_save = Document(filename=filename, filepath=filepath, doc_type=filename.rsplit('.', 1)[1].lower(), content_sha256=content_sha256)
 
             elif upload_type == 'image':
                 file = request.files.get('document_image')
@@ -539,11 +1646,11 @@ def upload_file_route():
 
                 filename = secure_filename(file.filename)
                 filepath = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                if Document.query.filter_by(filepath=filepath).first():
+                if document_by_filepath_query(filepath).first():
                     raise ValueError(f'Ảnh "{filename}" đã tồn tại.')
                 
-                file.save(filepath)
-                doc_to_save = Document(filename=filename, filepath=filepath, doc_type='image', category="Hình ảnh")
+                content_sha256, same_content_doc = store_uploaded_file(file)
+                doc_to_save = Document(filename=filename, filepath=filepath, doc_type='image', category="Hình ảnh", content_sha256=content_sha256)
 
             elif upload_type == 'video':
                 file = request.files.get('document_video')
@@ -554,11 +1661,11 @@ def upload_file_route():
 
                 filename = secure_filename(file.filename)
                 filepath = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-                if Document.query.filter_by(filepath=filepath).first():
+                if document_by_filepath_query(filepath).first():
                     raise ValueError(f'Video "{filename}" đã tồn tại.')
 
-                file.save(filepath)
-                doc_to_save = Document(filename=filename, filepath=filepath, doc_type='video', category="Video")
+                content_sha256, same_content_doc = store_uploaded_file(file)
+                doc_to_save = Document(filename=filename, filepath=filepath, doc_type='video', category="Video", content_sha256=content_sha256)
 
             elif upload_type in ['link', 'googledrive_link']:
                 url_key = 'document_url' if upload_type == 'link' else 'document_gdrive_link'
@@ -567,7 +1674,7 @@ def upload_file_route():
                     raise ValueError('Chưa nhập URL.')
                 if is_google_drive_link(doc_url) and upload_type == 'link':
                     raise ValueError('Vui lòng dùng mục "Link Google Drive" cho link này.')
-                if Document.query.filter_by(filepath=doc_url).first():
+                if document_by_filepath_query(doc_url).first():
                     raise ValueError(f'Link "{doc_url}" đã tồn tại.')
                 
                 category = "Google Drive" if upload_type == 'googledrive_link' else "Link Web"
@@ -578,21 +1685,16 @@ def upload_file_route():
 
             # Nếu đã có đối tượng doc_to_save từ một trong các nhánh trên
             if doc_to_save:
-                is_relevant = check_document_relevance(doc_to_save, current_user)
-
                 # --- GÁN CÁC THÔNG TIN VÀO ĐỐI TƯỢNG DOCUMENT ---
-                doc_to_save.is_goal_related = is_relevant
-                if not doc_to_save.category: # Chỉ gán category nếu nó chưa được set (cho trường hợp link)
-                    doc_to_save.category = fp.categorize_document(doc_to_save.filename, current_user.ultimate_goal if current_user else None, current_user.role_model_character if current_user else None)
-                
-                doc_to_save.filename_normalized = normalize_vietnamese(doc_to_save.filename)
+                prepare_uploaded_document(doc_to_save, current_user)
                 doc_to_save.learning_goal = learning_goal_form if learning_goal_form else None
                 doc_to_save.deadline = deadline_date
                 
                 # --- LƯU VÀO DATABASE ---
-                db.session.add(doc_to_save)
-                db.session.commit()
+                save_uploaded_documents([doc_to_save])
 
+                if same_content_doc:
+                    flash(f'Nội dung file trùng với "{same_content_doc.filename}"; dùng lại bản lưu và kết quả trích xuất đã có.', 'info')
                 flash(f'Đã tải lên thành công "{doc_to_save.filename}".', 'info')
                 return redirect(url_for('view_document', document_id=doc_to_save.id, review='true'))
 
@@ -602,10 +1704,110 @@ def upload_file_route():
         except Exception as e:
             flash(f'Lỗi không xác định khi upload: {e}', 'danger')
             traceback.print_exc()
+            db.session.rollback()
+            discard_unreferenced_blobs([content_sha256])
             return redirect(request.url)
 
     return render_template('upload.html')
 
+@app.route('/api/upload_batch', methods=['POST'])
+def upload_batch():
+    """
+    Upload nhiều file trong một request multipart (trường 'files').
+    File được ghi vào kho song song, tài liệu được commit theo lô, trích xuất chạy nền.
+    Returns: 202 kèm batch_id và trạng thái từng file; theo dõi tiếp qua status_url.
+    """
+    files = [file for file in request.files.getlist('files') if file and file.filename]
+    if not files:
+        return jsonify({"error": "Chưa chọn file nào."}), 400
+    if len(files) > app.config['BATCH_UPLOAD_MAX_FILES']:
+        return jsonify({"error": f"Tối đa {app.config['BATCH_UPLOAD_MAX_FILES']} file mỗi lần."}), 400
+
+    current_user = User.query.first()
+    batch_id = uuid.uuid4().hex
+    upload_dir = os.path.abspath(app.config['UPLOAD_FOLDER'])
+    safe_names = [secure_filename(file.filename) for file in files]
+    items = [UploadBatchItem(batch_id=batch_id, position=position, filename=(safe_name or file.filename)[:200], status='pending') for position, (file, safe_name) in enumerate(zip(files, safe_names))]
+
+    # Kiểm tra định dạng và trùng tên bằng một truy vấn cho cả lô
+    filepaths = [os.path.join(upload_dir, safe_name) for safe_name in safe_names]
+    existing_filepaths = {row.filepath for row in db.session.query(Document.filepath).filter(Document.filepath.in_(filepaths))}
+    seen_filepaths = set()
+    accepted = []
+    for item, file, filepath, safe_name in zip(items, files, filepaths, safe_names):
+        if not safe_name or not upload_doc_type(safe_name):
+            item.status, item.message = 'rejected', 'Định dạng file không hợp lệ.'
+        elif filepath in existing_filepaths or filepath in seen_filepaths:
+            item.status, item.message = 'duplicate', f'File "{item.filename}" đã tồn tại.'
+        else:
+            seen_filepaths.add(filepath)
+            accepted.append((item, file, filepath))
+
+    # Ghi file vào kho song song (băm trong lúc ghi); lấy kho trước vì luồng worker không mang shard hiện tại
+    blob_store = current_blob_store()
+    with ThreadPoolExecutor(max_workers=app.config['UPLOAD_SAVE_WORKERS']) as executor:
+        futures = [executor.submit(blob_store.save_stream, file.stream) for _, file, _ in accepted]
+    pending_docs = []
+    for (item, _, filepath), future in zip(accepted, futures):
+        try:
+            content_sha256, _, _ = future.result()
+        except Exception as e:
+            item.status, item.message = 'error', f'Lỗi khi lưu file: {e}'[:300]
+            continue
+        doc_type = upload_doc_type(item.filename)
+        doc = Document(filename=item.filename, filepath=filepath, doc_type=doc_type, content_sha256=content_sha256,
+                       category={'image': "Hình ảnh", 'video': "Video"}.get(doc_type))
+        prepare_uploaded_document(doc, current_user)
+        pending_docs.append((item, doc))
+
+    batch_size = app.config['UPLOAD_COMMIT_BATCH_SIZE']
+    for start in range(0, len(pending_docs), batch_size):
+        chunk = pending_docs[start:start + batch_size]
+        try:
+            reused_ids = save_uploaded_documents([doc for _, doc in chunk])
+            for item, doc in chunk:
+                item.status, item.document_id = 'saved', doc.id
+                if doc.id in reused_ids:
+                    item.message = 'Nội dung trùng với tài liệu đã có; dùng lại kết quả trích xuất.'
+        except Exception as e:
+            db.session.rollback()
+            traceback.print_exc()
+            for item, _ in chunk:
+                item.status, item.message = 'error', f'Lỗi khi lưu vào database: {e}'[:300]
+            discard_unreferenced_blobs(doc.content_sha256 for _, doc in chunk)
+
+    db.session.add_all(items)
+    db.session.commit()
+    return jsonify(upload_batch_report(batch_id)), 202
+
+def upload_batch_report(batch_id):
+    rows = db.session.query(UploadBatchItem, Document.extraction_status, Document.extraction_error).outerjoin(Document, Document.id == UploadBatchItem.document_id).filter(UploadBatchItem.batch_id == batch_id).order_by(UploadBatchItem.position).all()
+    files = [{
+        "filename": item.filename,
+        "status": item.status,
+        "message": item.message,
+        "document_id": item.document_id,
+        "extraction_status": extraction_status,
+        "extraction_error": extraction_error,
+    } for item, extraction_status, extraction_error in rows]
+    summary = {}
+    for file_report in files:
+        summary[file_report["status"]] = summary.get(file_report["status"], 0) + 1
+    return {
+        "batch_id": batch_id,
+        "status_url": url_for('upload_batch_status', batch_id=batch_id),
+        "done": not any(file_report["extraction_status"] in extraction_queue.PENDING_STATUSES for file_report in files),
+        "summary": summary,
+        "files": files,
+    }
+
+@app.route('/api/upload_batch/<batch_id>')
+def upload_batch_status(batch_id):
+    report = upload_batch_report(batch_id)
+    if not report["files"]:
+        return jsonify({"error": "Không tìm thấy lô upload."}), 404
+    return jsonify(report)
+
 @app.route('/finalize_upload', methods=['POST'])
 def finalize_upload():
     action = request.form.get('action')
@@ -624,25 +1826,26 @@ def finalize_upload():
     # Nếu hành động là lưu (vào Focus hoặc Sandbox)
     is_goal_related = (action == 'save_to_focus')
     permanent_filepath = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-    if os.path.exists(permanent_filepath):
+    if document_by_filepath_query(permanent_filepath).first():
         flash(f'File "{filename}" đã tồn tại. Vui lòng thử lại với tên khác.', 'danger')
         if os.path.exists(temp_filepath):
             os.remove(temp_filepath)
         return redirect(url_for('upload_file'))
         
+    content_sha256 = None
     try:
-        os.rename(temp_filepath, permanent_filepath)
+        content_sha256, _, _ = current_blob_store().save_file(temp_filepath, move=True)
         category = fp.categorize_document(filename)
         doc_to_save = Document(
             filename=filename, 
             filepath=permanent_filepath,
             doc_type=filename.rsplit('.', 1)[1].lower(), 
             category=category,
-            is_goal_related=is_goal_related,
-            filename_normalized=normalize_vietnamese(filename)
+            goal_related_override=is_goal_related,
+            filename_normalized=normalize_vietnamese(filename),
+            content_sha256=content_sha256
         )
-        db.session.add(doc_to_save)
-        db.session.commit()
+        save_uploaded_documents([doc_to_save])
 
         if is_goal_related:
             flash(f'Đã lưu "{filename}" vào Focus Workspace!', 'success')
@@ -654,6 +1857,8 @@ def finalize_upload():
     except Exception as e:
         flash(f'Lỗi nghiêm trọng khi lưu file: {e}', 'danger')
         traceback.print_exc()
+        db.session.rollback()
+        discard_unreferenced_blobs([content_sha256])
         if os.path.exists(temp_filepath): 
              os.remove(temp_filepath)
         return redirect(url_for('upload_file'))
@@ -664,8 +1869,8 @@ def study_timeline():
     try:
         today_start_utc = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
         today_end_utc = today_start_utc + timedelta(days=1)
-        docs_viewed_today_count = db.session.query(Document.id).filter(Document.last_viewed_date.between(today_start_utc, today_end_utc)).count()
-        docs_summarized_count = db.session.query(Document.id).filter(Document.user_summary.isnot(None) & (Document.user_summary != '')).count()
+        docs_viewed_today_count = documents_viewed_between_query(today_start_utc, today_end_utc).count()
+        docs_summarized_count = summarized_documents_query().count()
     except Exception as e: print(f"Error fetching timeline stats: {e}")
 
     streak_days = random.randint(0, 20); avg_session_time = random.randint(10, 45); review_queue = []
@@ -686,9 +1891,23 @@ def study_timeline():
 def download_file(document_id):
     doc = db.session.get(Document, document_id)
     if not doc or doc.doc_type in ['link', 'googledrive_link']: abort(404)
-    try: return send_from_directory(app.config['UPLOAD_FOLDER'], doc.filename, as_attachment=True)
+    try:
+        if doc.content_sha256:
+            return send_file(current_blob_store().path_for(doc.content_sha256), as_attachment=True, download_name=doc.filename)
+        return send_from_directory(app.config['UPLOAD_FOLDER'], doc.filename, as_attachment=True)
     except Exception as e: flash(f"Lỗi tải file: {e}", "danger"); return redirect(url_for('view_document', document_id=document_id))
 
+@app.route('/export')
+def export_vault():
+    """Tải về bản sao lưu toàn bộ vault (.tar.gz), được sinh và gửi dần theo từng khối."""
+    shard_key = sharding.current_shard_key() if vault_shards.enabled else None
+    def generate():
+        # Luồng phản hồi chạy sau khi view trả về: đặt lại shard cho chắc chắn
+        with sharding.shard_context(shard_key):
+            yield from vault_export_stream()
+    download_name = f"studyvault-{datetime.now().strftime('%Y%m%d-%H%M%S')}.tar.gz"
+    return Response(stream_with_context(generate()), mimetype='application/gzip', headers={'Content-Disposition': f'attachment; filename="{download_name}"'})
+
 @app.route('/document/<int:document_id>', methods=['GET', 'POST'])
 def view_document(document_id):
     doc = db.session.get(Document, document_id)
@@ -727,37 +1946,26 @@ def view_document(document_id):
             flash(f'Lỗi khi xử lý yêu cầu: {e}', 'danger')
         return redirect(url_for('view_document', document_id=document_id))
             
-    physical_filepath_to_check = None
-    if doc.doc_type not in ['link', 'googledrive_link']:
-        try:
-            upload_dir = os.path.abspath(app.config['UPLOAD_FOLDER'])
-            potential_paths = [os.path.join(upload_dir, secure_filename(doc.filename)), os.path.join(upload_dir, doc.filename)]
-            for path in potential_paths:
-                if os.path.exists(path): physical_filepath_to_check = path; break
-        except Exception as e: print(f"ERROR constructing file path: {e}")
-            
     try:
         doc.last_viewed_date = datetime.now(timezone.utc)
-        if doc.doc_type in ['pdf', 'docx', 'txt', 'file'] and not doc.extracted_content and physical_filepath_to_check:
-            temp_content = fp.extract_text(physical_filepath_to_check)
-            doc.extracted_content = temp_content if temp_content and "[Lỗi" not in temp_content else "[File trống hoặc không có nội dung văn bản]"
         db.session.commit()
+        # Tài liệu cũ chưa từng được trích xuất: đưa vào hàng đợi thay vì đọc file trong request
+        if needs_extraction(doc) and doc.extraction_status is None and document_physical_path(doc):
+            queue_extraction(doc)
     except Exception as e: db.session.rollback(); print(f"ERROR updating doc on view: {e}")
 
-    extracted_text_content_for_view = None
-    if doc.extracted_content and "[Lỗi" not in doc.extracted_content:
-        if '\n' not in doc.extracted_content:
-            temp_text = doc.extracted_content
-            temp_text = re.sub(r':\s*', ':\n\n', temp_text)
-            temp_text = re.sub(r'([.?!])\s+', r'\1\n', temp_text)
-            extracted_text_content_for_view = temp_text
-        else:
-            extracted_text_content_for_view = doc.extracted_content
+    content_chunks, next_content_position = [], None
+    try:
+        ensure_content_chunks(doc)
+        content_chunks, next_content_position = get_content_chunks(doc.id)
+    except Exception as e: db.session.rollback(); print(f"ERROR loading content chunks: {e}")
     
+    near_duplicate = db.session.get(Document, doc.near_duplicate_of_id) if doc.near_duplicate_of_id and doc.near_duplicate_status in ('suggested', 'linked') else None
+
     related_docs = []
     if doc.category and doc.category != fp.DEFAULT_CATEGORY:
         try:
-            related_docs = get_random_docs(Document.query.filter(and_(Document.category == doc.category, Document.id != doc.id)), 5)
+            related_docs = random_sample(related_documents_query(doc), Document.id, 5)
         except Exception as e: print(f"Error finding related docs: {e}")
 
     available_categories = sorted(list(fp.CATEGORY_KEYWORDS.keys()))
@@ -765,7 +1973,62 @@ def view_document(document_id):
         available_categories.append(fp.DEFAULT_CATEGORY)
         available_categories.sort()
 
-    return render_template('view_document.html', doc=doc, is_new_upload_for_review=is_new_upload_for_review, extracted_content=extracted_text_content_for_view, related_docs=related_docs,  timedelta=timedelta, categories=available_categories, default_category=fp.DEFAULT_CATEGORY)
+    return render_template('view_document.html', doc=doc, is_new_upload_for_review=is_new_upload_for_review, content_chunks=content_chunks, next_content_position=next_content_position, near_duplicate=near_duplicate, related_docs=related_docs,  timedelta=timedelta, categories=available_categories, default_category=fp.DEFAULT_CATEGORY)
+
+@app.route('/document/<int:document_id>/extraction_status')
+def extraction_status(document_id):
+    doc = db.session.get(Document, document_id)
+    if not doc:
+        return jsonify({"error": "Tài liệu không tồn tại."}), 404
+    return jsonify({"status": doc.extraction_status, "has_content": bool(doc.word_count), "error_code": doc.extraction_error_code, "error": doc.extraction_error})
+
+@app.route('/api/document/<int:document_id>/content')
+def get_document_content(document_id):
+    if not db.session.get(Document, document_id):
+        return jsonify({"error": "Tài liệu không tồn tại."}), 404
+    after = request.args.get('after', -1, type=int)
+    limit = min(max(request.args.get('limit', CONTENT_CHUNKS_PER_PAGE, type=int), 1), 50)
+    chunks, next_after = get_content_chunks(document_id, after, limit)
+    return jsonify({
+        "chunks": [{"position": chunk.position, "page_number": chunk.page_number, "content": chunk.content} for chunk in chunks],
+        "next_after": next_after
+    })
+
+@app.route('/document/<int:document_id>/near_duplicate', methods=['POST'])
+def resolve_near_duplicate(document_id):
+    doc = db.session.get(Document, document_id)
+    original = db.session.get(Document, doc.near_duplicate_of_id) if doc and doc.near_duplicate_of_id else None
+    if not doc or not original:
+        flash("Không tìm thấy bản gần trùng.", "warning")
+        return redirect(url_for('view_document', document_id=document_id) if doc else url_for('index'))
+    action = request.form.get('action')
+    try:
+        if action == 'link':
+            doc.near_duplicate_status = 'linked'
+            db.session.commit()
+            flash(f'Đã liên kết với "{original.filename}" như một phiên bản khác.', 'success')
+        elif action == 'dismiss':
+            doc.near_duplicate_of_id = None
+            doc.near_duplicate_status = 'dismissed'
+            db.session.commit()
+            flash('Đã giữ tài liệu như một tài liệu riêng.', 'info')
+        elif action == 'merge':
+            # Giữ tài liệu cũ; chuyển các ghi chú người dùng đã nhập (nếu tài liệu cũ còn trống) rồi xóa bản mới
+            for field in ('custom_note', 'user_summary', 'context_event', 'engagement_level', 'deadline'):
+                if getattr(original, field) is None and getattr(doc, field) is not None:
+                    setattr(original, field, getattr(doc, field))
+            content_sha256, filename = doc.content_sha256, doc.filename
+            db.session.delete(doc)
+            db.session.commit()
+            release_blob(content_sha256)
+            flash(f'Đã gộp "{filename}" vào "{original.filename}".', 'success')
+            return redirect(url_for('view_document', document_id=original.id))
+        else:
+            flash('Yêu cầu không hợp lệ.', 'warning')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Lỗi khi xử lý bản gần trùng: {e}', 'danger')
+    return redirect(url_for('view_document', document_id=document_id))
 
 @app.route('/delete/<int:document_id>', methods=['POST'])
 def delete_document(document_id):
@@ -774,12 +2037,14 @@ def delete_document(document_id):
         flash("Tài liệu không tồn tại.", "warning")
         return redirect(url_for('index'))
     filepath_to_delete = None
-    if doc.doc_type not in ['link', 'googledrive_link']:
+    if doc.doc_type not in ['link', 'googledrive_link'] and not doc.content_sha256:
         filepath_to_delete = os.path.join(app.config['UPLOAD_FOLDER'], doc.filename)
     filename_for_flash = doc.filename
+    content_sha256 = doc.content_sha256
     try:
         db.session.delete(doc)
         db.session.commit()
+        release_blob(content_sha256)
         if filepath_to_delete and os.path.exists(filepath_to_delete):
             os.remove(filepath_to_delete)
         flash(f'Đã xóa thành công tài liệu "{filename_for_flash}".', 'success')
@@ -809,7 +2074,8 @@ def toggle_goal_related(document_id):
     if not doc:
         return jsonify({"error": "Tài liệu không tồn tại."}), 404
     try:
-        doc.is_goal_related = not getattr(doc, 'is_goal_related', False)
+        # Ghi nhớ lựa chọn thủ công để lần tính lại theo mục tiêu/từ khóa sau không ghi đè
+        doc.goal_related_override = not getattr(doc, 'is_goal_related', False)
         db.session.commit()
         return jsonify({
             "message": "Cập nhật thành công!",
@@ -837,7 +2103,7 @@ def clarity_report(doc_id):
 
     # --- TẠO DỮ LIỆU GIẢ LẬP CHO DEMO ---
     transcript = []
-    workspace_items = WorkspaceItem.query.filter_by(document_id=doc_id).order_by(WorkspaceItem.order).all()
+    workspace_items = workspace_items_query(doc_id).all()
     workspace_tree = build_tree(workspace_items)
     q_nodes = [item for item in workspace_items if not item.children][:3] 
 
@@ -884,6 +2150,7 @@ def handle_profile_setup_post():
     selected_avatar = request.form.get('selected_avatar')
     workspace_color_theme = request.form.get('workspace_color_theme')
     
+    previous_goals = (user.ultimate_goal, user.role_model_character, user.specific_study_goal)
     # Cập nhật các trường thông tin cho đối tượng 'user'
     user.specific_study_goal = request.form.get('specific_study_goal')
     user.expected_completion_time = request.form.get('expected_completion_time')
@@ -893,12 +2160,15 @@ def handle_profile_setup_post():
     user.personal_learning_challenges = json.dumps(personal_learning_challenges) if personal_learning_challenges else None
     studyvault_expectations = request.form.getlist('studyvault_expectations')
     user.studyvault_expectations = json.dumps(studyvault_expectations) if studyvault_expectations else None
+    goal_changed = previous_goals != (ultimate_goal, role_model_character, user.specific_study_goal)
     user.ultimate_goal = ultimate_goal
     user.role_model_character = role_model_character
     user.selected_avatar = selected_avatar
     user.workspace_color_theme = workspace_color_theme
 
     try:
+        if goal_changed:
+            recompute_goal_relevance(user)
         db.session.commit()
         flash('Thiết lập hồ sơ thành công!', 'success')
     except Exception as e:
@@ -969,7 +2239,7 @@ def get_workspace_data(doc_id):
         return jsonify({"error": "Tài liệu không tồn tại."}), 404
 
     try:
-        all_items = WorkspaceItem.query.filter_by(document_id=doc_id).order_by(WorkspaceItem.order).all()
+        all_items = workspace_items_query(doc_id).all()
         workspace_tree = build_tree(all_items)
         return jsonify(workspace_tree)
 
@@ -990,10 +2260,7 @@ def create_workspace_item(doc_id):
     content = data.get('content', '')
     parent_id = data.get('parent_id')
     try:
-        if parent_id:
-            max_order = db.session.query(sql_func.max(WorkspaceItem.order)).filter_by(parent_id=parent_id).scalar() or 0
-        else:
-            max_order = db.session.query(sql_func.max(WorkspaceItem.order)).filter_by(document_id=doc_id, parent_id=None).scalar() or 0
+        max_order = max_item_order_query(doc_id, parent_id).scalar() or 0
 
         new_item = WorkspaceItem(
             title=title, content=content, order=max_order + 1,
@@ -1111,12 +2378,13 @@ def tokenize_content():
         if not text_content:
             return jsonify({"error": "Không có nội dung để phân tích."}), 400
 
-        normalized_content = normalize_vietnamese(text_content)
         found_keywords = set()
 
+        # Tách nội dung một lần; mỗi từ khóa (tối đa 3 âm tiết) chỉ còn là một phép tra tập hợp
+        content_ngrams = tokenizer.ngrams(tokenizer.normalized_words(text_content))
         keywords_for_category = fp.CATEGORY_KEYWORDS.get(category, [])
         for keyword in keywords_for_category:
-            if re.search(r'\b' + re.escape(normalize_vietnamese(keyword)) + r'\b', normalized_content):
+            if tuple(tokenizer.normalized_words(keyword)) in content_ngrams:
                 found_keywords.add(keyword.capitalize())
 
         
@@ -1136,7 +2404,7 @@ def get_recall_data():
     all_recall_items = []
     doc_ids_used = set()
     try:
-        docs_with_summary = Document.query.filter(Document.user_summary.isnot(None), Document.user_summary != '').all()
+        docs_with_summary = random_sample(summarized_documents_sample_query(), Document.id, 2)
         if docs_with_summary:
             random.shuffle(docs_with_summary)
             for doc in docs_with_summary:
@@ -1151,14 +2419,16 @@ def get_recall_data():
     needed = TOTAL_QUESTIONS_TO_RETURN - len(all_recall_items)
     if needed > 0:
         try:
-            docs_with_content = Document.query.filter(Document.id.notin_(list(doc_ids_used)), Document.extracted_content.isnot(None), Document.extracted_content != '', Document.extracted_content.notlike('[%')).all()
+            # Chỉ tải (và giải nén) nội dung của vài tài liệu được chọn ngẫu nhiên
+            docs_with_content = random_sample(extracted_documents_query(doc_ids_used), Document.id, needed * 3)
             if docs_with_content:
                 random.shuffle(docs_with_content)
                 for doc in docs_with_content:
                     if len(all_recall_items) >= TOTAL_QUESTIONS_TO_RETURN: break
                     try:
+                        vocabulary = document_term_counts(doc.id)
                         for _ in range(random.randint(1, 2)):
-                            q = create_fill_in_the_blank_question(doc.extracted_content)
+                            q = create_fill_in_the_blank_question(doc.extracted_content, vocabulary=vocabulary)
                             if q and len(all_recall_items) < TOTAL_QUESTIONS_TO_RETURN:
                                 all_recall_items.append({ "q": q["q"], "a": q["a"], "cat": doc.category or "Từ tài liệu", "source_doc_id": doc.id, "type": "fill_blank" })
                                 doc_ids_used.add(doc.id)
@@ -1225,6 +2495,10 @@ def ai_chat_converse():
             found_doc = Document.query.filter(
                 sql_func.replace(Document.filename_normalized, '_', ' ').ilike(f"%{search_query_with_spaces}%")
             ).first()
+            if not found_doc:
+                fuzzy_matches = find_fuzzy_documents(search_query_with_spaces, limit=1)
+                if fuzzy_matches:
+                    found_doc = db.session.get(Document, fuzzy_matches[0][0])
             
         if found_doc:
             if is_summary_request:
@@ -1362,7 +2636,7 @@ def toggle_objective(obj_id):
 def get_objectives_tree(doc_id):
     if not db.session.get(Document, doc_id):
         return jsonify({"error": "Tài liệu không tồn tại."}), 404
-    all_objectives = LearningObjective.query.filter_by(document_id=doc_id).all()
+    all_objectives = objectives_query(doc_id).all()
     tree = FileProcessor.build_objectives_tree(all_objectives) 
     return jsonify(tree)
 
@@ -1371,8 +2645,8 @@ def get_document_network_mermaid(document_id):
     doc = db.session.get(Document, document_id)
     if not doc:
         return "Tài liệu không tồn tại", 404
-    all_items = WorkspaceItem.query.filter_by(document_id=document_id).order_by(WorkspaceItem.order).all()
-    all_relations = WorkspaceItemRelation.query.filter_by(document_id=document_id).all()
+    all_items = workspace_items_query(document_id).all()
+    all_relations = workspace_relations_query(document_id).all()
     mermaid_data = generate_mermaid_graph(all_items, all_relations)
 
     return mermaid_data, 200, {'Content-Type': 'text/plain; charset=utf-8'}
@@ -1598,7 +2872,7 @@ def find_and_merge_nodes(doc_id):
         return jsonify({"error": "Tài liệu không tồn tại"}), 404
 
     try:
-        nodes = WorkspaceItem.query.filter_by(document_id=doc_id).order_by(WorkspaceItem.id.desc()).all()
+        nodes = latest_workspace_items_query(doc_id).all()
         if len(nodes) < 2:
             return jsonify({"error": "Không có đủ node để thực hiện gộp."}), 400
         node_to_be_merged = nodes[0]  
@@ -1682,8 +2956,8 @@ def check_simplification():
 def get_workspace_for_graph(document_id):
     doc = db.session.get(Document, document_id)
     if not doc: return jsonify({"error": "Tài liệu không tồn tại"}), 404 
-    nodes = WorkspaceItem.query.filter_by(document_id=document_id).all()
-    relations = WorkspaceItemRelation.query.filter_by(document_id=document_id).all()
+    nodes = workspace_items_query(document_id).all()
+    relations = workspace_relations_query(document_id).all()
     nodes_data = [{"id": node.id, "title": node.title} for node in nodes]
     relations_data = [{"source_id": rel.source_id, "target_id": rel.target_id, "label": rel.label} for rel in relations]
     for node in nodes:
@@ -1702,8 +2976,8 @@ def add_relation(doc_id):
     target_id = data.get('target_id')
     label = data.get('label', '')
 
-    source_node = WorkspaceItem.query.filter_by(id=source_id, document_id=doc_id).first()
-    target_node = WorkspaceItem.query.filter_by(id=target_id, document_id=doc_id).first()
+    source_node = document_workspace_item_query(source_id, doc_id).first()
+    target_node = document_workspace_item_query(target_id, doc_id).first()
 
     if not source_node or not target_node: return jsonify({"error": "Node nguồn hoặc đích không hợp lệ"}), 400
 
@@ -1719,15 +2993,15 @@ def execute_merge_nodes(doc_id):
         return jsonify({"error": "Tài liệu không tồn tại"}), 404
 
     try:
-        nodes = WorkspaceItem.query.filter_by(document_id=doc_id).order_by(WorkspaceItem.id.desc()).limit(2).all()
+        nodes = latest_workspace_items_query(doc_id).limit(2).all()
         
         if len(nodes) < 2:
             return jsonify({"error": "Không có đủ node để thực hiện gộp."}), 400
         source_node = nodes[0]
         target_node = nodes[1]
-        WorkspaceItem.query.filter_by(parent_id=source_node.id).update({'parent_id': target_node.id})
-        WorkspaceItemRelation.query.filter_by(source_id=source_node.id, document_id=doc_id).update({'source_id': target_node.id})
-        WorkspaceItemRelation.query.filter_by(target_id=source_node.id, document_id=doc_id).update({'target_id': target_node.id})
+        child_items_query(source_node.id).update({'parent_id': target_node.id})
+        relations_from_query(source_node.id, doc_id).update({'source_id': target_node.id})
+        relations_to_query(source_node.id, doc_id).update({'target_id': target_node.id})
         db.session.delete(source_node)
         db.session.commit()
 
@@ -1756,32 +3030,454 @@ def from_json_filter(value):
 # SECTION 6: SCRIPT EXECUTION & DB SETUP
 # =============================================================================
 def create_db():
-     if not os.path.exists(os.path.join(basedir, 'studyvault.db')):
-        with app.app_context():
+     with app.app_context():
+        if not sql_inspect(db.engine).has_table(Document.__tablename__):
             try: db.create_all(); print("Database created!")
             except Exception as e: print(f"Error creating database: {e}")
+     ensure_search_index()
 
-def backfill_normalized_names():
+def ensure_search_index():
     with app.app_context():
-        print("Starting to backfill normalized filenames...")
-       
-        docs = Document.query.filter(Document.filename_normalized.is_(None)).all()
-        if not docs:
-            print("No documents to update. All filenames are already normalized.")
-            return
+        try:
+            with db.engine.begin() as connection:
+                if search_index.install(connection):
+                    print("Full-text search index is ready.")
+                    if search_index.is_fulltext_index_empty(connection) and connection.execute(db.select(Document.id).limit(1)).first():
+                        search_index.rebuild(connection)
+                        print("Full-text search index rebuilt.")
+                    if search_index.is_trigram_index_empty(connection):
+                        docs = connection.execute(db.select(Document.id, Document.filename, Document.filename_normalized, Document.keywords, Document.category))
+                        search_index.rebuild_trigrams(connection, ((doc.id, document_trigram_terms(doc)) for doc in docs))
+                        print("Fuzzy search index rebuilt.")
+        except Exception as e:
+            print(f"Error creating full-text search index: {e}")
 
-        for doc in docs:
-            doc.filename_normalized = normalize_vietnamese(doc.filename)
+def backfill_normalized_names(batch_size=1000):
+    # Chuẩn hóa lại cả tên đã lưu: bản cũ của normalize_vietnamese ánh xạ sai 'ĩ' và bỏ sót 'ỹ' cùng chữ dạng NFD
+    with app.app_context():
+        print("Starting to backfill normalized filenames...")
+        updated, last_id = 0, 0
         try:
-            db.session.commit()
-            print(f"Successfully updated {len(docs)} documents.")
+            while True:
+                rows = db.session.execute(db.select(Document.id, Document.filename, Document.filename_normalized).where(Document.id > last_id).order_by(Document.id).limit(batch_size)).all()
+                if not rows:
+                    break
+                normalized_names = normalize_many(row.filename for row in rows)
+                changed = {row.id: name for row, name in zip(rows, normalized_names) if row.filename_normalized != name}
+                # Cập nhật qua ORM để chỉ mục tìm kiếm được đồng bộ
+                for doc in Document.query.filter(Document.id.in_(list(changed))) if changed else []:
+                    doc.filename_normalized = changed[doc.id]
+                db.session.commit()
+                updated += len(changed)
+                last_id = rows[-1].id
+            if updated:
+                print(f"Successfully updated {updated} documents.")
+            else:
+                print("No documents to update. All filenames are already normalized.")
         except Exception as e:
             db.session.rollback()
             print(f"An error occurred during backfill: {e}")
 
+def hot_route_queries():
+    """
+    Các truy vấn chạy ở mỗi request của route, dựng bằng đúng các hàm route gọi (với tham số mẫu),
+    để kiểm tra kế hoạch truy vấn. Lấy mẫu ngẫu nhiên được kiểm tra qua một lần dò id (sampling.probe_query).
+    """
+    sample_date = datetime(2025, 1, 1)
+    sample_doc = Document(id=1, category='Toán học', simhash=0x5F3759DF5F3759DF)
+    return {
+        'index: danh sách theo ngày': keyset_page_query(document_listing_query(), Document.uploaded_date, Document.id, ITEMS_PER_PAGE, after=(sample_date, 1)),
+        'index: lọc danh mục theo ngày': keyset_page_query(document_listing_query('Toán học'), Document.uploaded_date, Document.id, ITEMS_PER_PAGE, after=(sample_date, 1)),
+        'index: trang trước': keyset_page_query(document_listing_query(), Document.uploaded_date, Document.id, ITEMS_PER_PAGE, before=(sample_date, 1)),
+        'index: gợi ý theo mục tiêu': goal_suggestions_query(3),
+        'index: gợi ý ngẫu nhiên chưa xem': probe_query(unreviewed_documents_query([1, 2]), Document.id, 1),
+        'upload: kiểm tra trùng filepath': document_by_filepath_query('/uploads/sample.pdf').limit(1),
+        'upload: tra bản gần trùng (LSH)': near_duplicate_candidates_query(sample_doc),
+        'study_timeline: đã xem hôm nay': documents_viewed_between_query(sample_date, sample_date + timedelta(days=1)),
+        'study_timeline: đếm tài liệu đã tóm tắt': summarized_documents_query(),
+        'view_document: tài liệu cùng danh mục': probe_query(related_documents_query(sample_doc), Document.id, 1),
+        'view_document: khối nội dung': content_chunks_query(1, 4, CONTENT_CHUNKS_PER_PAGE + 1),
+        'recall: tài liệu có tóm tắt': probe_query(summarized_documents_sample_query(), Document.id, 1),
+        'recall: tài liệu có nội dung': probe_query(extracted_documents_query([1]), Document.id, 1),
+        'workspace: cây theo tài liệu': workspace_items_query(1),
+        'workspace: order lớn nhất theo nút cha': max_item_order_query(1, 1),
+        'workspace: order lớn nhất của nút gốc': max_item_order_query(1, None),
+        'workspace: nút con theo nút cha': child_items_query(1),
+        'network: quan hệ theo tài liệu': workspace_relations_query(1),
+        'network: nút trong tài liệu': document_workspace_item_query(1, 1),
+        'merge: nút mới nhất theo tài liệu': latest_workspace_items_query(1).limit(2),
+        'merge: quan hệ theo nút nguồn': relations_from_query(1, 1),
+        'merge: quan hệ theo nút đích': relations_to_query(1, 1),
+        'objectives: mục tiêu theo tài liệu': objectives_query(1),
+        # Nạp quan hệ lazy (không qua hàm dựng của route)
+        'objectives: mục tiêu con': LearningObjective.query.filter(with_parent(LearningObjective(id=1), LearningObjective.sub_objectives)),
+        'document: văn bản nén theo tài liệu': DocumentText.query.filter(with_parent(sample_doc, Document.texts)),
+    }
+
+def query_plan_scans():
+    """Returns: dict tên truy vấn -> (kế hoạch, list bảng bị quét toàn bộ) cho mọi truy vấn trong hot_route_queries()."""
+    results = {}
+    for name, query in hot_route_queries().items():
+        plan = explain_query_plan(db.session, query.statement)
+        results[name] = (plan, full_table_scans(plan))
+    return results
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Chạy EXPLAIN QUERY PLAN cho các truy vấn nóng; thoát với mã 1 nếu có truy vấn quét toàn bảng."""
+    if db.engine.dialect.name != 'sqlite':
+        print(f"EXPLAIN QUERY PLAN chỉ được kiểm tra trên SQLite (đang dùng {db.engine.dialect.name}).")
+        return
+    failures = []
+    for name, (plan, scans) in query_plan_scans().items():
+        print(f"[{'SCAN' if scans else ' OK '}] {name}: {' | '.join(plan)}")
+        if scans:
+            failures.append(name)
+    if failures:
+        print(f"{len(failures)} truy vấn quét toàn bảng: {', '.join(failures)}")
+        raise SystemExit(1)
+    print("Tất cả truy vấn nóng đều dùng chỉ mục.")
+
+@app.cli.group('blobs')
+def blobs_cli():
+    """Quản lý kho file theo nội dung (BLOB_STORE_DIR)."""
+
+@blobs_cli.command('import-legacy')
+def import_legacy_uploads_command():
+    """Chuyển file upload cũ (lưu phẳng theo tên trong UPLOAD_FOLDER) vào kho theo nội dung."""
+    shard_keys = vault_shards.shard_keys() if vault_shards.enabled else [None]
+    for shard_key in shard_keys:
+        with sharding.shard_context(shard_key):
+            legacy_docs = Document.query.filter(Document.content_sha256.is_(None), Document.doc_type.notin_(['link', 'googledrive_link'])).all()
+            moved = 0
+            for doc in legacy_docs:
+                path = document_physical_path(doc)
+                if not path:
+                    print(f"Bỏ qua '{doc.filename}': không tìm thấy file.")
+                    continue
+                doc.content_sha256, _, _ = current_blob_store().save_file(path, move=True)
+                db.session.commit()
+                moved += 1
+            print(f"{shard_key or 'main'}: đã chuyển {moved}/{len(legacy_docs)} file vào kho.")
+
+@blobs_cli.command('stats')
+def blob_stats_command():
+    """Số file trong kho, dung lượng và số tài liệu dùng chung nội dung."""
+    shard_keys = vault_shards.shard_keys() if vault_shards.enabled else [None]
+    for shard_key in shard_keys:
+        with sharding.shard_context(shard_key):
+            blob_count, total_size, total_refs = db.session.query(sql_func.count(StoredBlob.sha256), sql_func.coalesce(sql_func.sum(StoredBlob.size), 0), sql_func.coalesce(sql_func.sum(StoredBlob.ref_count), 0)).filter(StoredBlob.ref_count > 0).one()
+            print(f"{shard_key or 'main'}: {blob_count} file, {total_size / 1024 / 1024:.1f} MB, {total_refs} tài liệu tham chiếu ({total_refs - blob_count} bản trùng được tiết kiệm).")
+
+@blobs_cli.command('gc')
+@click.option('--min-age', default=3600, show_default=True, help='Chỉ xóa file cũ hơn số giây này (tránh file của upload đang chạy).')
+@click.option('--dry-run', is_flag=True, help='Chỉ liệt kê, không xóa.')
+def blob_gc_command(min_age, dry_run):
+    """Xóa file trong kho không có dòng stored_blob nào (còn sót lại sau upload/nhập bị lỗi)."""
+    shard_keys = vault_shards.shard_keys() if vault_shards.enabled else [None]
+    cutoff = time.time() - min_age
+    for shard_key in shard_keys:
+        with sharding.shard_context(shard_key):
+            blob_store = current_blob_store()
+            referenced = {sha256 for (sha256,) in db.session.query(StoredBlob.sha256)}
+            removed = freed = 0
+            for sha256, path in blob_store.iter_blobs():
+                if sha256 in referenced or os.path.getmtime(path) > cutoff:
+                    continue
+                removed += 1
+                freed += os.path.getsize(path)
+                if not dry_run:
+                    blob_store.delete(sha256)
+            print(f"{shard_key or 'main'}: {'sẽ xóa' if dry_run else 'đã xóa'} {removed} file không được tham chiếu ({freed / 1024 / 1024:.1f} MB).")
+
+@app.cli.command('index-near-duplicates')
+def index_near_duplicates_command():
+    """Tính dấu vân tay cho các tài liệu đã trích xuất trước khi có chỉ mục gần trùng (không đánh dấu tài liệu cũ)."""
+    shard_keys = vault_shards.shard_keys() if vault_shards.enabled else [None]
+    for shard_key in shard_keys:
+        with sharding.shard_context(shard_key):
+            doc_ids = [row.id for row in db.session.query(Document.id).filter(Document.simhash.is_(None), Document.extraction_status == extraction_queue.STATUS_DONE)]
+            for doc_id in doc_ids:
+                doc = db.session.get(Document, doc_id)
+                stored_tokens = db.session.query(DocumentTermSet.tokens).filter(DocumentTermSet.document_id == doc_id).scalar()
+                if stored_tokens:
+                    # Dùng lại chuỗi token đã lưu khi trích xuất, không đọc và tách từ lại nội dung
+                    fingerprint = simhash.fingerprint_tokens(token for phrase in tokenizer.decode_phrases(stored_tokens) for token in phrase)
+                else:
+                    chunks = (chunk.content for chunk in DocumentContentChunk.query.filter_by(document_id=doc_id).order_by(DocumentContentChunk.position).yield_per(50))
+                    fingerprint = simhash.fingerprint(chunks)
+                index_near_duplicates(doc, fingerprint, flag=False)
+                db.session.commit()
+            print(f"{shard_key or 'main'}: đã lập chỉ mục {len(doc_ids)} tài liệu.")
+
+@app.cli.command('recategorize-documents')
+@click.option('--all', 'include_all', is_flag=True, help='Phân loại lại cả tài liệu đã có danh mục (ghi đè danh mục đã chọn).')
+@click.option('--batch-size', default=200, show_default=True, help='Số tài liệu xử lý mỗi lần commit.')
+def recategorize_documents_command(include_all, batch_size):
+    """Phân loại lại tài liệu theo tên file và nội dung đã trích xuất (mặc định chỉ tài liệu chưa phân loại)."""
+    shard_keys = vault_shards.shard_keys() if vault_shards.enabled else [None]
+    for shard_key in shard_keys:
+        with sharding.shard_context(shard_key):
+            user = User.query.first()
+            goal, role_model = (user.ultimate_goal, user.role_model_character) if user else (None, None)
+            criteria = [] if include_all else [or_(Document.category.is_(None), Document.category == fp.DEFAULT_CATEGORY)]
+            last_id, changed = 0, 0
+            while True:
+                docs = Document.query.filter(Document.id > last_id, *criteria).order_by(Document.id).limit(batch_size).all()
+                if not docs:
+                    break
+                categories = fp.categorize_documents([[doc.filename, doc.extracted_content] for doc in docs], goal, role_model)
+                for doc, category in zip(docs, categories):
+                    if doc.category != category:
+                        doc.category = category
+                        changed += 1
+                db.session.commit()
+                last_id = docs[-1].id
+            print(f"{shard_key or 'main'}: đã đổi danh mục của {changed} tài liệu.")
+
+@app.cli.command('extract-keywords')
+@click.option('--refresh', is_flag=True, help='Chấm lại từ khóa của mọi tài liệu theo thống kê hiện tại của kho.')
+@click.option('--batch-size', default=200, show_default=True, help='Số tài liệu xử lý mỗi lần commit.')
+def extract_keywords_command(refresh, batch_size):
+    """
+    Dựng thống kê từ khóa cho tài liệu đã trích xuất trước khi có tính năng này và gán Document.keywords.
+    Mặc định chỉ gán cho tài liệu chưa có từ khóa; --refresh chấm lại tất cả (từ khóa của các tài liệu
+    nhập đầu tiên được chấm khi kho còn nhỏ nên IDF chưa phân biệt được nhiều) và đếm lại từ/cụm
+    từ chuỗi token đã lưu, để thống kê theo kịp quy tắc nhận từ ghép hiện tại.
+    """
+    shard_keys = vault_shards.shard_keys() if vault_shards.enabled else [None]
+    for shard_key in shard_keys:
+        with sharding.shard_context(shard_key):
+            has_text = Document.texts.any(DocumentText.field == 'extracted_content')
+            # Lượt 1: tách từ mọi tài liệu chưa có kết quả tách từ, để lượt 2 chấm với thống kê đủ
+            indexed_ids = db.session.query(DocumentTermSet.document_id).filter(DocumentTermSet.term_counts.is_not(None))
+            last_id, indexed = 0, 0
+            while True:
+                docs = Document.query.filter(Document.id > last_id, has_text, Document.id.not_in(indexed_ids)).order_by(Document.id).limit(batch_size).all()
+                if not docs:
+                    break
+                for doc in docs:
+                    index_document_terms(doc, doc.extracted_content)
+                db.session.commit()
+                indexed += len(docs)
+                last_id = docs[-1].id
+            if refresh:
+                # Đếm lại từ chuỗi token đã lưu (không giải nén văn bản gốc)
+                last_id = 0
+                while True:
+                    rows = db.session.query(Document, DocumentTermSet.tokens).join(DocumentTermSet, DocumentTermSet.document_id == Document.id).filter(Document.id > last_id, DocumentTermSet.tokens.is_not(None)).order_by(Document.id).limit(batch_size).all()
+                    if not rows:
+                        break
+                    for doc, tokens in rows:
+                        index_document_terms(doc, None, tokenizer.decode_phrases(tokens))
+                    db.session.commit()
+                    last_id = rows[-1][0].id
+            # Lượt 2: gán từ khóa theo lô từ số lần xuất hiện đã lưu, không tách từ lại
+            criteria = [] if refresh else [Document.keywords.is_(None)]
+            last_id, assigned = 0, 0
+            while True:
+                rows = db.session.query(Document, DocumentTermSet.term_counts).join(DocumentTermSet, DocumentTermSet.document_id == Document.id).filter(Document.id > last_id, *criteria).order_by(Document.id).limit(batch_size).all()
+                if not rows:
+                    break
+                assign_keywords([(doc, tokenizer.decode_term_counts(term_counts)) for doc, term_counts in rows])
+                db.session.commit()
+                assigned += len(rows)
+                last_id = rows[-1][0].id
+            print(f"{shard_key or 'main'}: đã lập thống kê cho {indexed} tài liệu, gán từ khóa cho {assigned} tài liệu.")
+
+@app.cli.command('import-dir')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--workers', default=os.cpu_count() or 2, show_default=True, help='Số tiến trình xử lý file song song.')
+@click.option('--chunk-size', default=200, show_default=True, help='Số file ghi vào database mỗi lần commit.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=None, help='File checkpoint (mặc định trong UPLOAD_FOLDER/imports).')
+@click.option('--restart', is_flag=True, help='Bỏ checkpoint cũ, duyệt lại toàn bộ thư mục.')
+@click.option('--shard', default=None, help='Shard nhận tài liệu (bắt buộc khi bật VAULT_SHARDING).')
+def import_directory_command(directory, workers, chunk_size, checkpoint, restart, shard):
+    """
+    Nhập toàn bộ file PDF/DOCX/TXT trong một cây thư mục vào vault.
+    Trích xuất chạy trong process pool, database được ghi theo lô; chạy lại cùng lệnh để tiếp tục sau khi bị dừng.
+    """
+    if vault_shards.enabled and not shard:
+        raise click.UsageError("Cần chỉ định --shard khi bật VAULT_SHARDING.")
+    directory = os.path.abspath(directory)
+    if checkpoint is None:
+        checkpoint = os.path.join(app.config['UPLOAD_FOLDER'], 'imports', hashlib.sha1(directory.encode('utf-8')).hexdigest()[:16] + '.log')
+    import_checkpoint = ImportCheckpoint(checkpoint)
+    if restart:
+        import_checkpoint.reset()
+    done_paths = import_checkpoint.load()
+    relative_paths = [path for path in find_files(directory, app.config['ALLOWED_EXTENSIONS']) if path not in done_paths]
+
+    with sharding.shard_context(shard):
+        # File đã có trong vault nhưng chưa kịp ghi checkpoint (bị dừng ngay sau commit) không cần xử lý lại
+        upload_dir = os.path.abspath(app.config['UPLOAD_FOLDER'])
+        existing_filepaths = set()
+        for start in range(0, len(relative_paths), 500):
+            batch_filepaths = [os.path.join(upload_dir, secure_filename(path)) for path in relative_paths[start:start + 500]]
+            existing_filepaths.update(row.filepath for row in db.session.query(Document.filepath).filter(Document.filepath.in_(batch_filepaths)))
+        relative_paths = [path for path in relative_paths if os.path.join(upload_dir, secure_filename(path)) not in existing_filepaths]
+        print(f"{len(done_paths) + len(existing_filepaths)} file đã nhập ở lần trước, còn {len(relative_paths)} file. Checkpoint: {checkpoint}")
+        if not relative_paths:
+            return
+
+        current_user = User.query.first()
+        blob_store = current_blob_store()
+        progress = ImportProgress(len(relative_paths))
+        chunks = [relative_paths[start:start + chunk_size] for start in range(0, len(relative_paths), chunk_size)]
+        timeout, memory_limit_mb = app.config['EXTRACTION_TIMEOUT_SECONDS'], app.config['EXTRACTION_MEMORY_LIMIT_MB']
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            submit_chunk = lambda chunk: [executor.submit(prepare_file, blob_store, directory, path, timeout, memory_limit_mb) for path in chunk]
+            # Lô kế tiếp được xử lý trong pool trong lúc lô hiện tại được ghi vào database
+            pending = submit_chunk(chunks[0])
+            for index in range(len(chunks)):
+                prepared_files = [future.result() for future in pending]
+                pending = submit_chunk(chunks[index + 1]) if index + 1 < len(chunks) else []
+                try:
+                    finished_paths = import_prepared_files(prepared_files, current_user, upload_dir, progress)
+                finally:
+                    for prepared in prepared_files:
+                        if prepared.result:
+                            prepared.result.discard()
+                import_checkpoint.record(finished_paths)
+                print(progress.line())
+    print(f"Hoàn tất: đã nhập {progress.imported} tài liệu trong {time.monotonic() - progress.started:.0f} giây.")
+
+def import_prepared_files(prepared_files, user, upload_dir, progress):
+    """
+    Ghi một lô file đã xử lý vào database trong một transaction. File đã có (cùng filepath) được bỏ qua.
+    File đã được chép vào kho nhưng không thành tài liệu (bị bỏ qua, hoặc cả lô lỗi) được xóa khỏi kho.
+    Returns: list đường dẫn tương đối cần ghi vào checkpoint: file đã commit và file bị bỏ qua vì lý do
+    cố định (đã tồn tại, tên không hợp lệ). File xử lý lỗi (PreparedFile.error) không có trong danh sách để lần chạy sau thử lại.
+    """
+    filepaths = {prepared.relative_path: os.path.join(upload_dir, secure_filename(prepared.relative_path)) for prepared in prepared_files}
+    existing_filepaths = {row.filepath for row in db.session.query(Document.filepath).filter(Document.filepath.in_(list(filepaths.values())))}
+    new_docs, skipped_sha256s, finished_paths = [], [], []
+    for prepared in prepared_files:
+        progress.done += 1
+        filepath = filepaths[prepared.relative_path]
+        filename = secure_filename(os.path.basename(prepared.relative_path))
+        if prepared.error or not allowed_file(filename) or filepath in existing_filepaths:
+            skipped_sha256s.append(prepared.content_sha256)
+            progress.skipped += 1
+            print(f"Bỏ qua '{prepared.relative_path}': {prepared.error or 'tên file không hợp lệ hoặc đã tồn tại.'}")
+            if not prepared.error:
+                finished_paths.append(prepared.relative_path)
+            continue
+        existing_filepaths.add(filepath)
+        doc = Document(filename=filename, filepath=filepath, doc_type=filename.rsplit('.', 1)[1].lower(), content_sha256=prepared.content_sha256)
+        prepare_uploaded_document(doc, user)
+        db.session.add(doc)
+        new_docs.append((doc, prepared))
+        finished_paths.append(prepared.relative_path)
+    try:
+        db.session.flush()
+        keyword_batch = []
+        for doc, prepared in new_docs:
+            if not reuse_extraction(doc):
+                record_extraction_result(doc, prepared.result, prepared.fingerprint, keyword_batch)
+            if doc.extraction_status == extraction_queue.STATUS_FAILED:
+                progress.failed += 1
+            progress.imported += 1
+        assign_keywords(keyword_batch)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        discard_unreferenced_blobs(prepared.content_sha256 for prepared in prepared_files)
+        raise
+    discard_unreferenced_blobs(skipped_sha256s)
+    return finished_paths
+
+@app.cli.group('vault')
+def vault_cli():
+    """Sao lưu và khôi phục vault (.tar.gz gồm file upload và dữ liệu NDJSON)."""
+
+@vault_cli.command('export')
+@click.argument('output', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--shard', default=None, help='Shard cần xuất (bắt buộc khi bật VAULT_SHARDING).')
+def export_vault_command(output, shard):
+    """Ghi bản sao lưu vault ra OUTPUT ('-' để ghi ra stdout)."""
+    if vault_shards.enabled and not shard:
+        raise click.UsageError("Cần chỉ định --shard khi bật VAULT_SHARDING.")
+    with sharding.shard_context(shard), click.open_file(output, 'wb') as out:
+        written = 0
+        for chunk in vault_export_stream():
+            out.write(chunk)
+            written += len(chunk)
+    if output != '-':
+        print(f"Đã ghi {written / 1024 / 1024:.1f} MB vào {output}.")
+
+@vault_cli.command('import')
+@click.argument('archive', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--shard', default=None, help='Shard nhận dữ liệu (bắt buộc khi bật VAULT_SHARDING).')
+def import_vault_command(archive, shard):
+    """Khôi phục bản sao lưu vào một vault trống."""
+    if vault_shards.enabled and not shard:
+        raise click.UsageError("Cần chỉ định --shard khi bật VAULT_SHARDING.")
+    with sharding.shard_context(shard), click.open_file(archive, 'rb') as source:
+        try:
+            counts = import_vault_archive(source)
+        except vault_archive.ArchiveError as e:
+            raise click.ClickException(str(e))
+    print("Đã khôi phục: " + ", ".join(f"{name} {count}" for name, count in counts.items()))
+
+@app.cli.group('shards')
+def shards_cli():
+    """Quản lý các shard vault (VAULT_SHARDING)."""
+
+@shards_cli.command('list')
+def list_shards_command():
+    """Liệt kê các shard và số tài liệu trong mỗi shard."""
+    rows = vault_shards.query_all("SELECT COUNT(*) FROM document")
+    if not rows:
+        print("Chưa có shard nào.")
+    for shard_key, row in rows:
+        print(f"{shard_key}: {row[0]} tài liệu")
+
+@shards_cli.command('upgrade')
+def upgrade_shards_command():
+    """Chạy migration tới head trên tất cả shard."""
+    for shard_key in vault_shards.shard_keys():
+        print(f"Upgrading shard '{shard_key}'...")
+        migrate_upgrade(directory=app.config['MIGRATIONS_DIR'], x_arg=[f'shard={shard_key}'])
+
+@shards_cli.command('query')
+@click.argument('sql')
+def query_shards_command(sql):
+    """Chạy một câu SELECT trên tất cả shard (truy vấn quản trị xuyên shard)."""
+    if not sql.lstrip().lower().startswith('select'):
+        raise click.UsageError("Chỉ cho phép câu lệnh SELECT.")
+    for shard_key, row in vault_shards.query_all(sql):
+        print(f"{shard_key}\t" + "\t".join(str(value) for value in row))
+
+def backfill_facet_counts():
+    with app.app_context():
+        if DocumentFacetCount.query.first() or not Document.query.first():
+            return
+        print("Rebuilding document facet counts...")
+        try:
+            with db.engine.begin() as connection:
+                rebuild_facet_counts(connection)
+            print("Facet counts rebuilt.")
+        except Exception as e:
+            print(f"An error occurred while rebuilding facet counts: {e}")
+
+def resume_pending_extractions():
+    # Việc còn queued/running khi tiến trình trước dừng sẽ được đưa lại vào hàng đợi
+    shard_keys = vault_shards.shard_keys() if vault_shards.enabled else [None]
+    with app.app_context():
+        for shard_key in shard_keys:
+            with sharding.shard_context(shard_key):
+                pending_docs = Document.query.filter(Document.extraction_status.in_(extraction_queue.PENDING_STATUSES)).all()
+                for doc in pending_docs:
+                    queue_extraction(doc)
+                if pending_docs:
+                    print(f"Re-queued {len(pending_docs)} pending text extractions.")
+
 if __name__ == '__main__':
     create_db()
  
     with app.app_context(): 
         backfill_normalized_names()
+        backfill_facet_counts()
+        resume_pending_extractions()
     app.run(debug=True)
\ No newline at end of file
@@ -16,6 +16,10 @@ logger = logging.getLogger('alembic.env')
 
 
 def get_engine():
+    # `-x shard=<key>`: chạy migration trên một shard vault thay vì database chính
+    shard_key = context.get_x_argument(as_dictionary=True).get('shard')
+    if shard_key:
+        return current_app.extensions['vault_shards'].engine(shard_key)
     try:
         # this works with Flask-SQLAlchemy<3 and Alchemical
         return current_app.extensions['migrate'].db.get_engine()
@@ -0,0 +1,52 @@
+"""Add FTS5 full-text index for documents
+
+Revision ID: 3f2a9c1d7e84
+Revises: 0cd474fcdb99
+Create Date: 2026-10-18 09:12:40.118302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c1d7e84'
+down_revision = '0cd474fcdb99'
+branch_labels = None
+depends_on = None
+
+COLUMNS = "filename_normalized, keywords, user_summary, extracted_content"
+NEW_COLUMNS = "new.filename_normalized, new.keywords, new.user_summary, new.extracted_content"
+OLD_COLUMNS = "old.filename_normalized, old.keywords, old.user_summary, old.extracted_content"
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        f"CREATE VIRTUAL TABLE document_fts USING fts5({COLUMNS}, "
+        "content='document', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    )
+    op.execute(
+        "CREATE TRIGGER document_fts_ai AFTER INSERT ON document BEGIN "
+        f"INSERT INTO document_fts(rowid, {COLUMNS}) VALUES (new.id, {NEW_COLUMNS}); END"
+    )
+    op.execute(
+        "CREATE TRIGGER document_fts_ad AFTER DELETE ON document BEGIN "
+        f"INSERT INTO document_fts(document_fts, rowid, {COLUMNS}) VALUES ('delete', old.id, {OLD_COLUMNS}); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER document_fts_au AFTER UPDATE OF {COLUMNS} ON document BEGIN "
+        f"INSERT INTO document_fts(document_fts, rowid, {COLUMNS}) VALUES ('delete', old.id, {OLD_COLUMNS}); "
+        f"INSERT INTO document_fts(rowid, {COLUMNS}) VALUES (new.id, {NEW_COLUMNS}); END"
+    )
+    op.execute("INSERT INTO document_fts(document_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS document_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS document_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS document_fts_ai")
+    op.execute("DROP TABLE IF EXISTS document_fts")
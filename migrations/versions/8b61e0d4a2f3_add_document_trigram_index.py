@@ -0,0 +1,30 @@
+"""Add trigram index for fuzzy document search
+
+Revision ID: 8b61e0d4a2f3
+Revises: 3f2a9c1d7e84
+Create Date: 2026-10-18 10:03:27.540916
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b61e0d4a2f3'
+down_revision = '3f2a9c1d7e84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    # Nội dung được chuẩn hóa bằng Python (normalize_vietnamese), nên bảng được
+    # nạp dữ liệu bởi ensure_search_index() khi chạy `python app.py`.
+    op.execute("CREATE VIRTUAL TABLE document_trigram USING fts5(terms, tokenize='trigram')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TABLE IF EXISTS document_trigram")
@@ -0,0 +1,62 @@
+"""Make document_fts an external-content index over compressed document text
+
+Revision ID: b3e8f1a6d527
+Revises: a7d4e2f5c913
+Create Date: 2026-10-18 23:58:21.640318
+
+"""
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8f1a6d527'
+down_revision = 'a7d4e2f5c913'
+branch_labels = None
+depends_on = None
+
+FTS_COLUMNS = "filename_normalized, keywords, user_summary, extracted_content"
+TOKENIZE = "tokenize='unicode61 remove_diacritics 2'"
+
+
+def _text_column(field):
+    return f"decompress_text((SELECT t.data FROM document_text t WHERE t.document_id = d.id AND t.field = '{field}')) AS {field}"
+
+
+SOURCE_VIEW_SQL = (
+    "CREATE VIEW document_fts_source AS SELECT d.id AS id, d.filename_normalized AS filename_normalized, "
+    f"d.keywords AS keywords, {_text_column('user_summary')}, {_text_column('extracted_content')} FROM document d"
+)
+
+
+def _register_decompress(bind):
+    # Ứng dụng đăng ký hàm này cho mọi kết nối; đăng ký lại ở đây để migration không phụ thuộc vào điều đó
+    bind.connection.driver_connection.create_function(
+        'decompress_text', 1, lambda data: zlib.decompress(data).decode('utf-8') if data is not None else None, deterministic=True
+    )
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    _register_decompress(bind)
+    # Bảng FTS thường giữ bản văn bản chưa nén thứ hai; thay bằng external content đọc qua view giải nén document_text
+    op.execute("DROP TABLE IF EXISTS document_fts")
+    op.execute(SOURCE_VIEW_SQL)
+    op.execute(f"CREATE VIRTUAL TABLE document_fts USING fts5({FTS_COLUMNS}, content='document_fts_source', content_rowid='id', {TOKENIZE})")
+    op.execute("INSERT INTO document_fts(document_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+    _register_decompress(bind)
+    op.execute(f"CREATE VIRTUAL TABLE document_fts_plain USING fts5({FTS_COLUMNS}, {TOKENIZE})")
+    op.execute(f"INSERT INTO document_fts_plain(rowid, {FTS_COLUMNS}) SELECT id, {FTS_COLUMNS} FROM document_fts_source")
+    op.execute("DROP TABLE document_fts")
+    op.execute("DROP VIEW document_fts_source")
+    op.execute("ALTER TABLE document_fts_plain RENAME TO document_fts")
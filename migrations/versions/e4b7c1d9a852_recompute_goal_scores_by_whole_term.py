@@ -0,0 +1,28 @@
+"""Recompute goal scores with whole-term matching
+
+Revision ID: e4b7c1d9a852
+Revises: d8a2f4c6e135
+Create Date: 2026-10-19 00:12:37.208416
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7c1d9a852'
+down_revision = 'd8a2f4c6e135'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # goal_score trước đây đếm cả từ khóa nằm trong một âm tiết ("an" trong "toan"). Mục tiêu
+    # của người dùng chỉ có ở database chính, nên thay vì tính ở đây (shard không có người dùng),
+    # xóa match_terms để ensure_goal_relevance tính lại match_terms, goal_score và
+    # is_goal_related ở request đầu tiên
+    op.execute("UPDATE document SET match_terms = NULL")
+
+
+def downgrade():
+    op.execute("UPDATE document SET match_terms = NULL")
@@ -855,4 +855,37 @@ document.addEventListener('DOMContentLoaded', function() {
             }, 100);
         });
     }
+    // Gợi ý tìm kiếm khi đang gõ (typeahead)
+    const searchInput = document.querySelector('input[name="search_query"][data-suggest-url]');
+    const suggestionList = document.getElementById('searchSuggestions');
+    if (searchInput && suggestionList) {
+        let suggestTimer = null;
+        let suggestController = null;
+        searchInput.addEventListener('input', function() {
+            clearTimeout(suggestTimer);
+            const prefix = searchInput.value.trim();
+            if (prefix.length < 2) {
+                suggestionList.innerHTML = '';
+                return;
+            }
+            suggestTimer = setTimeout(async () => {
+                if (suggestController) suggestController.abort();
+                suggestController = new AbortController();
+                try {
+                    const response = await fetch(`${searchInput.dataset.suggestUrl}?q=${encodeURIComponent(prefix)}`, { signal: suggestController.signal });
+                    if (!response.ok) return;
+                    const data = await response.json();
+                    suggestionList.innerHTML = '';
+                    (data.suggestions || []).forEach(item => {
+                        const option = document.createElement('option');
+                        option.value = item.text;
+                        option.label = item.type === 'filename' ? `Tài liệu (${item.count})` : item.type === 'keyword' ? `Từ khóa (${item.count})` : `Danh mục (${item.count})`;
+                        suggestionList.appendChild(option);
+                    });
+                } catch (error) {
+                    if (error.name !== 'AbortError') console.error('Lỗi khi lấy gợi ý tìm kiếm:', error);
+                }
+            }, 150);
+        });
+    }
 });
\ No newline at end of file
@@ -0,0 +1,96 @@
+import os
+import shutil
+import hashlib
+import tempfile
+
+# --- Lưu file theo nội dung (content-addressed) ---
+# Mỗi file được lưu một lần dưới tên là SHA-256 của nội dung, trong thư mục con
+# theo tiền tố băm (ab/cd/abcd...), nên hai tài liệu cùng nội dung dùng chung
+# một bản lưu và không thư mục nào chứa quá nhiều file. Băm được tính trong lúc
+# ghi file xuống đĩa, không cần đọc lại.
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, sha256):
+        if len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256):
+            raise ValueError(f"SHA-256 không hợp lệ: '{sha256}'.")
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256):
+        return os.path.exists(self.path_for(sha256))
+
+    def _temp_file(self):
+        temp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(temp_dir, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=temp_dir, delete=False)
+
+    def _commit(self, temp_path, sha256):
+        """Đưa file tạm vào vị trí theo băm. Returns: bool: True nếu đây là bản lưu mới."""
+        target = self.path_for(sha256)
+        if os.path.exists(target):
+            os.remove(temp_path)
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(temp_path, target)
+        return True
+
+    def save_stream(self, stream):
+        """
+        Ghi một stream (ví dụ FileStorage.stream) vào kho, vừa ghi vừa băm.
+        Returns: tuple (sha256, kích thước byte, True nếu là bản lưu mới).
+        """
+        digest = hashlib.sha256()
+        size = 0
+        with self._temp_file() as temp:
+            try:
+                while True:
+                    block = stream.read(READ_CHUNK_BYTES)
+                    if not block:
+                        break
+                    digest.update(block)
+                    temp.write(block)
+                    size += len(block)
+            except BaseException:
+                temp.close()
+                os.remove(temp.name)
+                raise
+        sha256 = digest.hexdigest()
+        return sha256, size, self._commit(temp.name, sha256)
+
+    def save_file(self, source_path, move=False):
+        """Đưa một file đã có trên đĩa vào kho (di chuyển nếu move=True). Returns: như save_stream."""
+        if not move:
+            with open(source_path, "rb") as source:
+                return self.save_stream(source)
+        digest = hashlib.sha256()
+        with open(source_path, "rb") as source:
+            for block in iter(lambda: source.read(READ_CHUNK_BYTES), b""):
+                digest.update(block)
+        size = os.path.getsize(source_path)
+        sha256 = digest.hexdigest()
+        with self._temp_file() as temp:
+            temp_path = temp.name
+        shutil.move(source_path, temp_path)
+        return sha256, size, self._commit(temp_path, sha256)
+
+    def iter_blobs(self):
+        """Duyệt mọi file trong kho. Yields: tuple (sha256, đường dẫn)."""
+        is_prefix = lambda name: len(name) == 2 and all(c in "0123456789abcdef" for c in name)
+        if not os.path.isdir(self.root):
+            return
+        for first in sorted(filter(is_prefix, os.listdir(self.root))):
+            first_dir = os.path.join(self.root, first)
+            for second in sorted(filter(is_prefix, os.listdir(first_dir))):
+                second_dir = os.path.join(first_dir, second)
+                for name in sorted(os.listdir(second_dir)):
+                    if len(name) == 64 and name.startswith(first + second):
+                        yield name, os.path.join(second_dir, name)
+
+    def delete(self, sha256):
+        path = self.path_for(sha256)
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,85 @@
+import os
+import time
+
+from utils import extractors, simhash
+
+# --- Nhập hàng loạt một thư mục vào vault ---
+# Phần nặng của mỗi file (băm + chép vào kho, trích xuất trong tiến trình con có
+# giới hạn, tính dấu vân tay SimHash) chạy trong process pool qua prepare_file();
+# tiến trình chính chỉ ghi database theo lô. Sau mỗi lô đã commit, đường dẫn
+# tương đối của các file đã nhập (hoặc bị bỏ qua vì lý do cố định) được nối vào
+# file checkpoint, nên lần chạy sau bỏ qua chúng và tiếp tục từ chỗ bị dừng;
+# file xử lý lỗi không được ghi để lần chạy sau thử lại.
+
+
+def find_files(directory, extensions):
+    """Returns: list đường dẫn tương đối (dùng '/'), sắp xếp cố định, của các file có phần mở rộng được hỗ trợ."""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if name.startswith(".") or os.path.splitext(name)[1].lower().lstrip(".") not in extensions:
+                continue
+            found.append(os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/"))
+    return found
+
+
+class ImportCheckpoint:
+    """File checkpoint dạng nối thêm: mỗi dòng là đường dẫn tương đối của một file không cần xử lý lại."""
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, encoding="utf-8") as f:
+            return {line.rstrip("\n") for line in f if line.strip()}
+
+    def record(self, relative_paths):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(path + "\n" for path in relative_paths)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class PreparedFile:
+    """Kết quả xử lý một file trong worker (picklable): nội dung đã nằm trong kho, văn bản trong spill file."""
+    def __init__(self, relative_path, content_sha256=None, result=None, fingerprint=None, error=None):
+        self.relative_path = relative_path
+        self.content_sha256 = content_sha256
+        self.result = result
+        self.fingerprint = fingerprint
+        self.error = error
+
+
+def prepare_file(blob_store, directory, relative_path, timeout, memory_limit_mb):
+    """Chạy trong process pool. Không ném lỗi: lỗi đọc/chép file được trả về trong PreparedFile.error."""
+    source_path = os.path.join(directory, relative_path)
+    try:
+        content_sha256, _, _ = blob_store.save_file(source_path)
+    except OSError as e:
+        return PreparedFile(relative_path, error=str(e))
+    result = extractors.extract(blob_store.path_for(content_sha256), timeout=timeout, memory_limit_mb=memory_limit_mb, extension=os.path.splitext(relative_path)[1])
+    fingerprint = simhash.fingerprint(result.iter_chunks()) if result.ok else None
+    return PreparedFile(relative_path, content_sha256, result, fingerprint)
+
+
+class ImportProgress:
+    """Đếm tiến độ và thông lượng; line() trả về một dòng trạng thái để in sau mỗi lô."""
+    def __init__(self, total):
+        self.total = total
+        self.done = self.imported = self.failed = self.skipped = 0
+        self.started = time.monotonic()
+
+    def line(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        rate = self.done / elapsed
+        eta = (self.total - self.done) / rate if rate else 0
+        percent = self.done * 100 / self.total if self.total else 100
+        return (f"[{self.done}/{self.total}] {percent:.1f}% | {rate:.1f} file/s | còn ~{eta / 60:.1f} phút"
+                f" | nhập {self.imported}, lỗi trích xuất {self.failed}, bỏ qua {self.skipped}")
@@ -0,0 +1,40 @@
+import zlib
+
+# --- Nén văn bản lớn của tài liệu ---
+# Nội dung trích xuất, tóm tắt và ghi chú được lưu ở bảng document_text dưới
+# dạng UTF-8 nén zlib (văn bản tiếng Việt thường nhỏ đi 3-4 lần), tách khỏi
+# bảng document để các truy vấn danh sách chỉ đọc những dòng nhỏ. zlib có sẵn
+# trong thư viện chuẩn nên không cần thêm phụ thuộc.
+COMPRESSION_LEVEL = 6
+
+
+def compress(text):
+    return zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def decompress(data):
+    return zlib.decompress(data).decode("utf-8")
+
+
+def word_count(text):
+    return len(text.split()) if text else 0
+
+
+def compress_chunks(chunks, separator="\n"):
+    """
+    Nén các khối văn bản (bỏ khối rỗng, nối bằng separator) mà không ghép thành một chuỗi,
+    cho kết quả trích xuất lớn. Returns: tuple (dữ liệu nén hoặc None nếu rỗng, số ký tự, số từ).
+    """
+    compressor = zlib.compressobj(COMPRESSION_LEVEL)
+    parts, size, words = [], 0, 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if size:
+            parts.append(compressor.compress(separator.encode("utf-8")))
+            size += len(separator)
+        parts.append(compressor.compress(chunk.encode("utf-8")))
+        size += len(chunk)
+        words += word_count(chunk)
+    parts.append(compressor.flush())
+    return (b"".join(parts) if size else None), size, words
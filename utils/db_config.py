@@ -0,0 +1,71 @@
+import sqlite3
+
+# --- Cấu hình kết nối database theo backend và profile ---
+# development: giữ hành vi mặc định của SQLite (rollback journal).
+# production: SQLite chạy WAL để người đọc không bị chặn bởi người ghi (ví dụ
+# view_document() commit ở mỗi lần xem), hoặc PostgreSQL với connection pool.
+SQLITE_PRODUCTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -64000,          # KiB (số âm) ~ 64 MB
+    "mmap_size": 268435456,        # 256 MB
+    "busy_timeout": 5000,          # ms
+}
+
+
+def normalize_database_url(url):
+    """Một số nền tảng cấp URL dạng postgres://, SQLAlchemy chỉ nhận postgresql://."""
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def backend_name(url):
+    return url.split(":", 1)[0].split("+", 1)[0]
+
+
+def sqlite_pragmas(profile, environ):
+    if profile != "production":
+        return {}
+    pragmas = dict(SQLITE_PRODUCTION_PRAGMAS)
+    pragmas["mmap_size"] = int(environ.get("SQLITE_MMAP_SIZE", pragmas["mmap_size"]))
+    pragmas["busy_timeout"] = int(environ.get("SQLITE_BUSY_TIMEOUT_MS", pragmas["busy_timeout"]))
+    return pragmas
+
+
+def engine_options(url, profile, environ):
+    """
+    Tham số cho SQLALCHEMY_ENGINE_OPTIONS.
+    Args: url (str), profile (str): 'development' hoặc 'production', environ: os.environ.
+    Returns: dict.
+    """
+    backend = backend_name(url)
+    if backend == "sqlite":
+        if profile != "production" or ":memory:" in url:
+            return {}
+        busy_timeout_ms = int(environ.get("SQLITE_BUSY_TIMEOUT_MS", SQLITE_PRODUCTION_PRAGMAS["busy_timeout"]))
+        return {
+            "connect_args": {"timeout": busy_timeout_ms / 1000, "check_same_thread": False},
+            "pool_size": int(environ.get("DB_POOL_SIZE", 10)),
+            "max_overflow": int(environ.get("DB_MAX_OVERFLOW", 20)),
+            "pool_pre_ping": False,
+        }
+    return {
+        "pool_size": int(environ.get("DB_POOL_SIZE", 10 if profile == "production" else 5)),
+        "max_overflow": int(environ.get("DB_MAX_OVERFLOW", 20 if profile == "production" else 10)),
+        "pool_recycle": int(environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": environ.get("DB_POOL_PRE_PING", "1") != "0",
+    }
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    """Gọi từ event "connect" của Engine; bỏ qua kết nối không phải SQLite."""
+    if not pragmas or not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
@@ -0,0 +1,68 @@
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Trích xuất văn bản chạy nền ---
+# Upload chỉ lưu file và đưa tài liệu vào hàng đợi; một nhóm worker đọc file
+# (PyMuPDF, đọc XML của DOCX) bên ngoài request. Trạng thái của từng tài liệu được
+# lưu trong Document.extraction_status để view_document hiển thị thay vì chờ.
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+PENDING_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+
+class ExtractionQueue:
+    def __init__(self, handler, max_workers=2):
+        """
+        Args:
+            handler: hàm handler(*job_key) thực hiện một việc trích xuất.
+            max_workers: số luồng worker; 0 nghĩa là chạy ngay trong luồng gọi (CLI, kiểm thử).
+        """
+        self.handler = handler
+        self.max_workers = max_workers
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="extraction")
+        return self._executor
+
+    def submit(self, job_key):
+        """
+        Đưa một việc vào hàng đợi; bỏ qua nếu việc cùng job_key đang chờ hoặc đang chạy.
+        Returns: bool: True nếu việc được đưa vào hàng đợi.
+        """
+        with self._lock:
+            if job_key in self._pending:
+                return False
+            self._pending.add(job_key)
+            executor = self._get_executor() if self.max_workers > 0 else None
+        if executor is None:
+            self._run(job_key)
+        else:
+            executor.submit(self._run, job_key)
+        return True
+
+    def _run(self, job_key):
+        try:
+            self.handler(*job_key)
+        except Exception as e:
+            print(f"ERROR in extraction job {job_key}: {e}")
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                self._pending.discard(job_key)
+
+    def is_pending(self, job_key):
+        with self._lock:
+            return job_key in self._pending
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
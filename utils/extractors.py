@@ -0,0 +1,353 @@
+import os
+import re
+import sys
+import json
+import codecs
+import tempfile
+import subprocess
+
+try:
+    import resource  # chỉ có trên POSIX
+except ImportError:
+    resource = None
+
+# --- Trích xuất văn bản theo định dạng file ---
+# Mỗi phần mở rộng có một hàm trích xuất trong EXTRACTORS. extract() chạy hàm
+# đó trong một tiến trình con có giới hạn thời gian, CPU và bộ nhớ, nên một
+# file PDF hỏng hoặc cố ý gây treo không giữ worker mãi. Kết quả luôn là
+# ExtractionResult; lỗi không còn được lưu dưới dạng chuỗi "[Lỗi ...]".
+# Văn bản được sinh theo khối (trang/đoạn/khối dòng) và ghi ra spill file thay
+# vì ghép thành một chuỗi lớn, nên bộ nhớ đỉnh không phụ thuộc kích thước file.
+ERROR_UNSUPPORTED = "unsupported_format"
+ERROR_NOT_FOUND = "not_found"
+ERROR_ENCRYPTED = "encrypted"
+ERROR_CORRUPT = "corrupt_file"
+ERROR_TIMEOUT = "timeout"
+ERROR_MEMORY = "memory_limit"
+ERROR_CRASHED = "crashed"
+
+ERROR_MESSAGES = {
+    ERROR_UNSUPPORTED: "Định dạng file không được hỗ trợ để trích xuất văn bản.",
+    ERROR_NOT_FOUND: "Không tìm thấy file trên máy chủ.",
+    ERROR_ENCRYPTED: "File được bảo vệ bằng mật khẩu.",
+    ERROR_CORRUPT: "Không thể đọc nội dung từ file. File có thể bị hỏng.",
+    ERROR_TIMEOUT: "Trích xuất mất quá nhiều thời gian và đã bị dừng.",
+    ERROR_MEMORY: "Trích xuất vượt quá giới hạn bộ nhớ và đã bị dừng.",
+    ERROR_CRASHED: "Tiến trình trích xuất bị dừng bất thường.",
+}
+
+EXTRACTORS = {}
+CHUNK_CHARS = 64 * 1024          # kích thước khối văn bản (DOCX, dòng quá dài trong TXT)
+READ_BLOCK_BYTES = 64 * 1024     # mỗi lần đọc file TXT
+SAMPLE_BYTES = 64 * 1024         # phần đầu file dùng để đoán bảng mã
+
+
+class ExtractionError(Exception):
+    def __init__(self, code, detail=None):
+        super().__init__(detail or ERROR_MESSAGES.get(code, code))
+        self.code = code
+        self.detail = detail
+
+
+class ExtractionResult:
+    """
+    Kết quả trích xuất. Văn bản không nằm trong bộ nhớ mà ở file tạm (spill file)
+    dạng từng khối: trang PDF, nhóm đoạn DOCX hoặc khối dòng của file TXT.
+    Caller đọc bằng iter_chunks() rồi gọi discard() để xóa file tạm.
+    """
+    def __init__(self, error_code=None, error_detail=None, spill_path=None, chunk_count=0, char_count=0, extension=None):
+        self.extension = extension
+        self.error_code = error_code
+        self.error_detail = error_detail
+        self.spill_path = spill_path
+        self.chunk_count = chunk_count
+        self.char_count = char_count
+
+    @property
+    def ok(self):
+        return self.error_code is None
+
+    @property
+    def error_message(self):
+        return ERROR_MESSAGES.get(self.error_code, self.error_code) if self.error_code else None
+
+    def iter_chunks(self):
+        if self.spill_path:
+            yield from read_spill(self.spill_path)
+
+    def discard(self):
+        if self.spill_path and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self.spill_path = None
+
+    def to_dict(self):
+        return {"error_code": self.error_code, "error_detail": self.error_detail, "chunk_count": self.chunk_count, "char_count": self.char_count}
+
+    @classmethod
+    def from_dict(cls, data, spill_path=None):
+        return cls(data.get("error_code"), data.get("error_detail"), spill_path if not data.get("error_code") else None, data.get("chunk_count", 0), data.get("char_count", 0))
+
+    def __repr__(self):
+        return f"<ExtractionResult ok={self.ok} error_code={self.error_code} chunks={self.chunk_count}>"
+
+
+# --- Spill file: mỗi khối ghi dạng "<số byte>\n<văn bản UTF-8>" ---
+def write_spill(spill_path, chunks):
+    """Ghi lần lượt các khối ra file. Returns: tuple (số khối, số ký tự)."""
+    chunk_count = char_count = 0
+    with open(spill_path, "wb") as f:
+        for chunk in chunks:
+            data = chunk.encode("utf-8")
+            f.write(b"%d\n" % len(data))
+            f.write(data)
+            chunk_count += 1
+            char_count += len(chunk)
+    return chunk_count, char_count
+
+
+def read_spill(spill_path):
+    with open(spill_path, "rb") as f:
+        while True:
+            header = f.readline()
+            if not header:
+                return
+            yield f.read(int(header)).decode("utf-8")
+
+
+def register_extractor(*extensions):
+    """Decorator đăng ký generator extractor(filepath) sinh lần lượt các khối văn bản cho các phần mở rộng (dạng '.pdf')."""
+    def decorator(func):
+        for extension in extensions:
+            EXTRACTORS[extension.lower()] = func
+        return func
+    return decorator
+
+
+def file_extension(filepath, extension=None):
+    """Phần mở rộng dùng để chọn extractor; extension ghi đè khi file lưu không có đuôi (kho theo nội dung)."""
+    return (extension or os.path.splitext(filepath)[1]).lower()
+
+
+def is_supported(filepath, extension=None):
+    return file_extension(filepath, extension) in EXTRACTORS
+
+
+@register_extractor(".pdf")
+def extract_pdf(filepath):
+    # Mỗi trang là một khối (kể cả trang trống, để giữ đúng số trang)
+    import fitz
+    try:
+        document = fitz.open(filepath)
+    except Exception as e:
+        raise ExtractionError(ERROR_CORRUPT, str(e))
+    with document:
+        if document.needs_pass and not document.authenticate(""):
+            raise ExtractionError(ERROR_ENCRYPTED)
+        for page in document:
+            yield page.get_text()
+
+
+DOCX_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DOCX_BODY_XML = "word/document.xml"
+
+
+@register_extractor(".docx")
+def extract_docx(filepath):
+    # Đọc word/document.xml trực tiếp từ file zip bằng iterparse: mỗi đoạn (w:p, kể cả
+    # trong bảng) được lấy chữ rồi xóa ngay, và khối cấp cao nhất đã đọc xong được gỡ
+    # khỏi w:body, nên bộ nhớ không tăng theo kích thước file như khi nạp cả cây XML
+    import zipfile
+    from xml.etree import ElementTree
+    paragraph_tag, body_tag = DOCX_NAMESPACE + "p", DOCX_NAMESPACE + "body"
+    text_tag, tab_tag, break_tags = DOCX_NAMESPACE + "t", DOCX_NAMESPACE + "tab", (DOCX_NAMESPACE + "br", DOCX_NAMESPACE + "cr")
+    try:
+        archive = zipfile.ZipFile(filepath)
+        xml_file = archive.open(DOCX_BODY_XML)
+    except (zipfile.BadZipFile, KeyError, OSError) as e:
+        raise ExtractionError(ERROR_CORRUPT, str(e))
+    with archive, xml_file:
+        stack, runs, paragraphs, size = [], [], [], 0
+        try:
+            for event, element in ElementTree.iterparse(xml_file, events=("start", "end")):
+                if event == "start":
+                    stack.append(element)
+                    continue
+                stack.pop()
+                if element.tag == text_tag:
+                    runs.append(element.text or "")
+                elif element.tag == tab_tag:
+                    runs.append("\t")
+                elif element.tag in break_tags:
+                    runs.append("\n")
+                elif element.tag == paragraph_tag:
+                    paragraph = "".join(runs)
+                    runs = []
+                    paragraphs.append(paragraph)
+                    size += len(paragraph)
+                    if size >= CHUNK_CHARS:
+                        yield "\n".join(paragraphs)
+                        paragraphs, size = [], 0
+                    element.clear()
+                if stack and stack[-1].tag == body_tag:
+                    stack[-1].remove(element)
+        except ElementTree.ParseError as e:
+            raise ExtractionError(ERROR_CORRUPT, str(e))
+        if paragraphs:
+            yield "\n".join(paragraphs)
+
+
+def detect_text_encoding(sample):
+    """Đoán bảng mã từ phần đầu file: BOM, rồi UTF-8, rồi Windows-1258 (tiếng Việt), cuối cùng latin-1."""
+    for bom, encoding in ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16")):
+        if sample.startswith(bom):
+            return encoding
+    for encoding in ("utf-8", "cp1258"):
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            pass
+    return "latin-1"
+
+
+@register_extractor(".txt")
+def extract_txt(filepath):
+    # Đọc từng khối byte và giải mã tăng dần; khối cắt ở dòng cuối cùng để không chẻ đôi một dòng
+    with open(filepath, "rb") as f:
+        decoder = codecs.getincrementaldecoder(detect_text_encoding(f.read(SAMPLE_BYTES)))(errors="replace")
+        f.seek(0)
+        pending = ""
+        while True:
+            block = f.read(READ_BLOCK_BYTES)
+            pending += decoder.decode(block, final=not block)
+            if not block:
+                break
+            cut = pending.rfind("\n")
+            if cut >= 0:
+                yield pending[:cut]
+                pending = pending[cut + 1:]
+            elif len(pending) >= CHUNK_CHARS:
+                yield pending
+                pending = ""
+        if pending:
+            yield pending
+
+
+def split_text(text, max_chars=CHUNK_CHARS):
+    """Chia một chuỗi đã có sẵn thành các khối tối đa max_chars, ưu tiên cắt ở xuống dòng."""
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            cut = text.rfind("\n", start, end)
+            if cut > start:
+                end = cut
+        yield text[start:end]
+        start = end + 1 if end < len(text) and text[end] == "\n" else end
+
+
+def clean_text(text):
+    """Gộp khoảng trắng trong từng dòng và các dòng trống liên tiếp, giữ nguyên xuống dòng."""
+    text = re.sub(r"[^\S\n]+", " ", text)
+    text = re.sub(r" ?\n ?", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def extract_stream(filepath, extension=None):
+    """Generator các khối văn bản đã làm sạch, chạy trong tiến trình hiện tại. Raises: ExtractionError."""
+    extractor = EXTRACTORS.get(file_extension(filepath, extension))
+    if extractor is None:
+        raise ExtractionError(ERROR_UNSUPPORTED)
+    if not os.path.exists(filepath):
+        raise ExtractionError(ERROR_NOT_FOUND)
+    for chunk in extractor(filepath):
+        yield clean_text(chunk)
+
+
+def extract_to_spill(filepath, spill_path, extension=None):
+    """Trích xuất trong tiến trình hiện tại (không giới hạn tài nguyên) ra spill_path. Returns: ExtractionResult."""
+    try:
+        chunk_count, char_count = write_spill(spill_path, extract_stream(filepath, extension))
+        return ExtractionResult(spill_path=spill_path, chunk_count=chunk_count, char_count=char_count)
+    except ExtractionError as e:
+        return ExtractionResult(error_code=e.code, error_detail=e.detail)
+    except MemoryError:
+        return ExtractionResult(error_code=ERROR_MEMORY)
+    except ImportError as e:
+        # Thư viện đọc file không nạp được (chưa cài, hoặc vượt giới hạn bộ nhớ khi nạp)
+        return ExtractionResult(error_code=ERROR_CRASHED, error_detail=str(e))
+    except Exception as e:
+        return ExtractionResult(error_code=ERROR_CORRUPT, error_detail=str(e))
+
+
+def _limit_resources(cpu_seconds, memory_limit_mb):
+    # Gọi trong chính tiến trình con (đầu __main__), không qua preexec_fn: preexec_fn
+    # không an toàn khi tiến trình cha có nhiều luồng (luồng trích xuất nền, web server)
+    if resource is None:
+        return
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    if memory_limit_mb:
+        limit_bytes = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+
+
+def extract(filepath, timeout=60, cpu_seconds=None, memory_limit_mb=1024, spill_dir=None, extension=None):
+    """
+    Trích xuất văn bản trong tiến trình con có giới hạn tài nguyên. Văn bản được
+    ghi theo khối ra spill file nên bộ nhớ của cả hai tiến trình không tăng theo kích thước file.
+    Args:
+        timeout: thời gian thực tối đa (giây); quá hạn thì tiến trình con bị kill.
+        cpu_seconds: giới hạn thời gian CPU (mặc định bằng timeout). Chỉ áp dụng trên POSIX.
+        memory_limit_mb: giới hạn bộ nhớ ảo của tiến trình con. Chỉ áp dụng trên POSIX.
+        spill_dir: thư mục chứa spill file (mặc định thư mục tạm của hệ thống).
+        extension: phần mở rộng (dạng '.pdf') nếu filepath không có đuôi.
+    Returns: ExtractionResult.
+    """
+    extension = file_extension(filepath, extension)
+    if not is_supported(filepath, extension):
+        return ExtractionResult(error_code=ERROR_UNSUPPORTED)
+    if not os.path.exists(filepath):
+        return ExtractionResult(error_code=ERROR_NOT_FOUND)
+    spill_fd, spill_path = tempfile.mkstemp(prefix="extract_", suffix=".chunks", dir=spill_dir)
+    os.close(spill_fd)
+    result = _run_child(filepath, spill_path, extension, timeout, cpu_seconds, memory_limit_mb)
+    result.extension = extension
+    if not result.ok:
+        os.remove(spill_path)
+    return result
+
+
+def _run_child(filepath, spill_path, extension, timeout, cpu_seconds, memory_limit_mb):
+    try:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), filepath, spill_path, extension,
+             str(cpu_seconds or int(timeout)), str(memory_limit_mb or 0)],
+            capture_output=True, timeout=timeout, stdin=subprocess.DEVNULL,
+        )
+    except subprocess.TimeoutExpired:
+        return ExtractionResult(error_code=ERROR_TIMEOUT)
+    if completed.returncode != 0:
+        stderr_tail = completed.stderr.decode("utf-8", "replace").strip()[-500:]
+        if "MemoryError" in stderr_tail:
+            return ExtractionResult(error_code=ERROR_MEMORY)
+        if resource is not None and completed.returncode in (-24, -9):  # SIGXCPU / SIGKILL khi vượt giới hạn CPU
+            return ExtractionResult(error_code=ERROR_TIMEOUT)
+        return ExtractionResult(error_code=ERROR_CRASHED, error_detail=stderr_tail or f"exit code {completed.returncode}")
+    try:
+        return ExtractionResult.from_dict(json.loads(completed.stdout.decode("utf-8")), spill_path)
+    except ValueError as e:
+        return ExtractionResult(error_code=ERROR_CRASHED, error_detail=f"Invalid extractor output: {e}")
+
+
+if __name__ == "__main__":
+    # Điểm vào của tiến trình con: argv = file, spill file, phần mở rộng, giới hạn CPU (giây), giới hạn bộ nhớ (MB; 0 = không giới hạn).
+    # Ghi văn bản ra spill file, in ExtractionResult dạng JSON ra stdout.
+    _limit_resources(int(sys.argv[4]), int(sys.argv[5]))
+    # Trong lúc trích xuất, stdout được chuyển sang stderr để thông báo của thư
+    # viện (kể cả từ mã C) không lẫn vào kết quả.
+    result_fd = os.dup(1)
+    os.dup2(2, 1)
+    result = extract_to_spill(sys.argv[1], sys.argv[2], sys.argv[3])
+    with os.fdopen(result_fd, "wb") as result_stream:
+        result_stream.write(json.dumps(result.to_dict(), ensure_ascii=False).encode("utf-8"))
@@ -1,11 +1,5 @@
-
-
-import os
-from PyPDF2 import PdfReader
-import docx # python-docx
-from sklearn.feature_extraction.text import TfidfVectorizer
-import re # Thư viện Regular Expression để làm sạch text cơ bản
 from collections import Counter # Import Counter để đếm điểm
+from utils import keyword_engine, tokenizer
 
 # --- Định nghĩa Danh mục và Từ khóa liên quan ---
 # Bạn có thể tùy chỉnh danh sách này theo nhu cầu
@@ -25,77 +19,17 @@ CATEGORY_KEYWORDS = {
 
 DEFAULT_CATEGORY = "Tài liệu chung" # Danh mục mặc định
 
-def extract_text(filepath):
-    """
-    Trích xuất nội dung văn bản từ file (PDF, DOCX, TXT).
-    Args: filepath (str): Đường dẫn đến file.
-    Returns: str: Nội dung văn bản, hoặc chuỗi rỗng nếu lỗi.
+def extract_keywords(text, num_keywords=15, doc_freq=None, corpus_size=0): # Tăng số keywords mặc định
     """
-    _, file_extension = os.path.splitext(filepath)
-    text = ""
-    try:
-        if file_extension.lower() == '.pdf':
-            with open(filepath, 'rb') as f:
-                reader = PdfReader(f)
-                if reader.is_encrypted:
-                    try:
-                        reader.decrypt('') # Thử mật khẩu rỗng
-                    except Exception as decrypt_error:
-                        print(f"File PDF {filepath} được mã hóa và không thể giải mã: {decrypt_error}")
-                        return ""
-                for page in reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-        elif file_extension.lower() == '.docx':
-            doc = docx.Document(filepath)
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-        elif file_extension.lower() == '.txt':
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    text = f.read()
-            except UnicodeDecodeError:
-                 try:
-                     with open(filepath, 'r', encoding='latin-1') as f:
-                        text = f.read()
-                 except Exception as e_alt:
-                     print(f"Lỗi khi đọc file TXT {filepath} với UTF-8 và latin-1: {e_alt}")
-                     return ""
-        else:
-            print(f"Định dạng file {file_extension} không được hỗ trợ.")
-            return ""
-
-        text = re.sub(r'\s+', ' ', text).strip() # Làm sạch khoảng trắng
-        return text
-
-    except Exception as e:
-        print(f"Lỗi khi đọc file {filepath}: {e}")
-        return ""
-
-def extract_keywords(text, num_keywords=15): # Tăng số keywords mặc định
-    """
-    Trích xuất từ khóa từ văn bản bằng TF-IDF.
-    Args: text (str), num_keywords (int).
+    Trích xuất từ khóa từ văn bản bằng TF-IDF (utils.keyword_engine).
+    Args: text (str), num_keywords (int), doc_freq (dict bucket -> số tài liệu) và corpus_size (int):
+          thống kê của kho; không truyền thì chỉ xếp theo tần suất trong văn bản.
     Returns: list: Danh sách từ khóa.
     """
     if not text or not isinstance(text, str) or len(text.split()) < 5:
         print("Nội dung văn bản không đủ để trích xuất từ khóa.")
         return []
-
-    try:
-        vectorizer = TfidfVectorizer(stop_words='english', max_df=0.85, ngram_range=(1, 2), max_features=3000)
-        tfidf_matrix = vectorizer.fit_transform([text])
-        feature_names = vectorizer.get_feature_names_out()
-        tfidf_scores = tfidf_matrix[0].T.todense().tolist()
-        word_scores = [(score[0], word) for word, score in zip(feature_names, tfidf_scores)]
-        word_scores.sort(key=lambda x: x[0], reverse=True)
-        keywords = [word for score, word in word_scores[:num_keywords]]
-        return keywords
-
-    except Exception as e:
-        print(f"Lỗi khi trích xuất từ khóa: {e}")
-        return []
+    return keyword_engine.top_keywords(tokenizer.term_counts(tokenizer.phrases(text)), doc_freq or {}, corpus_size, num_keywords)
 
 def categorize_document(keywords_list):
     """
@@ -118,4 +52,4 @@ def categorize_document(keywords_list):
         best_category, _ = category_scores.most_common(1)[0]
         return best_category
     else:
-        return DEFAULT_CATEGORY
\ No newline at end of file
+        return DEFAULT_CATEGORY
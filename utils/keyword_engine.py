@@ -0,0 +1,55 @@
+import math
+import zlib
+from array import array
+
+# --- Trích xuất từ khóa theo thống kê toàn kho (TF-IDF tăng dần) ---
+# Mỗi từ/cụm của tài liệu (utils.tokenizer.term_counts) được băm vào một trong
+# HASH_BUCKETS ô, giống HashingVectorizer: bảng tần suất tài liệu (số tài liệu
+# chứa ô đó) có kích thước tối đa cố định dù kho có bao nhiêu từ vựng. Bảng này
+# được cộng khi tài liệu được trích xuất và trừ khi tài liệu bị xóa, nên từ khóa
+# của tài liệu mới được chấm với IDF của cả kho mà không phải fit lại mô hình.
+HASH_BUCKETS = 1 << 20
+
+
+def term_bucket(term):
+    # crc32 thay cho hash(): giá trị phải giống nhau giữa các tiến trình và lần chạy
+    return zlib.crc32(term.encode("utf-8")) % HASH_BUCKETS
+
+
+def term_buckets(term_counts):
+    return sorted({term_bucket(term) for term in term_counts})
+
+
+def pack_buckets(buckets):
+    return array("I", buckets).tobytes()
+
+
+def unpack_buckets(data):
+    buckets = array("I")
+    buckets.frombytes(data or b"")
+    return buckets.tolist()
+
+
+def top_keywords(term_counts, doc_freq, corpus_size, limit=15):
+    """
+    Các cụm có TF-IDF cao nhất; từ đơn chỉ xuất hiện trong một từ ghép (đã qua kiểm tra ở tokenizer.term_counts) được chọn thì bị thay bằng từ ghép đó.
+    Args: doc_freq (dict): bucket -> số tài liệu chứa, corpus_size (int): số tài liệu trong kho.
+    Returns: list[str].
+    """
+    def score(term):
+        idf = math.log((1 + corpus_size) / (1 + doc_freq.get(term_bucket(term), 0))) + 1
+        return (1 + math.log(term_counts[term])) * idf
+
+    keywords, covered = [], {}  # từ đơn -> số lần xuất hiện lớn nhất của cụm đã chọn chứa nó
+    for term in sorted(term_counts, key=lambda term: (-score(term), term)):
+        if term_counts[term] <= covered.get(term, 0):
+            continue  # từ đơn hầu như chỉ xuất hiện trong cụm đã chọn
+        words = term.split(" ")
+        if len(words) > 1:
+            for word in words:
+                covered[word] = max(covered.get(word, 0), term_counts[term])
+            keywords = [keyword for keyword in keywords if term_counts[keyword] > covered.get(keyword, 0)]
+        keywords.append(term)
+        if len(keywords) >= limit:
+            break
+    return keywords
@@ -0,0 +1,91 @@
+from collections import Counter, deque
+from itertools import chain
+
+try:
+    import ahocorasick  # pyahocorasick: automaton viết bằng C
+except ImportError:
+    ahocorasick = None
+
+# --- So khớp nhiều từ khóa trong một lần duyệt (Aho-Corasick) ---
+# Tất cả từ khóa được dựng thành một automaton duy nhất: mỗi ký tự của văn bản
+# chỉ đi qua một lần, nên chi phí là O(độ dài văn bản + số lần khớp) thay vì
+# quét toàn văn bản một lần cho mỗi từ khóa. Khớp theo chuỗi con (giống `k in text`),
+# các lần khớp chồng lên nhau đều được đếm.
+# Dùng pyahocorasick nếu có; bản Python thuần bên dưới cho kết quả giống hệt
+# nhưng chậm hơn nhiều lần vì mỗi ký tự đi qua vòng lặp của interpreter.
+
+
+class KeywordAutomaton:
+    def __init__(self, labeled_keywords):
+        """
+        Args: labeled_keywords (dict): nhãn -> danh sách từ khóa (đã chuẩn hóa chữ thường).
+        Một từ khóa có thể thuộc nhiều nhãn; từ khóa rỗng bị bỏ qua.
+        """
+        keyword_labels = {}
+        for label, keywords in labeled_keywords.items():
+            for keyword in keywords:
+                if keyword:
+                    keyword_labels.setdefault(keyword, []).append(label)
+        self._empty = not keyword_labels
+        self._native = None
+        if ahocorasick is not None:
+            if keyword_labels:
+                self._native = ahocorasick.Automaton()
+                for keyword, labels in keyword_labels.items():
+                    self._native.add_word(keyword, tuple(labels))
+                self._native.make_automaton()
+            return
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [()]  # các nhãn kết thúc tại nút, kể cả qua liên kết fail
+        for keyword, labels in keyword_labels.items():
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._outputs.append(())
+                node = next_node
+            self._outputs[node] = tuple(labels)
+        self._alphabet = frozenset(char for keyword in keyword_labels for char in keyword)
+        self._link_failures()
+
+    def _link_failures(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+
+    def hits(self, text):
+        """Số lần khớp theo nhãn trong text. Returns: Counter."""
+        counts = Counter()
+        if not text or self._empty:
+            return counts
+        if self._native is not None:
+            counts.update(chain.from_iterable(labels for _, labels in self._native.iter(text)))
+            return counts
+        goto, fail, outputs, alphabet = self._goto, self._fail, self._outputs, self._alphabet
+        node = 0
+        for char in text:
+            if char not in alphabet:
+                # Ký tự không có trong từ khóa nào: mọi trạng thái đều quay về gốc
+                node = 0
+                continue
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if outputs[node]:
+                counts.update(outputs[node])
+        return counts
+
+    def matched_labels(self, text):
+        return set(self.hits(text))
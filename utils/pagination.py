@@ -0,0 +1,80 @@
+import base64
+from datetime import datetime
+from sqlalchemy import tuple_
+
+# --- Phân trang theo con trỏ (keyset) ---
+# Thay vì OFFSET (phải đọc bỏ qua mọi dòng của các trang trước) và COUNT(*) ở
+# mỗi lần tải trang, mỗi trang bắt đầu ngay sau khóa (ngày, id) của dòng cuối
+# trang trước. Với chỉ mục (uploaded_date, id), chi phí một trang chỉ phụ thuộc
+# số dòng trên trang, dù đang ở trang thứ bao nhiêu.
+
+
+def encode_cursor(sort_value, row_id):
+    raw = f"{sort_value.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """
+    Giải mã con trỏ từ query string.
+    Returns: tuple (datetime, int), hoặc None nếu con trỏ rỗng/không hợp lệ.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        sort_part, id_part = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return datetime.fromisoformat(sort_part), int(id_part)
+    except (ValueError, UnicodeError):
+        return None
+
+
+class KeysetPage:
+    """Một trang kết quả; thay cho đối tượng Pagination của Flask-SQLAlchemy trong template."""
+    is_keyset = True
+
+    def __init__(self, items, sort_attr, has_next, has_prev, total=None):
+        self.items = items
+        self.sort_attr = sort_attr
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.total = total
+
+    def _cursor_for(self, item):
+        return encode_cursor(getattr(item, self.sort_attr), item.id)
+
+    @property
+    def next_cursor(self):
+        return self._cursor_for(self.items[-1]) if self.has_next and self.items else None
+
+    @property
+    def prev_cursor(self):
+        return self._cursor_for(self.items[0]) if self.has_prev and self.items else None
+
+
+def keyset_page_query(query, sort_column, id_column, per_page, after=None, before=None):
+    """Query lấy per_page + 1 dòng của trang (để biết còn trang kế); trang trước được sắp tăng dần."""
+    key = tuple_(sort_column, id_column)
+    if before is not None:
+        return query.filter(key > tuple_(*before)).order_by(sort_column.asc(), id_column.asc()).limit(per_page + 1)
+    if after is not None:
+        query = query.filter(key < tuple_(*after))
+    return query.order_by(sort_column.desc(), id_column.desc()).limit(per_page + 1)
+
+
+def keyset_paginate(query, sort_column, id_column, per_page, after=None, before=None, total=None):
+    """
+    Lấy một trang sắp xếp giảm dần theo (sort_column, id_column).
+    Args:
+        query: Query đã áp dụng các bộ lọc.
+        after / before: con trỏ đã giải mã (decode_cursor) để sang trang sau / trang trước.
+        total: tổng số dòng nếu đã biết (ví dụ lấy từ cache), chỉ để hiển thị.
+    Returns: KeysetPage.
+    """
+    rows = keyset_page_query(query, sort_column, id_column, per_page, after, before).all()
+    if before is not None:
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return KeysetPage(items, sort_column.key, has_next=True, has_prev=has_prev, total=total)
+
+    return KeysetPage(rows[:per_page], sort_column.key, has_next=len(rows) > per_page, has_prev=after is not None, total=total)
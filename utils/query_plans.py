@@ -0,0 +1,27 @@
+import re
+from sqlalchemy import text
+
+# --- Kiểm tra kế hoạch truy vấn (SQLite EXPLAIN QUERY PLAN) ---
+# Dòng "SCAN <bảng>" không kèm "USING ... INDEX" nghĩa là SQLite đọc toàn bộ
+# bảng. Các truy vấn nóng của route không được rơi vào trường hợp này.
+_FULL_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+
+
+def explain_query_plan(session, statement):
+    """
+    Chạy EXPLAIN QUERY PLAN cho một câu lệnh SQLAlchemy (select hoặc Query.statement).
+    Returns: list[str]: cột detail của từng bước trong kế hoạch.
+    """
+    compiled = statement.compile(dialect=session.get_bind().dialect, compile_kwargs={"literal_binds": True})
+    rows = session.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+    return [row[-1] for row in rows]
+
+
+def full_table_scans(plan_details):
+    """Returns: list[str]: tên các bảng bị quét toàn bộ trong kế hoạch."""
+    scans = []
+    for detail in plan_details:
+        match = _FULL_SCAN_RE.match(detail.strip())
+        if match:
+            scans.append(match.group(1))
+    return scans
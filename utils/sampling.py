@@ -0,0 +1,45 @@
+import random
+
+# --- Lấy mẫu ngẫu nhiên không cần tải toàn bộ danh sách id ---
+# Mỗi lần thử chọn một id ngẫu nhiên trong [id nhỏ nhất, id lớn nhất] của tập
+# đã lọc rồi lấy dòng đầu tiên có id >= giá trị đó. Mỗi bước chỉ là một lần tìm
+# trên chỉ mục (O(log n)), nên chi phí không tăng theo kích thước vault. Dòng
+# nằm ngay sau một khoảng id bị xóa có xác suất được chọn cao hơn một chút,
+# chấp nhận được cho gợi ý/ôn tập.
+
+
+def probe_query(query, id_column, pivot):
+    """Một lần dò: dòng đầu tiên của query có id >= pivot (tìm trên chỉ mục id)."""
+    return query.filter(id_column >= pivot).order_by(id_column.asc()).limit(1)
+
+
+def random_sample(query, id_column, num_rows, max_probes=None):
+    """
+    Lấy tối đa num_rows dòng ngẫu nhiên (không trùng) từ query.
+    Args:
+        query: Query đã lọc (ví dụ cùng danh mục, chưa xem).
+        id_column: cột khóa chính dạng số nguyên có chỉ mục.
+        max_probes: số lần thử tối đa, mặc định 3 * num_rows + 5.
+    Returns: list các đối tượng của query.
+    """
+    if num_rows <= 0:
+        return []
+    query = query.order_by(None)
+    lowest = query.with_entities(id_column).order_by(id_column.asc()).limit(1).scalar()
+    if lowest is None:
+        return []
+    highest = query.with_entities(id_column).order_by(id_column.desc()).limit(1).scalar()
+
+    chosen = {}
+    for _ in range(max_probes or 3 * num_rows + 5):
+        if len(chosen) >= num_rows:
+            break
+        pivot = random.randint(lowest, highest)
+        remaining = query.filter(id_column.notin_(list(chosen))) if chosen else query
+        row = probe_query(remaining, id_column, pivot).first()
+        if row is None:
+            row = remaining.filter(id_column < pivot).order_by(id_column.desc()).first()
+        if row is None:
+            break
+        chosen[getattr(row, id_column.key)] = row
+    return list(chosen.values())
@@ -0,0 +1,256 @@
+from markupsafe import escape, Markup
+from sqlalchemy import text, inspect, bindparam, Integer, Float
+
+from utils import compressed_text, tokenizer
+
+# --- Chỉ mục toàn văn (SQLite FTS5) cho bảng document ---
+# Bảng FTS dùng external content: nó chỉ giữ chỉ mục, còn văn bản (cho snippet()
+# và 'rebuild') được đọc qua view FTS_SOURCE_VIEW, view này giải nén tóm tắt và
+# nội dung trích xuất từ bảng document_text bằng hàm SQL DECOMPRESS_FUNCTION
+# (đăng ký cho mỗi kết nối SQLite, xem register_functions). Nhờ vậy văn bản chỉ
+# được lưu một lần, ở dạng nén. Với external content, FTS5 cần giá trị cũ để xóa
+# một dòng khỏi chỉ mục, nên ứng dụng gọi unindex_documents() trước khi ghi
+# thay đổi (lúc view còn trả về giá trị cũ) và index_documents() sau khi ghi.
+# Chỉ tài liệu có tên file, từ khóa hoặc văn bản thay đổi mới bị đánh chỉ mục
+# lại, nên việc cập nhật last_viewed_date mỗi lần xem không chạm tới bảng này.
+FTS_TABLE = "document_fts"
+FTS_SOURCE_VIEW = "document_fts_source"
+DECOMPRESS_FUNCTION = "decompress_text"
+# Bảng trigram phục vụ tìm gần đúng (gõ sai, thiếu dấu) trên tên file, từ khóa
+# và danh mục đã bỏ dấu. Nội dung được chuẩn hóa bằng Python nên bảng này được
+# đồng bộ từ ORM event chứ không dùng trigger.
+TRIGRAM_TABLE = "document_trigram"
+MANAGED_TABLES = (FTS_TABLE, TRIGRAM_TABLE)
+FTS_COLUMNS = ("filename_normalized", "keywords", "user_summary", "extracted_content")
+# Trọng số bm25 theo thứ tự FTS_COLUMNS: khớp ở tên file quan trọng hơn khớp trong nội dung.
+BM25_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+_HIGHLIGHT_OPEN = "\x02"
+_HIGHLIGHT_CLOSE = "\x03"
+
+_COLS = ", ".join(FTS_COLUMNS)
+_PARAMS = ", ".join(f":{c}" for c in FTS_COLUMNS)
+
+
+def _text_column(field):
+    return (f"{DECOMPRESS_FUNCTION}((SELECT t.data FROM document_text t "
+            f"WHERE t.document_id = d.id AND t.field = '{field}')) AS {field}")
+
+
+SCHEMA_STATEMENTS = [
+    f"CREATE VIEW IF NOT EXISTS {FTS_SOURCE_VIEW} AS SELECT d.id AS id, d.filename_normalized AS filename_normalized, "
+    f"d.keywords AS keywords, {_text_column('user_summary')}, {_text_column('extracted_content')} FROM document d",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"{_COLS}, content='{FTS_SOURCE_VIEW}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TRIGRAM_TABLE} USING fts5(terms, tokenize='trigram')",
+]
+
+
+def _decompress(data):
+    return compressed_text.decompress(data) if data is not None else None
+
+
+def register_functions(dbapi_connection):
+    """Gọi từ event "connect" của Engine cho mỗi kết nối sqlite3: view nguồn của bảng FTS cần hàm giải nén."""
+    dbapi_connection.create_function(DECOMPRESS_FUNCTION, 1, _decompress, deterministic=True)
+
+
+def is_supported(connection):
+    """FTS5 chỉ có trên SQLite (nhận Connection hoặc Engine)."""
+    return connection.dialect.name == "sqlite"
+
+
+def is_managed_table(name):
+    """Bảng ảo FTS và các bảng shadow của nó không thuộc metadata của SQLAlchemy."""
+    return any(name == table or name.startswith(table + "_") for table in MANAGED_TABLES)
+
+
+def is_installed(bind):
+    """Các bảng chỉ mục đã được tạo (bằng migration hoặc install()) hay chưa."""
+    if not is_supported(bind):
+        return False
+    inspector = inspect(bind)
+    return all(inspector.has_table(table) for table in MANAGED_TABLES)
+
+
+def install(connection):
+    """
+    Tạo các bảng chỉ mục nếu chưa có (dữ liệu được nạp bằng rebuild() / rebuild_trigrams()).
+    Args: connection (sqlalchemy.engine.Connection).
+    Returns: bool: False nếu backend không hỗ trợ FTS5.
+    """
+    if not is_supported(connection):
+        return False
+    for statement in SCHEMA_STATEMENTS:
+        connection.execute(text(statement))
+    return True
+
+
+_SOURCE_ROWS = f"FROM {FTS_SOURCE_VIEW} WHERE id IN :ids"
+
+
+def index_documents(connection, doc_ids):
+    """Thêm các tài liệu vào chỉ mục, đọc giá trị hiện tại qua view nguồn (gọi sau khi ghi)."""
+    if doc_ids:
+        statement = text(f"INSERT INTO {FTS_TABLE}(rowid, {_COLS}) SELECT id, {_COLS} {_SOURCE_ROWS}")
+        connection.execute(statement.bindparams(bindparam("ids", expanding=True)), {"ids": list(doc_ids)})
+
+
+def unindex_documents(connection, doc_ids):
+    """Xóa các tài liệu khỏi chỉ mục; phải gọi trước khi ghi thay đổi, khi view nguồn còn trả về giá trị đã đánh chỉ mục."""
+    if doc_ids:
+        statement = text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLS}) SELECT 'delete', id, {_COLS} {_SOURCE_ROWS}")
+        connection.execute(statement.bindparams(bindparam("ids", expanding=True)), {"ids": list(doc_ids)})
+
+
+def is_fulltext_index_empty(connection):
+    # SELECT trên bảng external content đọc từ view nguồn, nên kiểm tra bảng shadow của chỉ mục
+    return connection.execute(text(f"SELECT 1 FROM {FTS_TABLE}_docsize LIMIT 1")).first() is None
+
+
+def rebuild(connection):
+    """Dựng lại toàn bộ chỉ mục toàn văn từ view nguồn (dùng sau khi import hàng loạt hoặc khi chỉ mục lệch)."""
+    connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def build_match_expression(normalized_query):
+    """
+    Chuyển chuỗi tìm kiếm (đã bỏ dấu) thành biểu thức MATCH của FTS5.
+    Mỗi từ được đặt trong ngoặc kép để không bị hiểu là toán tử; từ cuối cùng
+    khớp theo tiền tố để hỗ trợ gõ dở. Tokenizer unicode61 bỏ được mọi dấu trừ
+    chữ "đ", nên từ bắt đầu bằng "d" được mở rộng thành (d... OR đ...).
+    Returns: str hoặc None nếu chuỗi không có từ nào.
+    """
+    tokens = tokenizer.words(normalized_query)
+    if not tokens:
+        return None
+    terms = []
+    for i, token in enumerate(tokens):
+        suffix = "*" if i == len(tokens) - 1 else ""
+        variants = [token]
+        if token.startswith("d"):
+            variants.append("đ" + token[1:])
+        quoted = [f'"{v}"{suffix}' for v in variants]
+        terms.append(quoted[0] if len(quoted) == 1 else "(" + " OR ".join(quoted) + ")")
+    return " AND ".join(terms)
+
+
+def ranked_matches(match_expression):
+    """
+    Subquery (doc_id, rank) các tài liệu khớp, rank càng nhỏ càng liên quan.
+    Dùng để join với Document trong ORM rồi order_by(rank).
+    """
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    stmt = text(
+        f"SELECT rowid AS doc_id, bm25({FTS_TABLE}, {weights}) AS rank "
+        f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+    ).bindparams(match=match_expression).columns(doc_id=Integer, rank=Float)
+    return stmt.subquery("fts_hits")
+
+
+def snippets_for(session, match_expression, doc_ids, max_tokens=16):
+    """
+    Lấy đoạn trích có đánh dấu từ khớp cho các tài liệu trên trang hiện tại.
+    Nội dung được escape trước khi chèn <mark>, nên an toàn để render trực tiếp.
+    Returns: dict {doc_id: Markup}.
+    """
+    if not doc_ids:
+        return {}
+    id_params = {f"id{i}": doc_id for i, doc_id in enumerate(doc_ids)}
+    id_list = ", ".join(f":{name}" for name in id_params)
+    rows = session.execute(
+        text(
+            f"SELECT rowid, snippet({FTS_TABLE}, -1, :open, :close, '…', {int(max_tokens)}) "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match AND rowid IN ({id_list})"
+        ),
+        {"match": match_expression, "open": _HIGHLIGHT_OPEN, "close": _HIGHLIGHT_CLOSE, **id_params},
+    ).all()
+    result = {}
+    for doc_id, raw_snippet in rows:
+        if not raw_snippet:
+            continue
+        safe = str(escape(raw_snippet))
+        safe = safe.replace(_HIGHLIGHT_OPEN, "<mark>").replace(_HIGHLIGHT_CLOSE, "</mark>")
+        result[doc_id] = Markup(safe)
+    return result
+
+
+# --- Tìm gần đúng bằng trigram ---
+def trigram_terms(*normalized_parts):
+    """
+    Ghép các trường đã bỏ dấu thành chuỗi từ cách nhau bởi dấu cách, có dấu cách
+    ở hai đầu để trigram đầu/cuối từ (" di", "en ") cũng được đánh chỉ mục.
+    """
+    words = []
+    for part in normalized_parts:
+        words.extend(tokenizer.words(part))
+    return f" {' '.join(words)} " if words else ""
+
+
+def query_trigrams(normalized_query):
+    """Danh sách trigram (không trùng, giữ thứ tự) của từng từ trong truy vấn."""
+    grams = []
+    for word in tokenizer.words(normalized_query):
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            gram = padded[i:i + 3]
+            if gram not in grams:
+                grams.append(gram)
+    return grams
+
+
+def set_trigram_terms(connection, doc_id, terms):
+    connection.execute(text(f"DELETE FROM {TRIGRAM_TABLE} WHERE rowid = :id"), {"id": doc_id})
+    if terms:
+        connection.execute(text(f"INSERT INTO {TRIGRAM_TABLE}(rowid, terms) VALUES (:id, :terms)"), {"id": doc_id, "terms": terms})
+
+
+def delete_trigram_terms(connection, doc_id):
+    connection.execute(text(f"DELETE FROM {TRIGRAM_TABLE} WHERE rowid = :id"), {"id": doc_id})
+
+
+def is_trigram_index_empty(connection):
+    return connection.execute(text(f"SELECT 1 FROM {TRIGRAM_TABLE} LIMIT 1")).first() is None
+
+
+def rebuild_trigrams(connection, entries):
+    """
+    Xóa và nạp lại toàn bộ bảng trigram.
+    Args: entries: iterable các cặp (doc_id, terms) đã tạo bằng trigram_terms().
+    """
+    connection.execute(text(f"DELETE FROM {TRIGRAM_TABLE}"))
+    batch = []
+    for doc_id, terms in entries:
+        if terms:
+            batch.append({"id": doc_id, "terms": terms})
+        if len(batch) >= 500:
+            connection.execute(text(f"INSERT INTO {TRIGRAM_TABLE}(rowid, terms) VALUES (:id, :terms)"), batch)
+            batch = []
+    if batch:
+        connection.execute(text(f"INSERT INTO {TRIGRAM_TABLE}(rowid, terms) VALUES (:id, :terms)"), batch)
+
+
+def fuzzy_candidates(bind, normalized_query, limit=20, min_similarity=0.5, pool_size=200):
+    """
+    Tìm tài liệu gần giống truy vấn (chịu được gõ sai, thiếu dấu).
+    Chỉ các tài liệu chứa ít nhất một trigram của truy vấn mới được đọc từ chỉ
+    mục (lấy tối đa pool_size theo bm25); sau đó chấm điểm lại bằng tỉ lệ
+    trigram của truy vấn xuất hiện trong tài liệu.
+    Args: bind: Session hoặc Connection. normalized_query (str): truy vấn đã bỏ dấu.
+    Returns: list: các cặp (doc_id, similarity) sắp xếp giảm dần theo similarity.
+    """
+    grams = query_trigrams(normalized_query)
+    if not grams:
+        return []
+    match_expression = " OR ".join(f'"{gram}"' for gram in grams)
+    rows = bind.execute(
+        text(f"SELECT rowid, terms FROM {TRIGRAM_TABLE} WHERE {TRIGRAM_TABLE} MATCH :match ORDER BY rank LIMIT :pool"),
+        {"match": match_expression, "pool": pool_size},
+    ).all()
+    scored = []
+    for doc_id, terms in rows:
+        similarity = sum(1 for gram in grams if gram in terms) / len(grams)
+        if similarity >= min_similarity:
+            scored.append((doc_id, similarity))
+    scored.sort(key=lambda pair: pair[1], reverse=True)
+    return scored[:limit]
@@ -0,0 +1,155 @@
+import os
+import re
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+from sqlalchemy import create_engine, inspect, text
+
+# --- Chia vault theo người dùng ra nhiều file SQLite (sharding) ---
+# Bảng user nằm ở database chính; các bảng thuộc vault (Document và các bảng
+# con) được định tuyến tới file shard của người dùng hiện tại. Shard hiện tại
+# được lưu trong ContextVar: before_request đặt cho mỗi request, CLI dùng
+# shard_context().
+SHARDED_TABLES = frozenset({
+    "document", "workspace_item", "workspace_item_relation", "learning_objective", "document_facet_count",
+    "document_content_chunk", "stored_blob", "document_simhash_band", "upload_batch_item",
+    "document_text", "document_term_set", "term_document_frequency",
+})
+STRATEGIES = ("off", "per_user", "hashed")
+_SHARD_KEY_RE = re.compile(r"^[a-z0-9_]+$")
+_current_shard = contextvars.ContextVar("vault_shard", default=None)
+
+
+def current_shard_key():
+    return _current_shard.get()
+
+
+def set_current_shard(key):
+    return _current_shard.set(key)
+
+
+def reset_current_shard(token):
+    _current_shard.reset(token)
+
+
+@contextmanager
+def shard_context(key):
+    token = set_current_shard(key)
+    try:
+        yield key
+    finally:
+        reset_current_shard(token)
+
+
+def is_migrated(engine):
+    """Shard đã chạy xong chuỗi migration (có dòng trong alembic_version) hay chưa."""
+    with engine.connect() as connection:
+        if not inspect(connection).has_table("alembic_version"):
+            return False
+        return connection.execute(text("SELECT version_num FROM alembic_version")).first() is not None
+
+
+def _remove_database_files(path):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+class ShardRouter:
+    def __init__(self, directory, strategy="off", buckets=16, engine_options=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"VAULT_SHARDING phải là một trong {STRATEGIES}, nhận được '{strategy}'.")
+        self.directory = directory
+        self.strategy = strategy
+        self.buckets = buckets
+        self.engine_options = engine_options or {}
+        self._engines = {}
+        self._initializing = {}
+        self._key_locks = {}
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self):
+        return self.strategy != "off"
+
+    def shard_key_for(self, user_id):
+        """per_user: mỗi người một file; hashed: gom người dùng vào `buckets` file theo băm id."""
+        if self.strategy == "per_user":
+            return f"user_{int(user_id)}"
+        bucket = int(hashlib.sha1(str(user_id).encode("utf-8")).hexdigest(), 16) % self.buckets
+        return f"bucket_{bucket:03d}"
+
+    def path_for(self, key):
+        if not _SHARD_KEY_RE.match(key or ""):
+            raise ValueError(f"Tên shard không hợp lệ: '{key}'.")
+        return os.path.join(self.directory, f"{key}.db")
+
+    def url_for(self, key):
+        return "sqlite:///" + self.path_for(key)
+
+    def shard_keys(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-3] for name in os.listdir(self.directory) if name.endswith(".db") and _SHARD_KEY_RE.match(name[:-3]))
+
+    def engine(self, key, on_create=None):
+        """
+        Engine của một shard (tạo và lưu lại ở lần đầu).
+        Args: on_create: hàm nhận key, gọi khi shard chưa được migrate (chưa có alembic_version) để tạo schema.
+        Mỗi shard có khóa riêng: migrate một shard mới không chặn request tới các shard khác. Nếu
+        on_create lỗi trên file vừa được tạo, file dở dang bị xóa để lần sau migrate lại từ đầu.
+        """
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is not None:
+                return engine
+            key_lock = self._key_locks.setdefault(key, threading.RLock())
+        with key_lock:
+            # on_create có thể gọi lại engine(key) (env.py của Alembic) trong cùng luồng
+            engine = self._engines.get(key) or self._initializing.get(key)
+            if engine is not None:
+                return engine
+            path = self.path_for(key)
+            existed = os.path.exists(path)
+            os.makedirs(self.directory, exist_ok=True)
+            engine = create_engine(self.url_for(key), **self.engine_options)
+            if on_create and not is_migrated(engine):
+                self._initializing[key] = engine
+                try:
+                    on_create(key)
+                except Exception:
+                    engine.dispose()
+                    if not existed:
+                        _remove_database_files(path)
+                    raise
+                finally:
+                    self._initializing.pop(key, None)
+            with self._lock:
+                self._engines[key] = engine
+            return engine
+
+    def routes_table(self, table_name):
+        return self.enabled and table_name in SHARDED_TABLES
+
+    def for_each_shard(self, callback):
+        """Gọi callback(key, engine) trên mọi shard đã có. Returns: dict {key: kết quả}."""
+        return {key: callback(key, self.engine(key)) for key in self.shard_keys()}
+
+    def query_all(self, sql, params=None):
+        """
+        Truy vấn chỉ đọc trên tất cả shard (dùng cho quản trị).
+        Returns: list: các cặp (key, row).
+        """
+        def run(key, engine):
+            with engine.connect() as connection:
+                return connection.execute(text(sql), params or {}).all()
+        return [(key, row) for key, rows in self.for_each_shard(run).items() for row in rows]
+
+    def dispose(self):
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
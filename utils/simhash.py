@@ -0,0 +1,71 @@
+import hashlib
+from collections import Counter, deque
+
+from utils import tokenizer
+
+# --- Phát hiện tài liệu gần trùng (SimHash + LSH theo dải bit) ---
+# Mỗi tài liệu có một dấu vân tay 64 bit tính từ các cụm 3 từ liên tiếp: hai
+# phiên bản chỉ khác vài trang/slide cho dấu vân tay lệch nhau vài bit. Dấu vân
+# tay được chia thành BANDS dải 16 bit; hai tài liệu lệch nhau tối đa
+# MAX_HAMMING_DISTANCE (< BANDS) bit chắc chắn trùng ít nhất một dải, nên chỉ
+# cần tra chỉ mục theo (dải, giá trị) thay vì so với toàn bộ vault.
+FINGERPRINT_BITS = 64
+BANDS = 4
+BAND_BITS = FINGERPRINT_BITS // BANDS
+MAX_HAMMING_DISTANCE = 3
+SHINGLE_SIZE = 3
+MIN_SHINGLES = 20           # văn bản quá ngắn cho dấu vân tay không đáng tin
+MAX_SHINGLES = 1_000_000    # giới hạn thời gian tính cho tài liệu rất lớn
+
+_MASK = (1 << FINGERPRINT_BITS) - 1
+
+
+def _shingle_hashes(tokens):
+    window = deque(maxlen=SHINGLE_SIZE)
+    produced = 0
+    for token in tokens:
+        window.append(token)
+        if len(window) == SHINGLE_SIZE:
+            digest = hashlib.blake2b(" ".join(window).encode("utf-8"), digest_size=8).digest()
+            yield int.from_bytes(digest, "big")
+            produced += 1
+            if produced >= MAX_SHINGLES:
+                return
+
+
+def fingerprint(chunks):
+    """
+    Tính SimHash từ các khối văn bản (đọc tuần tự, không cần ghép thành một chuỗi).
+    Returns: int 64 bit có dấu (lưu được vào cột INTEGER của SQLite), hoặc None nếu văn bản quá ngắn.
+    """
+    return fingerprint_tokens(token for chunk in chunks for token in tokenizer.words(chunk))
+
+
+def fingerprint_tokens(tokens):
+    """SimHash từ chuỗi âm tiết đã tách sẵn (ví dụ chuỗi token đã lưu của tài liệu)."""
+    weights = Counter(_shingle_hashes(tokens))
+    if sum(weights.values()) < MIN_SHINGLES:
+        return None
+    totals = [0] * FINGERPRINT_BITS
+    for value, weight in weights.items():
+        for bit in range(FINGERPRINT_BITS):
+            totals[bit] += weight if value >> bit & 1 else -weight
+    result = 0
+    for bit, total in enumerate(totals):
+        if total > 0:
+            result |= 1 << bit
+    return to_signed(result)
+
+
+def to_signed(value):
+    return value - (1 << FINGERPRINT_BITS) if value >= 1 << (FINGERPRINT_BITS - 1) else value
+
+
+def hamming_distance(a, b):
+    return bin((a ^ b) & _MASK).count("1")
+
+
+def bands(value):
+    """Returns: list[(chỉ số dải, giá trị dải)] để ghi/tra bảng chỉ mục LSH."""
+    unsigned = value & _MASK
+    return [(band, (unsigned >> (band * BAND_BITS)) & ((1 << BAND_BITS) - 1)) for band in range(BANDS)]
@@ -0,0 +1,187 @@
+import re
+import zlib
+from collections import Counter
+
+from utils.vietnamese_text import normalize_vietnamese
+
+# --- Tách từ dùng chung ---
+# Tiếng Việt viết mỗi âm tiết cách nhau bởi dấu cách, nên đơn vị tách là âm
+# tiết (chuỗi chữ/số liền nhau); từ ghép ("tích phân", "lập trình") được biểu
+# diễn bằng cụm hai âm tiết liền nhau trong cùng một đoạn, và dấu câu ngắt đoạn
+# để không ghép âm tiết của hai câu khác nhau. Không phải cặp âm tiết liền nhau
+# nào cũng là từ ghép ("lịch sử thế giới" chứa cả "sử thế"), nên một cặp chỉ
+# được tính là từ khi có trong COMPOUND_WORDS hoặc lặp lại đủ nhiều và gắn bó
+# với nhau (xem compound_pairs); cặp chồng lên từ ghép mạnh hơn bị bỏ.
+# Mỗi tài liệu được tách một lần khi trích xuất xong: chuỗi token (theo đoạn) và
+# số lần xuất hiện của từ/cụm được nén và lưu lại (document_term_set), để từ khóa,
+# câu hỏi ôn tập và các tính năng khác dùng lại thay vì tách từ văn bản gốc.
+STOP_WORDS = frozenset([
+    "là", "và", "của", "có", "trong", "để", "một", "không", "được", "cho", "với", "tại", "thì", "mà", "khi", "từ", "ra", "lên",
+    "xuống", "vào", "qua", "đến", "đi", "lại", "như", "ở", "đã", "sẽ", "đang", "rằng", "hay", "hơn", "rất", "này", "đó", "kia",
+    "ấy", "tôi", "bạn", "anh", "chị", "em", "ông", "bà", "nó", "chúng", "mình",
+    "the", "a", "an", "is", "are", "was", "were", "of", "in", "on", "at", "to", "for", "with", "by", "from", "as", "and", "or",
+    "but", "if", "then", "this", "that", "it", "its", "i", "you", "he", "she", "we", "they", "my", "your", "his", "her", "our", "their",
+])
+MAX_TERMS_PER_DOCUMENT = 4096  # chỉ giữ các từ/cụm phổ biến nhất của tài liệu rất lớn
+MIN_TERM_LENGTH = 2
+# Cặp không có trong từ điển phải xuất hiện ít nhất MIN_COMPOUND_COUNT lần và có
+# count(ab)^2 / (count(a) * count(b)) >= MIN_COMPOUND_ASSOCIATION, tức là phần lớn
+# số lần xuất hiện của cả hai âm tiết đều nằm trong cặp này.
+MIN_COMPOUND_COUNT = 2
+MIN_COMPOUND_ASSOCIATION = 0.3
+# Từ ghép hai âm tiết thường gặp trong tài liệu học tập (viết không dấu, so khớp sau khi bỏ dấu)
+COMPOUND_WORDS = frozenset(term.strip() for term in """
+    lap trinh, thuat toan, khoa hoc, may tinh, du lieu, co so, cau truc, tri tue, nhan tao, mang luoi,
+    bao mat, he thong, dieu hanh, phan mem, phan cung, ung dung, giao dien, ham so, bien so, tham so,
+    gia tri, ket qua, toan hoc, giai tich, dai so, hinh hoc, xac suat, thong ke, phuong trinh, tich phan,
+    dao ham, vi phan, ma tran, ly thuyet, dinh ly, dinh nghia, chung minh, cong thuc, bai tap, vi du,
+    vat ly, hoa hoc, sinh hoc, dien truong, tu truong, nang luong, dong luc, quang hoc, co hoc, van toc,
+    gia toc, khoi luong, trong luc, dien tich, phan tu, nguyen tu, hop chat, phan ung, huu co, vo co,
+    te bao, di truyen, tien hoa, sinh thai, kinh te, tai chinh, thi truong, hang hoa, doanh nghiep,
+    kinh doanh, dau tu, ngan hang, san xuat, tieu dung, loi nhuan, chi phi, doanh thu, tang truong,
+    lam phat, lich su, the gioi, dia ly, van hoc, van hoa, xa hoi, chinh tri, phap luat, triet hoc,
+    tam ly, giao duc, ngon ngu, ngu phap, tu vung, tieng anh, ngoai ngu, van minh, nhan loai, quoc gia,
+    dan toc, hoc sinh, sinh vien, giao vien, giang vien, hoc tap, nghien cuu, tai lieu, giao trinh,
+    bai giang, chuong trinh, noi dung, muc tieu, phuong phap, van de, nguyen nhan, anh huong,
+    quan trong, co ban, nang cao, tong quan, gioi thieu, ket luan, phan tich, danh gia, so sanh,
+    tong hop, khai niem, quan he, quan ly, qua trinh, dac diem, tinh chat, thanh phan, moi truong,
+    tu nhien, con nguoi, cuoc song, thoi gian, khong gian, tuyen tinh, tong quat, dinh thuc, sap xep,
+    vong lap
+""".split(","))
+
+_WORD_RE = re.compile(r"[^\W_]+")
+_SEGMENT_RE = re.compile(r"[^\W_]+|[.,;:!?()\[\]\n]")
+
+
+def words(text):
+    """Âm tiết (chữ thường, giữ dấu) theo thứ tự. Returns: list[str]."""
+    return _WORD_RE.findall(text.lower()) if text else []
+
+
+def normalized_words(text):
+    """Âm tiết đã bỏ dấu, dùng để so khớp. Returns: list[str]."""
+    return _WORD_RE.findall(normalize_vietnamese(text)) if text else []
+
+
+def phrases(text):
+    """Các đoạn âm tiết liền nhau, ngắt tại dấu câu. Returns: list[list[str]]."""
+    result, current = [], []
+    for token in _SEGMENT_RE.findall(text.lower()) if text else []:
+        if len(token) == 1 and not token.isalnum():
+            if current:
+                result.append(current)
+                current = []
+        else:
+            current.append(token)
+    if current:
+        result.append(current)
+    return result
+
+
+class ChunkPhrases:
+    """
+    Các đoạn của một văn bản được đọc theo khối (ví dụ ExtractionResult.iter_chunks):
+    mỗi lần duyệt gọi lại chunks(), nên term_counts/encode_phrases duyệt được nhiều
+    lần mà không cần giữ cả văn bản hay toàn bộ danh sách đoạn trong bộ nhớ.
+    """
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from phrases(chunk)
+
+
+def _is_term(word, stop_words):
+    return len(word) >= MIN_TERM_LENGTH and word not in stop_words and word.isalpha()
+
+
+def compound_pairs(text_phrases, stop_words=STOP_WORDS):
+    """Các cặp âm tiết liền nhau được coi là từ ghép: có trong COMPOUND_WORDS, hoặc
+    lặp lại ít nhất MIN_COMPOUND_COUNT lần và đạt MIN_COMPOUND_ASSOCIATION so với
+    từng âm tiết. Returns: dict[tuple, float] (độ ưu tiên khi hai cặp chồng lên nhau)."""
+    words_count, pairs_count = Counter(), Counter()
+    for phrase in text_phrases:
+        previous = None
+        for word in phrase:
+            if not _is_term(word, stop_words):
+                previous = None
+                continue
+            words_count[word] += 1
+            if previous:
+                pairs_count[(previous, word)] += 1
+            previous = word
+    accepted = {}
+    for (first, second), count in pairs_count.items():
+        if normalize_vietnamese(f"{first} {second}") in COMPOUND_WORDS:
+            accepted[(first, second)] = 2.0  # từ điển luôn thắng cặp thống kê
+        elif count >= MIN_COMPOUND_COUNT:
+            association = count * count / (words_count[first] * words_count[second])
+            if association >= MIN_COMPOUND_ASSOCIATION:
+                accepted[(first, second)] = association
+    return accepted
+
+
+def term_counts(text_phrases, stop_words=STOP_WORDS):
+    """Số lần xuất hiện của âm tiết và từ ghép hai âm tiết (xem compound_pairs) không chứa số hay từ dừng.
+
+    Trong mỗi đoạn, cặp có độ ưu tiên cao hơn được chọn trước và các cặp chồng lên
+    nó bị bỏ, nên "lịch sử thế giới" cho "lịch sử" và "thế giới" chứ không có "sử thế".
+    text_phrases được duyệt hai lần (list hoặc ChunkPhrases). Returns: Counter."""
+    accepted = compound_pairs(text_phrases, stop_words)
+    counts = Counter()
+    for phrase in text_phrases:
+        terms = [word if _is_term(word, stop_words) else None for word in phrase]
+        counts.update(word for word in terms if word)
+        candidates = sorted(
+            (i for i in range(len(terms) - 1) if terms[i] and terms[i + 1] and (terms[i], terms[i + 1]) in accepted),
+            key=lambda i: (-accepted[(terms[i], terms[i + 1])], i),
+        )
+        taken = set()
+        for i in candidates:
+            if i not in taken and i + 1 not in taken:
+                taken.update((i, i + 1))
+                counts[f"{terms[i]} {terms[i + 1]}"] += 1
+    for (first, second), priority in accepted.items():
+        # Cặp thống kê mất bớt lần xuất hiện vì chồng lên từ ghép khác thì phải còn đủ số lần
+        pair = f"{first} {second}"
+        if priority < 2.0 and 0 < counts[pair] < MIN_COMPOUND_COUNT:
+            del counts[pair]
+    if len(counts) > MAX_TERMS_PER_DOCUMENT:
+        counts = Counter(dict(counts.most_common(MAX_TERMS_PER_DOCUMENT)))
+    return counts
+
+
+def ngrams(tokens, max_length=3):
+    """Mọi cụm 1..max_length token liền nhau, để kiểm tra một cụm từ có trong văn bản bằng phép tra tập hợp. Returns: set[tuple]."""
+    return {tuple(tokens[i:i + n]) for n in range(1, max_length + 1) for i in range(len(tokens) - n + 1)}
+
+
+# --- Lưu trữ dạng nén ---
+def encode_phrases(text_phrases):
+    # Nén tăng dần từng đoạn, không ghép cả chuỗi token
+    compressor = zlib.compressobj(6)
+    parts, separator = [], ""
+    for phrase in text_phrases:
+        parts.append(compressor.compress((separator + " ".join(phrase)).encode("utf-8")))
+        separator = "\n"
+    parts.append(compressor.flush())
+    return b"".join(parts)
+
+
+def decode_phrases(data):
+    return [line.split(" ") for line in zlib.decompress(data).decode("utf-8").split("\n") if line] if data else []
+
+
+def encode_term_counts(counts):
+    return zlib.compress("\n".join(f"{term}\t{count}" for term, count in counts.items()).encode("utf-8"), 6)
+
+
+def decode_term_counts(data):
+    counts = Counter()
+    if data:
+        for line in zlib.decompress(data).decode("utf-8").split("\n"):
+            if line:
+                term, count = line.rsplit("\t", 1)
+                counts[term] = int(count)
+    return counts
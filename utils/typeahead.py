@@ -0,0 +1,92 @@
+import time
+import threading
+from bisect import bisect_left, insort
+
+from utils import tokenizer
+
+# --- Chỉ mục tiền tố trong bộ nhớ cho gợi ý tìm kiếm (typeahead) ---
+# Mỗi gợi ý (loại, chuỗi hiển thị) được đăng ký dưới nhiều khóa: khóa là phần
+# văn bản đã bỏ dấu bắt đầu từ mỗi từ, nên gõ "truong" cũng gợi ý được
+# "Điện trường cơ bản.pdf". Các khóa nằm trong một list đã sắp xếp, tra cứu
+# tiền tố bằng bisect mà không cần truy vấn database.
+MAX_KEY_LENGTH = 60
+
+
+class PrefixIndex:
+    def __init__(self, normalize, max_age_seconds=300):
+        self.normalize = normalize
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._keys = []      # [(khóa, loại, hiển thị)] đã sắp xếp
+        self._counts = {}    # {(loại, hiển thị): số tài liệu đang dùng}
+        self._built_at = None
+
+    @property
+    def is_built(self):
+        return self._built_at is not None
+
+    def is_stale(self):
+        return self._built_at is None or time.monotonic() - self._built_at > self.max_age_seconds
+
+    def _keys_for(self, kind, display):
+        words = tokenizer.words(self.normalize(display))
+        return {(" ".join(words[i:])[:MAX_KEY_LENGTH], kind, display) for i in range(len(words))}
+
+    def build(self, entries):
+        """
+        Dựng lại toàn bộ chỉ mục.
+        Args: entries: iterable các cặp (loại, chuỗi hiển thị), mỗi tài liệu đóng góp một lần.
+        """
+        counts = {}
+        for entry in entries:
+            counts[entry] = counts.get(entry, 0) + 1
+        keys = sorted(key for kind, display in counts for key in self._keys_for(kind, display))
+        with self._lock:
+            self._counts = counts
+            self._keys = keys
+            self._built_at = time.monotonic()
+
+    def add(self, entries):
+        with self._lock:
+            for entry in entries:
+                if entry in self._counts:
+                    self._counts[entry] += 1
+                    continue
+                self._counts[entry] = 1
+                for key in self._keys_for(*entry):
+                    insort(self._keys, key)
+
+    def remove(self, entries):
+        with self._lock:
+            for entry in entries:
+                count = self._counts.get(entry, 0)
+                if count > 1:
+                    self._counts[entry] = count - 1
+                    continue
+                self._counts.pop(entry, None)
+                for key in self._keys_for(*entry):
+                    position = bisect_left(self._keys, key)
+                    if position < len(self._keys) and self._keys[position] == key:
+                        del self._keys[position]
+
+    def complete(self, prefix, limit=8, max_scan=500):
+        """
+        Gợi ý cho một tiền tố, ưu tiên mục có nhiều tài liệu hơn.
+        Chỉ duyệt tối đa max_scan khóa liền kề nên thời gian không phụ thuộc kích thước vault.
+        Returns: list: các dict {"text", "type", "count"}.
+        """
+        normalized = " ".join(tokenizer.words(self.normalize(prefix or "")))
+        if not normalized:
+            return []
+        found = {}
+        with self._lock:
+            position = bisect_left(self._keys, (normalized,))
+            end = min(len(self._keys), position + max_scan)
+            while position < end:
+                key, kind, display = self._keys[position]
+                if not key.startswith(normalized):
+                    break
+                found[(kind, display)] = self._counts.get((kind, display), 0)
+                position += 1
+        ranked = sorted(found.items(), key=lambda item: (-item[1], len(item[0][1]), item[0][1]))
+        return [{"text": display, "type": kind, "count": count} for (kind, display), count in ranked[:limit]]
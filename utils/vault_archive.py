@@ -0,0 +1,138 @@
+import io
+import json
+import zlib
+import tarfile
+from datetime import datetime, date
+
+# --- Sao lưu / khôi phục vault dạng .tar.gz ---
+# Archive được sinh dần từng khối bytes: header tar tự dựng cho mỗi thành phần,
+# nội dung file đọc theo khối từ kho, rồi nén gzip theo dòng. Vì vậy có thể gửi
+# thẳng qua HTTP hoặc ghi ra đĩa mà không giữ cả archive trong bộ nhớ.
+# Cấu trúc archive:
+#   manifest.json                 định dạng, phiên bản, danh sách bảng
+#   files/<sha256>                file trong kho theo nội dung
+#   files/legacy/<document_id>    file upload cũ chưa chuyển vào kho
+#   data/<bảng>/<số thứ tự>.ndjson  mỗi dòng một bản ghi JSON
+FORMAT_NAME = "studyvault-export"
+FORMAT_VERSION = 1
+READ_CHUNK_BYTES = 1024 * 1024
+NDJSON_PART_BYTES = 4 * 1024 * 1024  # mỗi phần dữ liệu được gom trong bộ nhớ tới cỡ này rồi mới ghi
+BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _tar_header(name, size, mtime=None):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(mtime if mtime is not None else datetime.now().timestamp())
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8")
+
+
+def _padding(size):
+    remainder = size % BLOCK_SIZE
+    return b"\0" * (BLOCK_SIZE - remainder) if remainder else b""
+
+
+def tar_bytes_member(name, data):
+    yield _tar_header(name, len(data))
+    yield data
+    yield _padding(len(data))
+
+
+def tar_file_member(name, path, size, mtime=None):
+    """Một file trên đĩa, đọc theo khối. size lấy trước khi đọc để header và nội dung khớp nhau."""
+    yield _tar_header(name, size, mtime)
+    remaining = size
+    with open(path, "rb") as f:
+        while remaining > 0:
+            block = f.read(min(READ_CHUNK_BYTES, remaining))
+            if not block:
+                raise ArchiveError(f"File '{path}' bị thay đổi trong lúc xuất.")
+            remaining -= len(block)
+            yield block
+    yield _padding(size)
+
+
+def tar_end():
+    yield b"\0" * (BLOCK_SIZE * 2)
+
+
+def gzip_stream(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: định dạng gzip
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def manifest_member(tables):
+    manifest = {"format": FORMAT_NAME, "version": FORMAT_VERSION, "created": datetime.now().isoformat(), "tables": list(tables)}
+    return tar_bytes_member("manifest.json", json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+
+
+def ndjson_members(table_name, rows):
+    """Các phần data/<bảng>/<n>.ndjson từ iterable dict, mỗi phần tối đa khoảng NDJSON_PART_BYTES."""
+    buffer = io.BytesIO()
+    part = 0
+    for row in rows:
+        buffer.write(json.dumps(row, ensure_ascii=False, default=_json_default).encode("utf-8") + b"\n")
+        if buffer.tell() >= NDJSON_PART_BYTES:
+            yield from tar_bytes_member(f"data/{table_name}/{part:05d}.ndjson", buffer.getvalue())
+            buffer = io.BytesIO()
+            part += 1
+    if buffer.tell():
+        yield from tar_bytes_member(f"data/{table_name}/{part:05d}.ndjson", buffer.getvalue())
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Không tuần tự hóa được kiểu {type(value).__name__}.")
+
+
+def dict_to_row(data, table):
+    """Chuyển một dòng NDJSON về giá trị cột (ngày giờ từ chuỗi ISO); bỏ qua cột không còn trong bảng."""
+    values = {}
+    for column in table.columns:
+        if column.name not in data:
+            continue
+        value = data[column.name]
+        if value is not None:
+            python_type = _python_type(column)
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is date:
+                value = date.fromisoformat(value)
+        values[column.name] = value
+    return values
+
+
+def _python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+
+def open_archive(fileobj):
+    """Mở archive để đọc tuần tự (gzip hoặc tar thường), kiểm tra manifest. Returns: tuple (tarfile, manifest)."""
+    archive = tarfile.open(fileobj=fileobj, mode="r|*")
+    member = archive.next()
+    if member is None or member.name != "manifest.json":
+        raise ArchiveError("Archive không có manifest.json ở đầu.")
+    manifest = json.loads(archive.extractfile(member).read().decode("utf-8"))
+    if manifest.get("format") != FORMAT_NAME or manifest.get("version", 0) > FORMAT_VERSION:
+        raise ArchiveError(f"Định dạng archive không được hỗ trợ: {manifest.get('format')} v{manifest.get('version')}.")
+    return archive, manifest
+
+
+def iter_ndjson(fileobj):
+    # Không bọc bằng TextIOWrapper: thành phần của tar đọc tuần tự không hỗ trợ seekable()
+    for line in fileobj:
+        if line.strip():
+            yield json.loads(line.decode("utf-8"))
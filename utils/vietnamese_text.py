@@ -0,0 +1,58 @@
+import unicodedata
+from functools import lru_cache
+
+# --- Bỏ dấu tiếng Việt ---
+# Bảng translate được dựng một lần khi import: mọi chữ Latin có dấu (dạng dựng
+# sẵn NFC, cả chữ hoa lẫn chữ thường) được ánh xạ về chữ gốc, đ/Đ về d, còn các
+# dấu kết hợp rời (U+0300-U+036F, gặp trong văn bản dạng NFD như tên file từ
+# macOS) bị xóa. Nhờ vậy một lần str.translate xử lý được cả hai dạng Unicode
+# mà không cần gọi unicodedata.normalize cho từng chuỗi.
+CACHED_MAX_LENGTH = 64  # chuỗi ngắn (truy vấn, tên danh mục, từ khóa) lặp lại nhiều nên được nhớ lại
+_SEPARATOR = "\x00"
+
+
+def _build_table():
+    table = {}
+    for start, end in ((0x00C0, 0x0250), (0x1E00, 0x1F00)):
+        for codepoint in range(start, end):
+            char = chr(codepoint)
+            base = "".join(c for c in unicodedata.normalize("NFD", char) if not unicodedata.combining(c))
+            if base and base != char and base.isascii():
+                table[codepoint] = base.lower()
+    table[ord("đ")] = table[ord("Đ")] = "d"
+    for codepoint in range(0x0300, 0x0370):
+        table[codepoint] = None
+    return table
+
+
+TRANSLATION_TABLE = _build_table()
+
+
+def _normalize(text):
+    return text.lower().translate(TRANSLATION_TABLE)
+
+
+_normalize_cached = lru_cache(maxsize=8192)(_normalize)
+
+
+def normalize_vietnamese(text):
+    """Chữ thường, bỏ dấu. Returns: str ("" nếu text rỗng hoặc None)."""
+    if not text:
+        return ""
+    if len(text) <= CACHED_MAX_LENGTH:
+        return _normalize_cached(text)
+    return _normalize(text)
+
+
+def normalize_many(values):
+    """
+    Bỏ dấu cả một cột (backfill): ghép các giá trị lại để chỉ gọi lower/translate một lần.
+    Args: values (iterable): chuỗi hoặc None. Returns: list cùng độ dài, None/rỗng thành "".
+    """
+    values = [value or "" for value in values]
+    if not values:
+        return []
+    joined = _SEPARATOR.join(values)
+    if joined.count(_SEPARATOR) != len(values) - 1:
+        return [_normalize(value) for value in values]
+    return _normalize(joined).split(_SEPARATOR)